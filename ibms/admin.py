@@ -17,12 +17,16 @@ from .models import (
     GeneralServicePriority,
     GLPivDownload,
     IBMData,
+    ImportBatch,
+    ImportJob,
     NCServicePriority,
     NCStrategicPlan,
     PVSServicePriority,
+    ReportJob,
     ServicePriorityMapping,
     SFMServicePriority,
 )
+from .tasks import resume_import_jobs
 
 LOGGER = logging.getLogger("ibms")
 
@@ -69,6 +73,27 @@ def export_as_csv_action(
     return export_as_csv
 
 
+class DataVersionAdminMixin:
+    """ModelAdmin mixin for models of financial year data, which bumps the data version of the financial year after
+    objects are changed or deleted (see FinancialYear.bump_data_version).
+    """
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        obj.fy.bump_data_version()
+
+    def delete_model(self, request, obj):
+        fy = obj.fy
+        super().delete_model(request, obj)
+        fy.bump_data_version()
+
+    def delete_queryset(self, request, queryset):
+        fys = list(FinancialYear.objects.filter(pk__in=queryset.values("fy")))
+        super().delete_queryset(request, queryset)
+        for fy in fys:
+            fy.bump_data_version()
+
+
 @register(FinancialYear)
 class FinancialYearAdmin(ModelAdmin):
     search_fields = ["financialYear"]
@@ -78,7 +103,7 @@ class FinancialYearAdmin(ModelAdmin):
 
 
 @register(IBMData)
-class IBMDataAdmin(VersionAdmin):
+class IBMDataAdmin(DataVersionAdminMixin, VersionAdmin):
     date_hierarchy = "modified"
     search_fields = ("fy__financialYear", "ibmIdentifier", "budgetArea", "modifier__username")
     list_display = ("ibmIdentifier", "fy", "costCentre", "budgetArea", "service_priority_link", "modified", "modifier")
@@ -227,7 +252,7 @@ class DepartmentProgramAdminForm(forms.ModelForm):
 
 
 @register(DepartmentProgram)
-class DepartmentProgramAdmin(ModelAdmin):
+class DepartmentProgramAdmin(DataVersionAdminMixin, ModelAdmin):
     form = DepartmentProgramAdminForm
     list_display = ["ibmIdentifier", "fy", "dept_program1"]
     list_filter = [
@@ -245,7 +270,7 @@ class DepartmentProgramAdmin(ModelAdmin):
 
 
 @register(GLPivDownload)
-class GLPivDownloadAdmin(ModelAdmin):
+class GLPivDownloadAdmin(DataVersionAdminMixin, ModelAdmin):
     date_hierarchy = "download_period"
     search_fields = (
         "fy__financialYear",
@@ -417,7 +442,7 @@ class GLPivDownloadAdmin(ModelAdmin):
 
 
 @register(CorporateStrategy)
-class CorporateStrategyAdmin(ModelAdmin):
+class CorporateStrategyAdmin(DataVersionAdminMixin, ModelAdmin):
     fields = ["fy", "corporateStrategyNo", "description1", "description2"]
     readonly_fields = ["fy", "corporateStrategyNo"]
     list_display = ["corporateStrategyNo", "fy", "description1"]
@@ -432,7 +457,7 @@ class CorporateStrategyAdmin(ModelAdmin):
 
 
 @register(NCStrategicPlan)
-class NCStrategicPlanAdmin(ModelAdmin):
+class NCStrategicPlanAdmin(DataVersionAdminMixin, ModelAdmin):
     fields = [
         "fy",
         "strategicPlanNo",
@@ -476,7 +501,7 @@ class NCStrategicPlanAdmin(ModelAdmin):
     ]
 
 
-class ServicePriorityAdmin(ModelAdmin):
+class ServicePriorityAdmin(DataVersionAdminMixin, ModelAdmin):
     readonly_fields = ["fy"]
     list_display = [
         "servicePriorityNo",
@@ -689,3 +714,80 @@ class ServicePriorityMappingAdmin(ModelAdmin):
             fields=["fy", "costCentreNo", "wildlifeManagement", "parksManagement", "forestManagement"],
         )
     ]
+
+
+@register(ImportJob)
+class ImportJobAdmin(ModelAdmin):
+    date_hierarchy = "created"
+    list_display = ("created", "blob_name", "file_type", "fy", "user", "status", "rows_processed", "rows_committed")
+    list_filter = ("status", "file_type", "fy__financialYear")
+    search_fields = ("blob_name", "user__username")
+    readonly_fields = (
+        "user",
+        "fy",
+        "blob_name",
+        "file_type",
+        "import_mode",
+        "delete_missing",
+        "batch",
+        "content_hash",
+        "status",
+        "rows_processed",
+        "rows_committed",
+        "rows_per_second",
+        "model_type",
+        "error",
+        "metrics",
+        "created",
+        "started",
+        "modified",
+        "completed",
+    )
+    actions = ["resume_imports"]
+
+    def has_add_permission(self, request):
+        return False
+
+    def resume_imports(self, request, queryset):
+        count = resume_import_jobs(queryset)
+        self.message_user(request, f"Resumed {count} import(s)")
+
+    resume_imports.short_description = "Resume selected (incomplete) imports"
+
+
+@register(ImportBatch)
+class ImportBatchAdmin(ModelAdmin):
+    date_hierarchy = "created"
+    list_display = ("created", "fy", "user", "status", "completed")
+    list_filter = ("status", "fy__financialYear")
+    search_fields = ("user__username",)
+    readonly_fields = ("user", "fy", "status", "error", "link_counts", "created", "completed")
+
+    def has_add_permission(self, request):
+        return False
+
+
+@register(ReportJob)
+class ReportJobAdmin(ModelAdmin):
+    date_hierarchy = "created"
+    list_display = ("created", "report", "fy", "user", "status", "items_done", "items_total", "completed")
+    list_filter = ("status", "report", "fy__financialYear")
+    search_fields = ("user__username", "file_name")
+    readonly_fields = (
+        "user",
+        "fy",
+        "report",
+        "parameters",
+        "status",
+        "items_total",
+        "items_done",
+        "blob_name",
+        "file_name",
+        "error",
+        "created",
+        "started",
+        "completed",
+    )
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,120 @@
+import hashlib
+import logging
+import re
+import tempfile
+import zlib
+from typing import IO, Iterable, Iterator, Optional, Tuple
+
+from azure.core import MatchConditions
+from azure.core.exceptions import AzureError, ResourceNotFoundError
+from azure.storage.blob import BlobClient, BlobProperties, ContentSettings
+from django.utils.text import slugify
+
+from ibms.models import FinancialYear
+
+LOGGER = logging.getLogger("ibms")
+# A single byte range of a Range request header, e.g. "bytes=0-499", "bytes=500-" or "bytes=-500".
+BYTE_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def download_artifact_name(variant: str, fy: FinancialYear, filters: dict) -> str:
+    """Return the blob name of the cached artifact of a download report variant, for a financial year and the
+    GLPivDownload field filters of the download (e.g. {"costCentre": "123"}, or {} for the whole financial year).
+    Field values are hashed, so that any value can be used in the blob name.
+    """
+    if filters:
+        parts = []
+        for field, value in sorted(filters.items()):
+            digest = hashlib.sha256(str(value).encode()).hexdigest()[:12]
+            parts.append(f"{field}-{slugify(value)}-{digest}")
+        filter_name = "_".join(parts)
+    else:
+        filter_name = "all"
+    return f"downloads/{variant}/{slugify(fy.financialYear)}/{filter_name}.csv.gz"
+
+
+def download_artifact_properties(blob_client: BlobClient, data_version: int) -> Optional[BlobProperties]:
+    """Return the properties of a cached download artifact, if it exists and was generated from the passed-in data
+    version of its financial year. Otherwise returns None, and the artifact should be generated again.
+    """
+    try:
+        properties = blob_client.get_blob_properties()
+    except ResourceNotFoundError:
+        return None
+    except AzureError as e:
+        LOGGER.warning(f"Unable to read the download artifact {blob_client.blob_name}: {e}")
+        return None
+    if properties.metadata.get("data_version") != str(data_version):
+        return None
+    return properties
+
+
+def store_download_artifact(f: IO[bytes], blob_client: BlobClient, data_version: int) -> None:
+    """Upload a file of a gzip-compressed download report as the download artifact of the passed-in data version of
+    its financial year, replacing any earlier version.
+    """
+    blob_client.upload_blob(
+        f,
+        overwrite=True,
+        metadata={"data_version": str(data_version)},
+        content_settings=ContentSettings(content_type="application/gzip"),
+    )
+
+
+def cache_download_artifact(chunks: Iterable[bytes], blob_client: BlobClient, data_version: int) -> Iterator[bytes]:
+    """Generator which yields the gzip-compressed chunks of a download report (see gzip_report) while writing them to
+    a temporary file, which is uploaded as the cached download artifact (replacing any earlier version) once every
+    chunk has been yielded. Nothing is stored if the download is interrupted, i.e. the generator is closed early.
+    """
+    with tempfile.TemporaryFile() as f:
+        for chunk in chunks:
+            f.write(chunk)
+            yield chunk
+        f.seek(0)
+        try:
+            store_download_artifact(f, blob_client, data_version)
+        except AzureError as e:
+            LOGGER.warning(f"Unable to store the download artifact {blob_client.blob_name}: {e}")
+
+
+def download_artifact_chunks(blob_client: BlobClient, properties: BlobProperties, offset: int = 0, length: Optional[int] = None):
+    """Return an iterator of the chunks of a cached download artifact (optionally, a byte range of it). The download
+    fails if the artifact is replaced while it is read, rather than returning content from both versions.
+    """
+    downloader = blob_client.download_blob(
+        offset=offset, length=length, etag=properties.etag, match_condition=MatchConditions.IfNotModified
+    )
+    return downloader.chunks()
+
+
+def gunzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Generator which decompresses a gzip stream of chunks, e.g. a cached download artifact for a client that does
+    not accept gzip-encoded content.
+    """
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    yield decompressor.flush()
+
+
+def parse_byte_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a Range request header for a single byte range of content with the passed-in size, returning the
+    (first, last) byte positions of the range (inclusive). Returns None if the header should be ignored (i.e. it is
+    malformed or requests several ranges), and raises ValueError if the range cannot be satisfied.
+    """
+    match = BYTE_RANGE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first:
+        if last and int(last) < int(first):
+            return None
+        first, last = int(first), int(last) if last else size - 1
+    else:
+        # A suffix range, of the final `last` bytes.
+        first, last = max(size - int(last), 0), size - 1
+    if first >= size:
+        raise ValueError("Unsatisfiable byte range")
+    return first, min(last, size - 1)
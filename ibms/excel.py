@@ -0,0 +1,82 @@
+import logging
+import os
+import pickle
+from io import BytesIO
+from typing import Callable, Dict
+
+from django.conf import settings
+from openpyxl import load_workbook
+from xlrd import open_workbook
+from xlutils.copy import copy as copy_xl
+
+LOGGER = logging.getLogger("ibms")
+
+# Parsed Excel report templates, keyed by file name (see get_excel_template).
+_EXCEL_TEMPLATES = {}
+
+
+def excel_template_dir() -> str:
+    """Return the directory of the Excel report templates."""
+    return os.path.join(settings.STATIC_ROOT, "excel")
+
+
+class ExcelTemplate:
+    """An Excel report template, read once per process. Each call to workbook() returns a new writable copy of the
+    template. For .xls files, the xlwt Workbook is unpickled from a snapshot taken when the template was parsed
+    rather than parsing the file again, and the read-only (xlrd) workbook is retained so that metadata can be derived
+    from the template cells (see metadata()). openpyxl workbooks do not retain their named cell styles when pickled
+    or copied, so .xlsx files are parsed from the cached file content instead.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+        self.readonly = None
+        with open(path, "rb") as f:
+            self._content = f.read()
+        self._snapshot = None
+        if path.endswith(".xls"):
+            self.readonly = open_workbook(file_contents=self._content, formatting_info=True)
+            self._snapshot = pickle.dumps(copy_xl(self.readonly), protocol=pickle.HIGHEST_PROTOCOL)
+        self._metadata = {}
+
+    def workbook(self):
+        """Return a new writable copy of the template workbook (an xlwt Workbook for .xls files, or an openpyxl
+        Workbook for .xlsx files).
+        """
+        if self._snapshot:
+            return pickle.loads(self._snapshot)
+        return load_workbook(BytesIO(self._content))
+
+    def metadata(self, key: str, derive: Callable):
+        """Return metadata derived from the template, e.g. a map of column headings. The `derive` callable is passed
+        the read-only workbook the first time that `key` is requested, and the result is cached with the template.
+        """
+        if key not in self._metadata:
+            self._metadata[key] = derive(self.readonly)
+        return self._metadata[key]
+
+
+def get_excel_template(name: str) -> ExcelTemplate:
+    """Return the named Excel report template, which is parsed the first time it is requested by a process (or if
+    the file has been modified since).
+    """
+    path = os.path.join(excel_template_dir(), name)
+    template = _EXCEL_TEMPLATES.get(name)
+    if not template or template.mtime != os.path.getmtime(path):
+        template = _EXCEL_TEMPLATES[name] = ExcelTemplate(path)
+    return template
+
+
+def load_excel_templates() -> Dict[str, ExcelTemplate]:
+    """Parse every Excel report template in the template directory, e.g. before the application server forks its
+    worker processes (so that each worker shares the parsed templates). Returns a dict of the templates parsed.
+    """
+    path = excel_template_dir()
+    if not os.path.isdir(path):
+        LOGGER.warning(f"Excel template directory {path} does not exist")
+        return {}
+    for name in sorted(os.listdir(path)):
+        if name.endswith((".xls", ".xlsx")):
+            get_excel_template(name)
+    return dict(_EXCEL_TEMPLATES)
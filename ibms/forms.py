@@ -1,3 +1,7 @@
+import os
+import zipfile
+from typing import Callable, NamedTuple
+
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import HTML, Div, Layout, Submit
 from django import forms
@@ -14,6 +18,7 @@ from ibms.models import (
     PVSServicePriority,
     SFMServicePriority,
 )
+from ibms.tasks import UPLOAD_FILE_TYPE_MODELS
 
 
 def get_generic_choices(model, key, allow_null=False):
@@ -51,7 +56,9 @@ class ClearGLPivotForm(FinancialYearFilterForm):
         self.helper.layout = Layout(
             HTML("""<div class="row">
                 <div class="col-md-10 col-lg-9 alert alert-warning">
-                Please confirm that you want to clear all GL Pivot entries for the selected financial year.</div></div>"""),
+                Please confirm that you want to clear all GL Pivot entries for the selected financial year.
+                To replace the entries with a new GL Pivot Download file, upload it using the
+                "Replace all records" import mode instead.</div></div>"""),
             Div(
                 "financial_year",
                 Submit("confirm", "Confirm", css_class="btn-danger"),
@@ -88,6 +95,25 @@ class UploadForm(FinancialYearFilterForm):
         )
     )
     upload_file = forms.FileField(label="CSV file")
+    import_mode = forms.ChoiceField(
+        choices=(
+            ("append", "Create/update records"),
+            ("reload", "Replace all records for the financial year (GL Pivot Download only)"),
+            ("delta", "Update new and changed records only (GL Pivot Download only)"),
+        ),
+        initial="append",
+        required=False,
+    )
+    delete_missing = forms.BooleanField(
+        required=False,
+        label="Delete missing records",
+        help_text="Delete existing records for the financial year which are not present in the uploaded file (update mode only)",
+    )
+    force_reprocess = forms.BooleanField(
+        required=False,
+        label="Force reprocess",
+        help_text="Import the file even if identical content has already been imported (e.g. to overwrite amended data)",
+    )
 
     def __init__(self, *args, **kwargs):
         super(UploadForm, self).__init__(*args, **kwargs)
@@ -96,6 +122,9 @@ class UploadForm(FinancialYearFilterForm):
             "upload_file_type",
             "upload_file",
             "financial_year",
+            "import_mode",
+            "delete_missing",
+            "force_reprocess",
             Div(Submit("upload", "Upload"), css_class="col-sm-offset-4 col-md-offset-3 col-lg-offset-2"),
         )
 
@@ -106,6 +135,101 @@ class UploadForm(FinancialYearFilterForm):
             self._errors["upload_file"] = self.error_class(["File type is not allowed (.csv only)"])
         if upload and upload.size > settings.MAX_UPLOAD_SIZE:
             self._errors["upload_file"] = self.error_class([f"File exceeds maximum size of {settings.MAX_UPLOAD_SIZE} bytes"])
+        # Validation: import modes other than the default are only available for GL Pivot Download uploads.
+        if not self.cleaned_data.get("import_mode"):
+            self.cleaned_data["import_mode"] = "append"
+        if self.cleaned_data["import_mode"] != "append" and self.cleaned_data.get("upload_file_type") != "gl_pivot_download":
+            self._errors["import_mode"] = self.error_class(["This import mode is only available for GL Pivot Download uploads"])
+        if self.cleaned_data.get("delete_missing") and self.cleaned_data["import_mode"] != "delta":
+            self._errors["delete_missing"] = self.error_class(["Deleting missing records is only available in update mode"])
+        return self.cleaned_data
+
+
+class MultipleFileInput(forms.ClearableFileInput):
+    allow_multiple_selected = True
+
+
+class MultipleFileField(forms.FileField):
+    """A FileField which accepts several files, and returns a list of the uploaded files."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("widget", MultipleFileInput())
+        super(MultipleFileField, self).__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        if isinstance(data, (list, tuple)):
+            return [super(MultipleFileField, self).clean(d, initial) for d in data]
+        return [super(MultipleFileField, self).clean(data, initial)]
+
+
+class BatchUploadFile(NamedTuple):
+    """A CSV file of a batch upload (an uploaded file, or a member of an uploaded zip file)."""
+
+    file_type: str
+    name: str
+    size: int
+    open: Callable
+
+
+class BatchUploadForm(FinancialYearFilterForm):
+    upload_files = MultipleFileField(
+        label="CSV or zip files",
+        help_text="Name each CSV file after its file type, e.g. corp_strategy.csv, general_sp.csv, ibm_data.csv, gl_pivot_download.csv",
+    )
+    import_mode = forms.ChoiceField(
+        label="GL Pivot Download import mode",
+        choices=(
+            ("append", "Create/update records"),
+            ("reload", "Replace all records for the financial year"),
+            ("delta", "Update new and changed records only"),
+        ),
+        initial="reload",
+    )
+    force_reprocess = forms.BooleanField(
+        required=False,
+        label="Force reprocess",
+        help_text="Import every file, even if identical content has already been imported",
+    )
+
+    def __init__(self, *args, **kwargs):
+        super(BatchUploadForm, self).__init__(*args, **kwargs)
+        # crispy_forms layout
+        self.helper.layout = Layout(
+            "upload_files",
+            "financial_year",
+            "import_mode",
+            "force_reprocess",
+            Div(Submit("upload", "Upload"), css_class="col-sm-offset-4 col-md-offset-3 col-lg-offset-2"),
+        )
+
+    def clean(self):
+        # Validation: each CSV file (including the members of any zip file) must be named after its file type.
+        files = {}
+        errors = []
+        for upload in self.cleaned_data.get("upload_files", []):
+            if zipfile.is_zipfile(upload):
+                archive = zipfile.ZipFile(upload)
+                members = [
+                    BatchUploadFile("", info.filename, info.file_size, lambda archive=archive, info=info: archive.open(info))
+                    for info in archive.infolist()
+                    if not info.is_dir() and not os.path.basename(info.filename).startswith(".") and "__MACOSX" not in info.filename
+                ]
+            else:
+                upload.seek(0)
+                members = [BatchUploadFile("", upload.name, upload.size, lambda upload=upload: upload)]
+            for member in members:
+                file_type, extension = os.path.splitext(os.path.basename(member.name))
+                if file_type not in UPLOAD_FILE_TYPE_MODELS or extension.lower() != ".csv":
+                    errors.append(f"{member.name} is not named after an upload file type")
+                elif file_type in files:
+                    errors.append(f"More than one {file_type} file was uploaded")
+                elif member.size > settings.MAX_UPLOAD_SIZE:
+                    errors.append(f"{member.name} exceeds maximum size of {settings.MAX_UPLOAD_SIZE} bytes")
+                else:
+                    files[file_type] = member._replace(file_type=file_type)
+        if errors:
+            self._errors["upload_files"] = self.error_class(errors)
+        self.cleaned_data["csv_files"] = list(files.values())
         return self.cleaned_data
 
 
@@ -122,17 +246,25 @@ class DownloadForm(FinancialYearFilterForm):
             label="Region/branch",
         )
         self.fields["division"] = forms.ChoiceField(choices=get_generic_choices(GLPivDownload, "division", allow_null=True), required=False)
+        self.fields["compressed"] = forms.BooleanField(
+            required=False,
+            label="Compressed (.csv.gz)",
+            help_text="Download a gzip-compressed CSV file, which is much smaller to download over a slow connection",
+        )
 
         # Disable several fields on initial form load.
         for field in ["cost_centre", "region", "division"]:
             self.fields[field].widget.attrs.update({"disabled": ""})
 
         # crispy_forms layout
+        # The form is submitted with GET, so that a download may be resumed or revalidated by the browser.
+        self.helper.form_method = "GET"
         self.helper.layout = Layout(
             "financial_year",
             "cost_centre",
             "region",
             "division",
+            "compressed",
             Div(Submit("download", "Download"), css_class="col-sm-offset-4 col-md-offset-3 col-lg-offset-2"),
         )
 
@@ -257,6 +389,24 @@ class DataAmendmentForm(FinancialYearFilterForm):
         return self.cleaned_data
 
 
+class ServicePriorityReportForm(DataAmendmentForm):
+    """The data amendment form, used to download the service priority workbook."""
+
+    def __init__(self, request, *args, **kwargs):
+        super(ServicePriorityReportForm, self).__init__(request, *args, **kwargs)
+        self.helper.layout.fields[-1] = Div(
+            Submit("servicepriority", "Service Priority"), css_class="col-sm-offset-4 col-md-offset-3 col-lg-offset-2"
+        )
+
+
+class ReloadReportForm(DataAmendmentForm):
+    """The data amendment form, used to download the IBM data reload workbook."""
+
+    def __init__(self, request, *args, **kwargs):
+        super(ReloadReportForm, self).__init__(request, *args, **kwargs)
+        self.helper.layout.fields[-1] = Div(Submit("reload", "Reload"), css_class="col-sm-offset-4 col-md-offset-3 col-lg-offset-2")
+
+
 class CodeUpdateForm(FinancialYearFilterForm):
     def __init__(self, *args, **kwargs):
         super(CodeUpdateForm, self).__init__(*args, **kwargs)
@@ -353,6 +503,30 @@ class ManagerCodeUpdateForm(FinancialYearFilterForm):
         )
 
 
+class CodeUpdateBatchForm(ManagerCodeUpdateForm):
+    """Form to generate the code update workbook of every cost centre of a financial year, or of one region/branch."""
+
+    def __init__(self, *args, **kwargs):
+        super(CodeUpdateBatchForm, self).__init__(*args, **kwargs)
+        self.fields["region"] = forms.ChoiceField(
+            choices=get_generic_choices(GLPivDownload, "regionBranch", allow_null=True),
+            required=False,
+            label="Region/branch",
+        )
+
+        self.helper.layout = Layout(
+            "report_type",
+            "financial_year",
+            "region",
+            HTML('<div class="checkbox">'),
+            "ncChoice",
+            "pvsChoice",
+            "fmChoice",
+            HTML("</div>"),
+            Div(Submit("codeupdatebatch", "Generate workbooks"), css_class="col-sm-offset-4 col-md-offset-3 col-lg-offset-2"),
+        )
+
+
 class IbmDataFilterForm(forms.Form):
     financial_year = forms.ModelChoiceField(
         queryset=FinancialYear.objects.all().order_by("-financialYear"), empty_label=None, required=True
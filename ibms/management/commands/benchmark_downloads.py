@@ -0,0 +1,122 @@
+import json
+import os
+import platform
+import time
+from datetime import UTC, datetime
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.http import StreamingHttpResponse
+
+from ibms.models import FinancialYear, GLPivDownload
+from ibms.reports import DOWNLOAD, DOWNLOAD_VARIANTS, download_report, gzip_report
+
+
+def benchmark_download(glpiv_qs, variant: str, chunk_size: int, gzip: bool = False) -> dict:
+    """Stream a download report response (gzip-compressed, if `gzip` is True) to the null device, writing each chunk
+    separately as a WSGI server would, returning a dict of measurements: the time to first byte, the time taken, the
+    number of chunks and bytes written and the throughput.
+    """
+    content = download_report(glpiv_qs, chunk_size=chunk_size, **DOWNLOAD_VARIANTS[variant])
+    response = StreamingHttpResponse(gzip_report(content) if gzip else content)
+    chunks = size = 0
+    ttfb = None
+    with open(os.devnull, "wb", buffering=0) as sink:
+        start = time.perf_counter()
+        for chunk in response:
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            sink.write(chunk)
+            chunks += 1
+            size += len(chunk)
+        seconds = time.perf_counter() - start
+    return {
+        "ttfb_seconds": round(ttfb, 4),
+        "seconds": round(seconds, 3),
+        "chunks": chunks,
+        "bytes": size,
+        "bytes_per_second": round(size / seconds) if seconds else None,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams the CSV download reports of a financial year with one or more chunk sizes (0 yields each row as a "
+        "separate chunk), and records the time to first byte and throughput of each as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--financial-year",
+            default="BENCHMARK",
+            help="Financial year to download, e.g. following benchmark_imports --keep-data (default: BENCHMARK)",
+        )
+        parser.add_argument("--cost-centre", help="Download a single cost centre (default: the whole financial year)")
+        parser.add_argument("--region", help="Download a single region/branch (default: the whole financial year)")
+        parser.add_argument(
+            "--variant",
+            choices=list(DOWNLOAD_VARIANTS),
+            nargs="+",
+            default=[DOWNLOAD],
+            help=f"Download report variants (default: {DOWNLOAD})",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            nargs="+",
+            help="Chunk sizes to compare, in characters (default: 0 and the DOWNLOAD_CHUNK_SIZE setting)",
+        )
+        parser.add_argument(
+            "--gzip",
+            action="store_true",
+            help="Also stream each download gzip-compressed, at the DOWNLOAD_GZIP_LEVEL setting compression level",
+        )
+        parser.add_argument("--output", help="Write the JSON results to this file (default: standard output)")
+
+    def handle(self, *args, **options):
+        fy = FinancialYear.objects.filter(financialYear=options["financial_year"]).first()
+        if not fy:
+            raise CommandError(f"Financial year {options['financial_year']} does not exist")
+        glpiv_qs = GLPivDownload.objects.filter(fy=fy)
+        if options["cost_centre"]:
+            glpiv_qs = glpiv_qs.filter(costCentre=options["cost_centre"])
+        elif options["region"]:
+            glpiv_qs = glpiv_qs.filter(regionBranch=options["region"])
+        rows = glpiv_qs.count()
+        chunk_sizes = options["chunk_size"] or [0, settings.DOWNLOAD_CHUNK_SIZE]
+
+        results = {
+            "metadata": {
+                "timestamp": datetime.now(UTC).isoformat(),
+                "version": settings.APPLICATION_VERSION_NO,
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+                "financial_year": str(fy),
+                "cost_centre": options["cost_centre"],
+                "region": options["region"],
+                "rows": rows,
+                "gzip_level": settings.DOWNLOAD_GZIP_LEVEL if options["gzip"] else None,
+            },
+            "results": [],
+        }
+
+        for variant in options["variant"]:
+            for chunk_size in chunk_sizes:
+                for gzip in (False, True) if options["gzip"] else (False,):
+                    result = benchmark_download(glpiv_qs, variant, chunk_size, gzip)
+                    result["rows_per_second"] = round(rows / result["seconds"], 1) if result["seconds"] else None
+                    results["results"].append({"variant": variant, "chunk_size": chunk_size, "gzip": gzip, **result})
+                    self.stderr.write(
+                        f"{variant} (chunk size {chunk_size}{', gzip' if gzip else ''}): {rows} rows in {result['seconds']}s, "
+                        f"first byte after {result['ttfb_seconds']}s, {result['chunks']} chunks, {result['bytes']} bytes "
+                        f"({result['rows_per_second']} rows/sec)"
+                    )
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+        else:
+            self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,170 @@
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+from datetime import UTC, datetime
+from typing import Optional
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from ibms.models import (
+    SERVICE_PRIORITY_MODELS,
+    CorporateStrategy,
+    DepartmentProgram,
+    FinancialYear,
+    GLPivDownload,
+    IBMData,
+    NCStrategicPlan,
+    ServicePriorityMapping,
+)
+from ibms.tasks import UPLOAD_FILE_TYPE_MODELS, UPLOAD_FILE_TYPE_ORDER
+from ibms.utils import CSV_PARSER_ENGINES, ImportMetrics, get_csv_parser_engine, ibms_import_from_csv
+
+
+class QueryCounter:
+    """Database execute wrapper which counts the queries executed."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def clear_financial_year(fy: FinancialYear) -> None:
+    """Delete all uploaded data for the passed-in financial year, in dependency order."""
+    for model in (
+        GLPivDownload,
+        DepartmentProgram,
+        IBMData,
+        ServicePriorityMapping,
+        *SERVICE_PRIORITY_MODELS,
+        NCStrategicPlan,
+        CorporateStrategy,
+    ):
+        model.objects.filter(fy=fy).delete()
+
+
+def peak_rss() -> int:
+    """Return the peak resident set size of this process, in bytes."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def benchmark_import(
+    path: str, fy: FinancialYear, model: type, mode: str = "append", trace_memory: bool = False, engine: Optional[str] = None
+) -> dict:
+    """Import a CSV file, returning a dict of measurements: rows, seconds, rows/sec, query count, the process peak
+    RSS following the import, the time and queries of each phase of the import, and (if `trace_memory` is True) the
+    peak memory allocated by Python during the import.
+    """
+    counter = QueryCounter()
+    metrics = ImportMetrics()
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        with connection.execute_wrapper(counter):
+            start = time.perf_counter()
+            _, record_count = ibms_import_from_csv(path, fy, model, mode=mode, metrics=metrics, engine=engine)
+            seconds = time.perf_counter() - start
+        peak_memory = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return {
+        "rows": record_count,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(record_count / seconds, 1) if seconds else None,
+        "queries": counter.count,
+        "peak_rss_bytes": peak_rss(),
+        "peak_traced_memory_bytes": peak_memory,
+        "phases": metrics.as_dict()["phases"],
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports each CSV file in one or more directories created by generate_upload_data, in dependency order, "
+        "and records rows/sec, query count and peak memory for each import as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("data_dirs", nargs="+", help="Directories of generated CSV files (<file type>.csv)")
+        parser.add_argument("--output", help="Write the JSON results to this file (default: standard output)")
+        parser.add_argument(
+            "--financial-year",
+            default="BENCHMARK",
+            help="Financial year to import into, which is created if required (default: BENCHMARK)",
+        )
+        parser.add_argument(
+            "--gl-mode",
+            choices=["append", "reload", "delta"],
+            default="append",
+            help="Import mode for GL pivot download files (default: append)",
+        )
+        parser.add_argument(
+            "--engine",
+            choices=CSV_PARSER_ENGINES,
+            help="CSV parser engine for GL pivot download files (default: the CSV_PARSER_ENGINE setting)",
+        )
+        parser.add_argument("--clear", action="store_true", help="Delete any existing data in the financial year before starting")
+        parser.add_argument("--keep-data", action="store_true", help="Do not delete the imported data once finished")
+        parser.add_argument(
+            "--trace-memory",
+            action="store_true",
+            help="Trace the peak memory allocated by each import (this slows imports, so timings are not comparable)",
+        )
+
+    def handle(self, *args, **options):
+        fy, created = FinancialYear.objects.get_or_create(financialYear=options["financial_year"])
+        has_data = IBMData.objects.filter(fy=fy).exists() or GLPivDownload.objects.filter(fy=fy).exists()
+        if has_data and not options["clear"]:
+            raise CommandError(f"Financial year {fy} already contains data; use --clear to delete it first")
+
+        results = {
+            "metadata": {
+                "timestamp": datetime.now(UTC).isoformat(),
+                "version": settings.APPLICATION_VERSION_NO,
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+                "csv_import_batch_size": settings.CSV_IMPORT_BATCH_SIZE,
+                "gl_mode": options["gl_mode"],
+                "engine": get_csv_parser_engine(options["engine"]),
+                "trace_memory": options["trace_memory"],
+            },
+            "results": [],
+        }
+
+        for data_dir in options["data_dirs"]:
+            clear_financial_year(fy)
+            for file_type in UPLOAD_FILE_TYPE_ORDER:
+                path = os.path.join(data_dir, f"{file_type}.csv")
+                if not os.path.exists(path):
+                    continue
+                model = UPLOAD_FILE_TYPE_MODELS[file_type]
+                mode = options["gl_mode"] if model == GLPivDownload else "append"
+                result = benchmark_import(path, fy, model, mode, trace_memory=options["trace_memory"], engine=options["engine"])
+                results["results"].append({"data_dir": data_dir, "file_type": file_type, "mode": mode, **result})
+                self.stderr.write(
+                    f"{path}: {result['rows']} rows in {result['seconds']}s ({result['rows_per_second']} rows/sec, "
+                    f"{result['queries']} queries)"
+                )
+
+        if not options["keep_data"]:
+            clear_financial_year(fy)
+            if created:
+                fy.delete()
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+        else:
+            self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,174 @@
+import csv
+import os
+import random
+
+from django.core.management.base import BaseCommand
+
+from ibms.tasks import UPLOAD_FILE_TYPE_ORDER
+
+# Header rows of each type of uploaded CSV file (matching the files in ibms/test_data).
+CSV_HEADERS = {
+    "gl_pivot_download": [
+        "Download Period", "CC", "Account", "Service", "Activity", "Resource", "Project", "Job", "Shortcode",
+        "Shortcode_Name", "GL_Code", "PTD_Actual", "PTD_Budget", "YTD_Actual", "YTD_Budget", "FY_Budget", "YTD_Variance",
+        "CC_Name", "Service Name", "Activity_Name", "Resource_Name", "Project_Name", "Job_Name", "Code identifier",
+        "ResNmNo", "ActNmNo", "ProjNmNo", "Region/Branch", "Division", "Resource Category", "Wildfire", "Exp_Rev",
+        "Fire Activities", "MPRA Category",
+    ],
+    "ibm_data": [
+        "ibmIdentifier", "costCentre", "account", "service", "activity", "project", "job", "budgetArea", "projectSponsor",
+        "regionalSpecificInfo", "servicePriorityID", "annualWPInfo", "priorityActionNo", "priorityLevel", "marineKPI",
+        "regionProject", "regionDescription",
+    ],
+    "corp_strategy": ["IBMSCSNo", "IBMSCSDesc1", "IBMSCSDesc2"],
+    "nature_conservation": ["StratPlanNo", "StratDirNo", "StratDir", "AimNo", "Aim1", "Aim2", "ActNo", "Action"],
+    "dept_program": ["ibmIdentifier", "DeptProgram1", "DeptProgram2", "DeptProgram3"],
+    "general_sp": ["CategoryID", "SerPriNo", "StratPlanNo", "IBMCS", "Description 1", "Description 2"],
+    "nc_sp": [
+        "CategoryID", "SerPriNo", "StratPlanNo", "IBMCS", "AssetNo", "Asset", "TargetNo", "Target", "ActionNo", "Action",
+        "MileNo", "Milestone",
+    ],
+    "pvs_sp": ["CategoryID", "SerPriNo", "StratPlanNo", "IBMCS", "SerPri1", "SerPri", "PVSExampleAnnWP", "PVSExampleActNo"],
+    "sfm_sp": ["CategoryID", "Region", "SerPriNo", "StratPlanNo", "IBMCS", "SerPri1", "SerPri2"],
+    "er_sp": [
+        "CategoryID", "SerPriNo", "StratPlanNo", "IBMCS", "Env Regs Specific Classification", "Env Regs Specific Description"
+    ],
+    "service_priority_mapping": ["costCentreNo", "wildlifeManagement", "parksManagement", "forestManagement"],
+}  # fmt: skip
+
+# Service priority number prefixes for each service priority file type.
+SERVICE_PRIORITY_PREFIXES = {"general_sp": "General", "nc_sp": "BC", "pvs_sp": "PM", "sfm_sp": "FM", "er_sp": "Fire"}
+ACTIVITIES = ["GC2", "GG3", "GE1", "GI3", "DJ0", "CA1", "SF4", "PW2"]
+REGIONS = ["Kimberley", "Pilbara", "Midwest", "Goldfields", "Wheatbelt", "Swan", "South West", "Warren", "South Coast"]
+RESOURCES_PER_CODE = 5
+COST_CENTRES = 400
+
+
+def ibm_identifier_parts(i: int) -> tuple:
+    """Return the (cost centre, account, service, activity, project, job) parts of the i-th unique IBM identifier."""
+    return (
+        str(100 + i % COST_CENTRES),
+        1 + (i // COST_CENTRES) % 8,
+        10 + (i // 7) % 40,
+        ACTIVITIES[i % len(ACTIVITIES)],
+        f"{i // COST_CENTRES:04d}",
+        f"{i % 997:03d}",
+    )
+
+
+def ibm_identifier(i: int) -> str:
+    """Return the i-th unique IBM identifier (CC-Account-Service-Activity-Project-Job)."""
+    cc, account, service, activity, project, job = ibm_identifier_parts(i)
+    return f"{cc}-{account:02d}-{service}-{activity}-{project}-{job}"
+
+
+def generate_upload_files(output_dir: str, gl_rows: int, seed: int = 0) -> dict:
+    """Write a consistent set of synthetic CSV files (one per uploaded file type) to `output_dir`, having `gl_rows`
+    GL pivot download rows. Every GL codeID matches an IBM data identifier, every IBM data record references a service
+    priority, and every service priority references a corporate strategy and strategic plan.
+    Returns a dict of file type: row count.
+    """
+    rng = random.Random(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    code_count = max(1, gl_rows // RESOURCES_PER_CODE)
+    sp_count = max(50, gl_rows // 1000)
+    strategy_count = 50
+    counts = {}
+
+    def write(file_type, rows):
+        with open(os.path.join(output_dir, f"{file_type}.csv"), "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_HEADERS[file_type])
+            count = 0
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        counts[file_type] = count
+
+    def amount():
+        return f"{rng.uniform(-5000, 50000):.2f}"
+
+    write(
+        "corp_strategy",
+        ([f"S{i:02d}", f"Corporate strategy {i}", f"Corporate strategy {i} description"] for i in range(strategy_count)),
+    )
+    write(
+        "nature_conservation",
+        ([f"SP{i:02d}", f"D{i:02d}", f"Value {i}", "", "", f"Aim {i}", "", f"Strategic plan {i} action"] for i in range(strategy_count)),
+    )
+    service_priorities = []
+    for file_type, prefix in SERVICE_PRIORITY_PREFIXES.items():
+        numbers = [f"{prefix}-{i:03d}" for i in range(sp_count)]
+        service_priorities += numbers
+        rows = []
+        for i, number in enumerate(numbers):
+            category = f"{prefix}-All"
+            plan, strategy = f"SP{i % strategy_count:02d}", f"S{i % strategy_count:02d}"
+            description = f"{prefix} service priority {i}"
+            if file_type == "nc_sp":
+                rows.append(
+                    [category, number, plan, strategy, f"A{i % 100}", "Asset", f"T{i}", "Target", str(i), description, f"M{i}", "Milestone"]
+                )
+            elif file_type == "pvs_sp":
+                rows.append([category, number, plan, strategy, description, description, "Annual work plan", "Action"])
+            elif file_type == "sfm_sp":
+                rows.append([category, REGIONS[i % len(REGIONS)], number, plan, strategy, description, description])
+            elif file_type == "er_sp":
+                rows.append([category, number, plan, strategy, "Classification", description])
+            else:
+                rows.append([category, number, plan, strategy, description, description])
+        write(file_type, rows)
+    write(
+        "service_priority_mapping",
+        ([str(100 + i), "BC-All", "PM-All", "FM-All"] for i in range(min(COST_CENTRES, code_count))),
+    )
+
+    def ibm_rows():
+        for i in range(code_count):
+            cc, account, service, activity, project, job = ibm_identifier_parts(i)
+            yield [
+                ibm_identifier(i), cc, f"{account:02d}", service, activity, project, job, REGIONS[i % len(REGIONS)], "Operations Officer",
+                "", rng.choice(service_priorities), "Annual work plan information", "", "", "", f"Project {project}", "Description",
+            ]  # fmt: skip
+
+    write("ibm_data", ibm_rows())
+    write("dept_program", ([ibm_identifier(i), "Nature-based tourism", "Business support", "Investment"] for i in range(code_count)))
+
+    def gl_rows_iter():
+        for i in range(gl_rows):
+            # Each IBM identifier has (about) RESOURCES_PER_CODE GL codes, one for each resource.
+            code, resource = i % code_count, 1000 + i // code_count
+            cc, account, service, activity, project, job = ibm_identifier_parts(code)
+            gl_code = f"{cc}-{account:02d}-{service}-{activity}-{resource}-{project}-{job}"
+            region = REGIONS[code % len(REGIONS)]
+            yield [
+                "30/04/2025", cc, account, service, activity, resource, project, job, "", "", gl_code, amount(), amount(),
+                amount(), amount(), amount(), amount(), f"Cost centre {cc}", f"Service {service}", f"Activity {activity}",
+                f"Resource {resource}", f"Project {project}", f"Job {job}", ibm_identifier(code), f"{resource}-Resource",
+                f"{activity}-Activity", f"{project}-Project", region, "Regional and Fire Management Services", "Payroll",
+                "", "Expense", "Normal Activities", "",
+            ]  # fmt: skip
+
+    write("gl_pivot_download", gl_rows_iter())
+    return {file_type: counts[file_type] for file_type in UPLOAD_FILE_TYPE_ORDER}
+
+
+class Command(BaseCommand):
+    help = "Generates synthetic CSV files for every type of upload, for benchmarking imports (see benchmark_imports)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("output_dir", help="Directory in which to write the files (one subdirectory per size)")
+        parser.add_argument(
+            "--gl-rows",
+            nargs="+",
+            type=int,
+            default=[10000],
+            help="GL pivot download row count(s) to generate; the other files are sized in proportion (default: 10000)",
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Random seed, so that generated files are repeatable")
+
+    def handle(self, *args, **options):
+        for gl_rows in options["gl_rows"]:
+            output_dir = os.path.join(options["output_dir"], str(gl_rows))
+            counts = generate_upload_files(output_dir, gl_rows, options["seed"])
+            self.stdout.write(f"Generated {output_dir}: " + ", ".join(f"{count} {file_type}" for file_type, count in counts.items()))
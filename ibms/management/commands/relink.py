@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ibms.models import FinancialYear
+from ibms.tasks import relink
+from ibms.utils import relink_financial_year
+
+
+class Command(BaseCommand):
+    help = "Recomputes the service priority, IBM data and GL pivot download links for one or more financial years"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "financial_years",
+            nargs="*",
+            help="Financial year(s) to relink, e.g. 2024/25 (default: all financial years)",
+        )
+        parser.add_argument(
+            "--enqueue",
+            action="store_true",
+            help="Enqueue a background task for each financial year, instead of relinking immediately",
+        )
+
+    def handle(self, *args, **options):
+        if options["financial_years"]:
+            fys = []
+            for financial_year in options["financial_years"]:
+                try:
+                    fys.append(FinancialYear.objects.get(financialYear=financial_year))
+                except FinancialYear.DoesNotExist:
+                    raise CommandError(f"Financial year {financial_year} does not exist")
+        else:
+            fys = FinancialYear.objects.all()
+
+        for fy in fys:
+            if options["enqueue"]:
+                relink.enqueue(fy.financialYear)
+                self.stdout.write(f"Enqueued relinking {fy}")
+            else:
+                counts = relink_financial_year(fy)
+                self.stdout.write(f"Relinked {fy}: " + ", ".join(f"{count} {label} links updated" for label, count in counts.items()))
@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ibms.models import ImportJob
+from ibms.tasks import resume_import_jobs
+
+
+class Command(BaseCommand):
+    help = "Re-enqueues interrupted CSV upload imports, which resume after their last committed batch of rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "job_ids",
+            nargs="*",
+            type=int,
+            help="Resume the specified import jobs (including failed jobs), instead of all interrupted jobs",
+        )
+        parser.add_argument(
+            "--stale-minutes",
+            type=int,
+            default=settings.IMPORT_JOB_STALE_MINUTES,
+            help="Minutes without progress after which an in-progress import is considered interrupted",
+        )
+
+    def handle(self, *args, **options):
+        if options["job_ids"]:
+            jobs = ImportJob.objects.filter(pk__in=options["job_ids"]).exclude(status="complete")
+        else:
+            stale = timezone.now() - timedelta(minutes=options["stale_minutes"])
+            jobs = ImportJob.objects.filter(status__in=ImportJob.ACTIVE_STATUSES, modified__lt=stale)
+        count = resume_import_jobs(jobs)
+        self.stdout.write(f"Resumed {count} import(s)")
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.17 on 2026-10-18 18:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ibms", "0029_rename_financialyear_table"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportJob",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("blob_name", models.CharField(editable=False, max_length=1024)),
+                ("file_type", models.CharField(editable=False, max_length=64)),
+                ("import_mode", models.CharField(default="append", editable=False, max_length=16)),
+                ("delete_missing", models.BooleanField(default=False, editable=False)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("queued", "Queued"),
+                            ("validating", "Validating"),
+                            ("importing", "Importing"),
+                            ("linking", "Linking"),
+                            ("complete", "Complete"),
+                            ("failed", "Failed"),
+                        ],
+                        db_index=True,
+                        default="queued",
+                        editable=False,
+                        max_length=16,
+                    ),
+                ),
+                ("rows_processed", models.PositiveIntegerField(default=0, editable=False)),
+                (
+                    "rows_committed",
+                    models.PositiveIntegerField(
+                        default=0, editable=False, help_text="Rows committed to the database; a resumed import skips these rows."
+                    ),
+                ),
+                ("model_type", models.CharField(blank=True, editable=False, max_length=128)),
+                ("error", models.TextField(blank=True, editable=False)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("started", models.DateTimeField(blank=True, editable=False, null=True)),
+                ("modified", models.DateTimeField(auto_now=True, verbose_name="last modified")),
+                ("completed", models.DateTimeField(blank=True, editable=False, null=True)),
+                (
+                    "fy",
+                    models.ForeignKey(
+                        editable=False, on_delete=django.db.models.deletion.PROTECT, to="ibms.financialyear", verbose_name="financial year"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        editable=False,
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="ibms_import_jobs",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ("-created",),
+            },
+        ),
+    ]
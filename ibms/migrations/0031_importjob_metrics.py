@@ -0,0 +1,19 @@
+# Generated by Django 5.2.17 on 2026-10-18 19:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ibms", "0030_importjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="importjob",
+            name="metrics",
+            field=models.JSONField(
+                blank=True, editable=False, help_text="Elapsed time and query count of each phase of the import.", null=True
+            ),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.17 on 2026-10-18 19:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ibms", "0031_importjob_metrics"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="importjob",
+            name="content_hash",
+            field=models.CharField(
+                blank=True, db_index=True, editable=False, help_text="SHA-256 digest of the uploaded file content.", max_length=64
+            ),
+        ),
+        migrations.AlterField(
+            model_name="importjob",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("queued", "Queued"),
+                    ("validating", "Validating"),
+                    ("importing", "Importing"),
+                    ("linking", "Linking"),
+                    ("complete", "Complete"),
+                    ("failed", "Failed"),
+                    ("skipped", "Skipped (duplicate)"),
+                ],
+                db_index=True,
+                default="queued",
+                editable=False,
+                max_length=16,
+            ),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.17 on 2026-10-18 19:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ibms", "0032_importjob_content_hash"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportBatch",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("queued", "Queued"),
+                            ("validating", "Validating"),
+                            ("importing", "Importing"),
+                            ("linking", "Linking"),
+                            ("complete", "Complete"),
+                            ("failed", "Failed"),
+                        ],
+                        db_index=True,
+                        default="queued",
+                        editable=False,
+                        max_length=16,
+                    ),
+                ),
+                ("error", models.TextField(blank=True, editable=False)),
+                (
+                    "link_counts",
+                    models.JSONField(blank=True, editable=False, help_text="Counts of links updated by the final pass.", null=True),
+                ),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("completed", models.DateTimeField(blank=True, editable=False, null=True)),
+                (
+                    "fy",
+                    models.ForeignKey(
+                        editable=False, on_delete=django.db.models.deletion.PROTECT, to="ibms.financialyear", verbose_name="financial year"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        editable=False,
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="ibms_import_batches",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "import batches",
+                "ordering": ("-created",),
+            },
+        ),
+        migrations.AddField(
+            model_name="importjob",
+            name="batch",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="jobs",
+                to="ibms.importbatch",
+            ),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.17 on 2026-10-18 20:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ibms", "0033_importbatch"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReportJob",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("report", models.CharField(choices=[("code_update_batch", "Code update (batch)")], editable=False, max_length=64)),
+                ("parameters", models.JSONField(blank=True, default=dict, editable=False, help_text="Report filters and options.")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("queued", "Queued"), ("running", "Generating"), ("complete", "Complete"), ("failed", "Failed")],
+                        db_index=True,
+                        default="queued",
+                        editable=False,
+                        max_length=16,
+                    ),
+                ),
+                (
+                    "items_total",
+                    models.PositiveIntegerField(default=0, editable=False, help_text="Number of report items, e.g. workbooks."),
+                ),
+                ("items_done", models.PositiveIntegerField(default=0, editable=False)),
+                ("blob_name", models.CharField(blank=True, editable=False, max_length=1024)),
+                ("file_name", models.CharField(blank=True, editable=False, help_text="File name of the report download.", max_length=256)),
+                ("error", models.TextField(blank=True, editable=False)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("started", models.DateTimeField(blank=True, editable=False, null=True)),
+                ("completed", models.DateTimeField(blank=True, editable=False, null=True)),
+                (
+                    "fy",
+                    models.ForeignKey(
+                        editable=False, on_delete=django.db.models.deletion.PROTECT, to="ibms.financialyear", verbose_name="financial year"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        editable=False,
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="ibms_report_jobs",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ("-created",),
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.17 on 2026-10-18 21:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ibms", "0034_reportjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="financialyear",
+            name="data_version",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
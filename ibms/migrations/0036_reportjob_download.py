@@ -0,0 +1,19 @@
+# Generated by Django 5.2.17 on 2026-10-18 21:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ibms", "0035_financialyear_data_version"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="reportjob",
+            name="report",
+            field=models.CharField(
+                choices=[("code_update_batch", "Code update (batch)"), ("download", "Download (CSV)")], editable=False, max_length=64
+            ),
+        ),
+    ]
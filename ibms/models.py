@@ -11,6 +11,8 @@ User = get_user_model()
 
 class FinancialYear(models.Model):
     financialYear = models.CharField(max_length=10, primary_key=True, verbose_name="financial year")
+    # Incremented whenever data of the financial year is imported or amended (see bump_data_version).
+    data_version = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         ordering = ("financialYear",)
@@ -18,6 +20,12 @@ class FinancialYear(models.Model):
     def __str__(self):
         return self.financialYear
 
+    def bump_data_version(self) -> None:
+        """Increment the data version of the financial year, after its data has been imported or amended, so that
+        any download report cached for an earlier version is no longer served (see ibms.downloads).
+        """
+        FinancialYear.objects.filter(pk=self.pk).update(data_version=models.F("data_version") + 1)
+
 
 class IBMData(models.Model):
     """IBM data table stores IBMS related data that is being input through IBMS budget templates, Code Update templates
@@ -96,7 +104,7 @@ class IBMData(models.Model):
             return self.service_priority
 
         # NOTE: the order of model classes is important here, as GeneralServicePriority should be preferenced.
-        for model in [GeneralServicePriority, NCServicePriority, PVSServicePriority, SFMServicePriority, ERServicePriority]:
+        for model in SERVICE_PRIORITY_MODELS:
             qs = model.objects.filter(fy=self.fy, servicePriorityNo=self.servicePriorityID)
             if qs:
                 return qs.first()
@@ -545,6 +553,10 @@ class ERServicePriority(ServicePriority):
         return str(self.description)
 
 
+# Concrete ServicePriority subclasses, in order of precedence when linking IBMData objects.
+SERVICE_PRIORITY_MODELS = (GeneralServicePriority, NCServicePriority, PVSServicePriority, SFMServicePriority, ERServicePriority)
+
+
 class Outcome(models.Model):
     fy = models.ForeignKey(FinancialYear, on_delete=models.PROTECT, verbose_name="financial year")
     q1Input = models.TextField()
@@ -565,3 +577,138 @@ class ServicePriorityMapping(models.Model):
 
     def __str__(self):
         return str(self.costCentreNo)
+
+
+class ImportBatch(models.Model):
+    """Records a set of uploaded CSV files for one financial year, which are imported by a single background task in
+    dependency order (see UPLOAD_FILE_TYPE_ORDER), followed by one pass to set the links between records.
+    Each file is recorded as an ImportJob of the batch.
+    """
+
+    STATUS_CHOICES = (
+        ("queued", "Queued"),
+        ("validating", "Validating"),
+        ("importing", "Importing"),
+        ("linking", "Linking"),
+        ("complete", "Complete"),
+        ("failed", "Failed"),
+    )
+
+    user = models.ForeignKey(User, on_delete=models.PROTECT, related_name="ibms_import_batches", editable=False)
+    fy = models.ForeignKey(FinancialYear, on_delete=models.PROTECT, verbose_name="financial year", editable=False)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="queued", db_index=True, editable=False)
+    error = models.TextField(blank=True, editable=False)
+    link_counts = models.JSONField(null=True, blank=True, editable=False, help_text="Counts of links updated by the final pass.")
+
+    created = models.DateTimeField(auto_now_add=True, editable=False)
+    completed = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        ordering = ("-created",)
+        verbose_name_plural = "import batches"
+
+    def __str__(self):
+        return f"{self.fy} upload batch {self.pk} ({self.status})"
+
+
+class ImportJob(models.Model):
+    """Records the status and progress of an uploaded CSV file, which is imported by a background task.
+    Progress is checkpointed as each batch of records is committed, so that an interrupted import can be
+    resumed from the last committed batch instead of starting over.
+    """
+
+    STATUS_CHOICES = (
+        ("queued", "Queued"),
+        ("validating", "Validating"),
+        ("importing", "Importing"),
+        ("linking", "Linking"),
+        ("complete", "Complete"),
+        ("failed", "Failed"),
+        ("skipped", "Skipped (duplicate)"),
+    )
+    # Statuses for which the import task is (or should be) still running.
+    ACTIVE_STATUSES = ("queued", "validating", "importing", "linking")
+
+    user = models.ForeignKey(User, on_delete=models.PROTECT, related_name="ibms_import_jobs", editable=False)
+    fy = models.ForeignKey(FinancialYear, on_delete=models.PROTECT, verbose_name="financial year", editable=False)
+    blob_name = models.CharField(max_length=1024, editable=False)
+    file_type = models.CharField(max_length=64, editable=False)
+    import_mode = models.CharField(max_length=16, default="append", editable=False)
+    delete_missing = models.BooleanField(default=False, editable=False)
+    batch = models.ForeignKey(ImportBatch, on_delete=models.CASCADE, null=True, blank=True, related_name="jobs", editable=False)
+    content_hash = models.CharField(
+        max_length=64, blank=True, db_index=True, editable=False, help_text="SHA-256 digest of the uploaded file content."
+    )
+
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="queued", db_index=True, editable=False)
+    rows_processed = models.PositiveIntegerField(default=0, editable=False)
+    rows_committed = models.PositiveIntegerField(
+        default=0, editable=False, help_text="Rows committed to the database; a resumed import skips these rows."
+    )
+    model_type = models.CharField(max_length=128, blank=True, editable=False)
+    error = models.TextField(blank=True, editable=False)
+    metrics = models.JSONField(
+        null=True, blank=True, editable=False, help_text="Elapsed time and query count of each phase of the import."
+    )
+
+    created = models.DateTimeField(auto_now_add=True, editable=False)
+    started = models.DateTimeField(null=True, blank=True, editable=False)
+    modified = models.DateTimeField(auto_now=True, editable=False, verbose_name="last modified")
+    completed = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        ordering = ("-created",)
+
+    def __str__(self):
+        return f"{self.file_type} upload {self.blob_name} ({self.status})"
+
+    @property
+    def rows_per_second(self) -> float | None:
+        """Returns the import throughput (rows processed per second), if the import has started."""
+        if not self.started or not self.rows_processed:
+            return None
+        elapsed = ((self.completed or self.modified) - self.started).total_seconds()
+        return round(self.rows_processed / elapsed, 1) if elapsed > 0 else None
+
+
+class ReportJob(models.Model):
+    """Records a report which is generated by a background task, e.g. the code update workbooks of every cost centre
+    in a financial year. The finished report is uploaded to blob storage (`blob_name`) for download.
+    """
+
+    REPORT_CHOICES = (
+        ("code_update_batch", "Code update (batch)"),
+        ("download", "Download (CSV)"),
+    )
+    STATUS_CHOICES = (
+        ("queued", "Queued"),
+        ("running", "Generating"),
+        ("complete", "Complete"),
+        ("failed", "Failed"),
+    )
+    # Statuses for which the report task is (or should be) still running.
+    ACTIVE_STATUSES = ("queued", "running")
+
+    user = models.ForeignKey(User, on_delete=models.PROTECT, related_name="ibms_report_jobs", editable=False)
+    fy = models.ForeignKey(FinancialYear, on_delete=models.PROTECT, verbose_name="financial year", editable=False)
+    report = models.CharField(max_length=64, choices=REPORT_CHOICES, editable=False)
+    parameters = models.JSONField(default=dict, blank=True, editable=False, help_text="Report filters and options.")
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="queued", db_index=True, editable=False)
+    items_total = models.PositiveIntegerField(default=0, editable=False, help_text="Number of report items, e.g. workbooks.")
+    items_done = models.PositiveIntegerField(default=0, editable=False)
+    blob_name = models.CharField(max_length=1024, blank=True, editable=False)
+    file_name = models.CharField(max_length=256, blank=True, editable=False, help_text="File name of the report download.")
+    error = models.TextField(blank=True, editable=False)
+
+    created = models.DateTimeField(auto_now_add=True, editable=False)
+    started = models.DateTimeField(null=True, blank=True, editable=False)
+    completed = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        ordering = ("-created",)
+
+    def __str__(self):
+        return f"{self.get_report_display()} report {self.pk} ({self.status})"
+
+    def get_absolute_url(self):
+        return reverse("ibms:report_job_download", kwargs={"pk": self.pk})
@@ -1,15 +1,52 @@
 import csv
+import multiprocessing
+import zlib
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from copy import copy
+from functools import cache, partial
+from io import BytesIO, StringIO
+from operator import itemgetter, methodcaller
+from typing import Callable, Dict, Iterator, NamedTuple, Optional, Tuple
 
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
-from django.db.models import Sum
+from django.db import connections
+from django.db.models import BigIntegerField, Case, Exists, F, Min, OuterRef, Q, Sum, When
+from django.db.models.functions import Cast
 from xlrd import cellname
 from xlwt import Formula, XFStyle, easyxf
 
+from ibms.excel import get_excel_template
+
+CODE_UPDATE_TEMPLATE = "ibms_codeupdate_base.xls"
+DATA_AMEND_TEMPLATE = "ibms_dataamend_base.xls"
+SERVICE_PRIORITY_TEMPLATE = "service_priority_base.xls"
+RELOAD_TEMPLATE = "reload_base.xls"
+XLS_MAX_ROWS = 65536  # Rows per worksheet of an .xls (BIFF8) workbook.
+# IBMData fields written to sheet 1 of the reload workbook (see reload_report).
+RELOAD_IBM_FIELDS = (
+    "costCentre",
+    "account",
+    "service",
+    "activity",
+    "project",
+    "job",
+    "budgetArea",
+    "projectSponsor",
+    "regionalSpecificInfo",
+    "servicePriorityID",
+    "annualWPInfo",
+)
+CODE_UPDATE_RESOURCE_COLUMN = 21  # Column V, '0000'
+# IBMData fields written to sheet 3 of the code update and data amendment workbooks (see write_ibm_lookups).
+IBM_LOOKUP_FIELDS = ("costCentre", "budgetArea", "projectSponsor", "regionalSpecificInfo")
+
 
 def service_priority_report(workbook, gl, ibm, nc_sp, pvs_sp, fm_sp):
+    """Sheet 1 has one row per codeID of the `gl` queryset having a matching IBMData object in the `ibm` queryset,
+    read in a single (streamed) query (see ibm_data_rows).
+    """
     # Sheet 1
     sheet = workbook.get_sheet(0)
 
@@ -24,43 +61,33 @@ def service_priority_report(workbook, gl, ibm, nc_sp, pvs_sp, fm_sp):
     pad4.num_format_str = "0000"
 
     current_row = 3
-    code_id = ""
-    for _, data in enumerate(gl, current_row):
-        # Only insert GLPivDownload objects with a matching IBMData object.
-        if ibm.filter(ibmIdentifier=data.codeID):
-            # We have to aggregate all the GLPivotDownload objects with
-            # matching codeID values, and insert one row with total
-            # ytdActual and fyBudget values.
-            if code_id != data.codeID:  # Reached the next codeID value.
-                code_id = data.codeID
-                i = ibm.get(ibmIdentifier=data.codeID)
-                current_row += 1  # Advance one row.
-                sheet.write(current_row, 0, data.codeID)
-                sheet.write(current_row, 1, int(data.costCentre), pad3)
-                sheet.write(current_row, 2, data.account, pad2)
-                sheet.write(current_row, 3, data.service, pad2)
-                sheet.write(current_row, 4, data.activity)
-                try:
-                    sheet.write(current_row, 5, int(data.project), pad4)
-                except ValueError:
-                    sheet.write(current_row, 5, data.project, pad4)
-                try:
-                    sheet.write(current_row, 6, int(data.job), pad3)
-                except ValueError:
-                    sheet.write(current_row, 6, data.job, pad3)
-                sheet.write(current_row, 7, data.jobName)
-                sheet.write(current_row, 8, data.activityName)
-                sheet.write(current_row, 9, data.projNameNo)
-                sheet.write(current_row, 10, i.budgetArea)
-                sheet.write(current_row, 11, i.projectSponsor)
-                sheet.write(current_row, 12, i.regionalSpecificInfo)
-                sheet.write(current_row, 13, i.servicePriorityID)
-                sheet.write(current_row, 14, i.annualWPInfo)
-                sheet.write(current_row, 15, data.mPRACategory)
-                ytd = gl.filter(codeID=code_id).aggregate(Sum("ytdActual"))
-                fy = gl.filter(codeID=code_id).aggregate(Sum("fybudget"))
-                sheet.write(current_row, 16, ytd["ytdActual__sum"])
-                sheet.write(current_row, 17, fy["fybudget__sum"])
+    # Each row has the total ytdActual and fyBudget values of the codeID's GLPivDownload objects.
+    for g in ibm_data_rows(gl, ibm).iterator():
+        current_row += 1  # Advance one row.
+        sheet.write(current_row, 0, g["codeID"])
+        sheet.write(current_row, 1, int(g["cost_centre"]), pad3)
+        sheet.write(current_row, 2, g["account_no"], pad2)
+        sheet.write(current_row, 3, g["service_no"], pad2)
+        sheet.write(current_row, 4, g["activity_code"])
+        try:
+            sheet.write(current_row, 5, int(g["project_code"]), pad4)
+        except ValueError:
+            sheet.write(current_row, 5, g["project_code"], pad4)
+        try:
+            sheet.write(current_row, 6, int(g["job_code"]), pad3)
+        except ValueError:
+            sheet.write(current_row, 6, g["job_code"], pad3)
+        sheet.write(current_row, 7, g["job_name"])
+        sheet.write(current_row, 8, g["activity_name"])
+        sheet.write(current_row, 9, g["proj_name_no"])
+        sheet.write(current_row, 10, g["budget_area"])
+        sheet.write(current_row, 11, g["project_sponsor"])
+        sheet.write(current_row, 12, g["regional_specific_info"])
+        sheet.write(current_row, 13, g["service_priority_id"])
+        sheet.write(current_row, 14, g["annual_wp_info"])
+        sheet.write(current_row, 15, g["mpra_category"])
+        sheet.write(current_row, 16, g["ytd_actual"])
+        sheet.write(current_row, 17, g["fy_budget"])
 
     # Insert the footer row formulae and '#END OF INPUT'
     sheet.write(current_row + 2, 0, "#END OF INPUT")
@@ -73,6 +100,9 @@ def service_priority_report(workbook, gl, ibm, nc_sp, pvs_sp, fm_sp):
 
 
 def data_amend_report(workbook, gl, ibm, nc_sp, pvs_sp, fm_sp, ibm_filtered):
+    """Sheet 1 has one row per codeID of the `gl` queryset having a matching IBMData object in the `ibm` queryset,
+    read in a single (streamed) query (see ibm_data_rows). Sheet 3 has the lookup values of `ibm_filtered`.
+    """
     # Sheet 1
     sheet = workbook.get_sheet(0)
 
@@ -87,43 +117,33 @@ def data_amend_report(workbook, gl, ibm, nc_sp, pvs_sp, fm_sp, ibm_filtered):
     pad4.num_format_str = "0000"
 
     current_row = 3
-    code_id = ""
-    for _, data in enumerate(gl, current_row):
-        # Only insert GLPivDownload objects with a matching IBMData object.
-        if ibm.filter(ibmIdentifier=data.codeID).exists():
-            # We have to aggregate all the GLPivotDownload objects with
-            # matching codeID values, and insert one row with total
-            # ytdActual and fyBudget values.
-            if code_id != data.codeID:  # Reached the next codeID value.
-                current_row += 1  # Advance one row.
-                code_id = data.codeID
-                i = ibm.get(ibmIdentifier=data.codeID)
-                sheet.write(current_row, 0, data.codeID)
-                sheet.write(current_row, 1, int(data.costCentre), pad3)
-                sheet.write(current_row, 2, data.account, pad2)
-                sheet.write(current_row, 3, data.service, pad2)
-                sheet.write(current_row, 4, data.activity, pad3)
-                try:
-                    sheet.write(current_row, 5, int(data.project), pad4)
-                except ValueError:
-                    sheet.write(current_row, 5, data.project, pad4)
-                try:
-                    sheet.write(current_row, 6, int(data.job), pad3)
-                except ValueError:
-                    sheet.write(current_row, 6, data.job, pad3)
-                sheet.write(current_row, 7, data.jobName)
-                sheet.write(current_row, 8, data.activityName)
-                sheet.write(current_row, 9, data.projNameNo)
-                sheet.write(current_row, 10, i.budgetArea)
-                sheet.write(current_row, 11, i.projectSponsor)
-                sheet.write(current_row, 14, i.regionalSpecificInfo)
-                sheet.write(current_row, 15, i.servicePriorityID)
-                sheet.write(current_row, 18, i.annualWPInfo)
-                sheet.write(current_row, 19, data.mPRACategory)
-                ytd = gl.filter(codeID=code_id).aggregate(Sum("ytdActual"))
-                fy = gl.filter(codeID=code_id).aggregate(Sum("fybudget"))
-                sheet.write(current_row, 20, ytd["ytdActual__sum"])
-                sheet.write(current_row, 21, fy["fybudget__sum"])
+    # Each row has the total ytdActual and fyBudget values of the codeID's GLPivDownload objects.
+    for g in ibm_data_rows(gl, ibm).iterator():
+        current_row += 1  # Advance one row.
+        sheet.write(current_row, 0, g["codeID"])
+        sheet.write(current_row, 1, int(g["cost_centre"]), pad3)
+        sheet.write(current_row, 2, g["account_no"], pad2)
+        sheet.write(current_row, 3, g["service_no"], pad2)
+        sheet.write(current_row, 4, g["activity_code"], pad3)
+        try:
+            sheet.write(current_row, 5, int(g["project_code"]), pad4)
+        except ValueError:
+            sheet.write(current_row, 5, g["project_code"], pad4)
+        try:
+            sheet.write(current_row, 6, int(g["job_code"]), pad3)
+        except ValueError:
+            sheet.write(current_row, 6, g["job_code"], pad3)
+        sheet.write(current_row, 7, g["job_name"])
+        sheet.write(current_row, 8, g["activity_name"])
+        sheet.write(current_row, 9, g["proj_name_no"])
+        sheet.write(current_row, 10, g["budget_area"])
+        sheet.write(current_row, 11, g["project_sponsor"])
+        sheet.write(current_row, 14, g["regional_specific_info"])
+        sheet.write(current_row, 15, g["service_priority_id"])
+        sheet.write(current_row, 18, g["annual_wp_info"])
+        sheet.write(current_row, 19, g["mpra_category"])
+        sheet.write(current_row, 20, g["ytd_actual"])
+        sheet.write(current_row, 21, g["fy_budget"])
 
     # Insert the footer row formulae and '#END OF INPUT'
     sheet.write(current_row + 2, 0, "#END OF INPUT")
@@ -138,30 +158,82 @@ def data_amend_report(workbook, gl, ibm, nc_sp, pvs_sp, fm_sp, ibm_filtered):
     # This is a list of unique budgetArea and projectSponsor values, written in
     # as reference data for macros.
     sheet = workbook.get_sheet(2)
-    write_budget_areas(sheet, ibm_filtered)
-    write_project_sponsors(sheet, ibm_filtered)
-    write_regional_spec_info(sheet, ibm_filtered)
+    write_ibm_lookups(sheet, ibm_filtered.values_list(*IBM_LOOKUP_FIELDS))
 
     # Select the first sheet.
     sheet = workbook.get_sheet(0)
 
 
-def code_update_report(workbook_ro, workbook, gl, gl_codeids, nc_sp, pvs_sp, fm_sp, ibm):
-    """This report reads from the readonly workbook in order to perform some cell processing."""
-    # Sheet 1
-    sheet = workbook.get_sheet(0)
-    sheet_ro = workbook_ro.get_sheet(0)
+def code_id_values():
+    """Return the aggregates of the common values of a codeID's GLPivDownload objects, for a queryset grouped by
+    codeID (the values are the same for every record of a codeID, other than the names).
+    """
+    return {
+        "cost_centre": Min("costCentre"),
+        "account_no": Min("account"),
+        "service_no": Min("service"),
+        "activity_code": Min("activity"),
+        "project_code": Min("project"),
+        "job_code": Min("job"),
+        "job_name": Min("jobName"),
+        "activity_name": Min("activityName"),
+        "proj_name_no": Min("projNameNo"),
+        "mpra_category": Min("mPRACategory"),
+    }
+
+
+def ibm_data_rows(gl, ibm):
+    """From querysets of GLPivDownload and IBMData objects, return a queryset of one dict per codeID (ordered by
+    codeID) of the GLPivDownload objects linked to an object of `ibm`, having the common values of the codeID's
+    records, the values of the linked IBMData object and the total ytdActual and fybudget of the records. The records
+    are grouped and joined to IBMData in a single query.
+    """
+    return (
+        gl.filter(ibmdata__in=ibm)
+        .order_by()
+        .values("codeID")
+        .annotate(
+            **code_id_values(),
+            budget_area=Min("ibmdata__budgetArea"),
+            project_sponsor=Min("ibmdata__projectSponsor"),
+            regional_specific_info=Min("ibmdata__regionalSpecificInfo"),
+            service_priority_id=Min("ibmdata__servicePriorityID"),
+            annual_wp_info=Min("ibmdata__annualWPInfo"),
+            ytd_actual=Sum("ytdActual"),
+            fy_budget=Sum("fybudget"),
+        )
+        .order_by("codeID")
+    )
 
-    # Download hyperlink:
-    bigfont = easyxf("font: bold 1,height 360;")  # Font height is in "twips" (1/20 of a point)
-    url = Formula('HYPERLINK("{}")'.format(settings.IBM_CODE_UPDATER_URI))
-    sheet.write(1, 0, url, bigfont)
 
-    # Padded zeroes number format
-    pad2, pad3, pad4 = XFStyle(), XFStyle(), XFStyle()
-    pad2.num_format_str = "00"
-    pad3.num_format_str = "000"
-    pad4.num_format_str = "0000"
+def code_update_rows(gl, resource_column_indexes, other_column):
+    """From a queryset of GLPivDownload objects, return a queryset of one dict per codeID (ordered by codeID) having
+    the common values of the codeID's records and the total ytdActual of each resource column, keyed by the column
+    index (resources having no column of their own are totalled in `other_column`). The records are grouped and the
+    resources pivoted into columns in a single query, using conditional aggregation.
+    """
+    filters = {}
+    for resource, column in resource_column_indexes.items():
+        filters[column] = filters.get(column, Q()) | Q(resource=resource)
+    other = ~Q(resource__in=list(resource_column_indexes))
+    filters[other_column] = filters[other_column] | other if other_column in filters else other
+
+    return (
+        gl.order_by()
+        .values("codeID")
+        .annotate(
+            **code_id_values(),
+            **{f"resource_{column}": Sum("ytdActual", filter=q) for column, q in filters.items()},
+        )
+        .order_by("codeID")
+    )
+
+
+def code_update_template_columns(workbook_ro):
+    """Read the resource column headings of the code update template (read-only) workbook, returning a tuple of the
+    maximum column index and a dict of resource number: column index.
+    """
+    sheet_ro = workbook_ro.sheet_by_index(0)
 
     # Find the maximum column index in the template headers (row 4).
     max_col_idx = 21  # Start at column V.
@@ -175,49 +247,112 @@ def code_update_report(workbook_ro, workbook, gl, gl_codeids, nc_sp, pvs_sp, fm_
     # Create a dict of the resource column headings and their column numbers by reading in
     # row 3 of the output spreadsheet.
     resource_column_indexes = {}
-    resource_column_start = 21  # Column V, '0000'
-    for i in range(resource_column_start, max_col_idx + 1):
+    for i in range(21, max_col_idx + 1):  # From column V, '0000'
         if sheet_ro.cell_value(3, i):
             resource_column_indexes[int(sheet_ro.cell_value(3, i))] = i
 
+    return max_col_idx, resource_column_indexes
+
+
+def code_update_exceptions(gl, ibm, report_type=None, cost_centre=None):
+    """Filter a queryset of GLPivDownload objects to the exceptions written to the code update report: records having
+    a codeID which matches no IBMData object's ibmIdentifier in the passed-in `ibm` queryset (an anti-join).
+    Superusers must specify a `report_type` ("dj0" for DJ0 activities only, or "no-dj0"); otherwise the business rules
+    for normal users are applied (`cost_centre` is the cost centre that `gl` is limited to, if any).
+    """
+    # Filter GLPivot to resource < 4000
+    gl = gl.filter(resource__lt=4000)
+
+    # Exclude service 11 from GLPivDownload queryset.
+    gl = gl.exclude(service=11)
+
+    # Business rule: for normal users, include any line items that are
+    # activity 'DJ0', EXCEPT where service is 42, 43 or 75.
+    # For superusers, do the opposite (include activity DJ0 items ONLY if
+    # service is 42, 43 or 75).
+    if report_type == "dj0":
+        gl = gl.filter(activity="DJ0")
+        gl = gl.filter(service__in=[42, 43, 75])
+        gl = gl.filter(account__in=[1, 2, 4, 42])
+    elif report_type:  # Non-DJ0.
+        gl = gl.exclude(activity="DJ0")
+        gl = gl.filter(account__in=[1, 2, 42])
+    else:
+        # Business rule: for CC 531 only, include accounts 1, 2, 6 & 42.
+        if cost_centre and cost_centre == "531":
+            gl = gl.filter(account__in=[1, 2, 6, 42])
+        else:
+            gl = gl.filter(account__in=[1, 2, 42])
+        gl = gl.exclude(activity="DJ0", service__in=[42, 43, 75])
+
+    # Filter by codeID: EXCLUDE objects with a codeID that matches any
+    # IBMData object's ibmIdentifier (an anti-join).
+    return gl.exclude(Exists(ibm.filter(ibmIdentifier=OuterRef("codeID"))))
+
+
+def code_update_report(template, workbook, gl, nc_sp, pvs_sp, fm_sp, ibm):
+    """This report uses the resource columns read from the template (an ExcelTemplate) in order to perform some cell
+    processing. Sheet 1 has one row per codeID of the `gl` queryset, read in a single (streamed) query.
+    """
+    # The template resource columns are read once per process, and cached with the template.
+    _, resource_column_indexes = template.metadata("resource_columns", code_update_template_columns)
+    rows = code_update_rows(gl, resource_column_indexes, CODE_UPDATE_RESOURCE_COLUMN).iterator()
+    write_code_update_workbook(template, workbook, rows, nc_sp, pvs_sp, fm_sp, ibm.values_list(*IBM_LOOKUP_FIELDS))
+
+
+def write_code_update_workbook(template, workbook, rows, nc_sp, pvs_sp, fm_sp, ibm_values):
+    """Write the code update report to the workbook (a copy of the template) from `rows` (see code_update_rows) and
+    the lookup values of IBMData objects (see write_ibm_lookups). This function makes no queries of its own.
+    """
+    # Sheet 1
+    sheet = workbook.get_sheet(0)
+
+    # Download hyperlink:
+    bigfont = easyxf("font: bold 1,height 360;")  # Font height is in "twips" (1/20 of a point)
+    url = Formula('HYPERLINK("{}")'.format(settings.IBM_CODE_UPDATER_URI))
+    sheet.write(1, 0, url, bigfont)
+
+    # Padded zeroes number format
+    pad2, pad3, pad4 = XFStyle(), XFStyle(), XFStyle()
+    pad2.num_format_str = "00"
+    pad3.num_format_str = "000"
+    pad4.num_format_str = "0000"
+
+    max_col_idx, resource_column_indexes = template.metadata("resource_columns", code_update_template_columns)
+
     # Start inserting GL codes at row 4.
     row = 4
+    resource_columns = sorted(set(resource_column_indexes.values()) | {CODE_UPDATE_RESOURCE_COLUMN})
 
-    for _, code_id in enumerate(gl_codeids, start=1):
-        # For each of the GL code IDs, take a subset of the query and insert values as required.
-        gl_pivs = gl.filter(codeID=code_id)
-        g = gl_pivs.first()  # Use the first GL code to write common values.
-
+    # Each row has the totals of its resources pivoted into the matching resource columns (see code_update_rows).
+    # Resources without a matching column are totalled in the '0000' column (the first).
+    for g in rows:
         # Fill the non-resource columns.
-        sheet.write(row, 0, g.codeID)
-        sheet.write(row, 1, int(g.costCentre), pad3)
-        sheet.write(row, 2, g.account, pad2)
-        sheet.write(row, 3, g.service, pad2)
-        sheet.write(row, 4, g.activity, pad3)
+        sheet.write(row, 0, g["codeID"])
+        sheet.write(row, 1, int(g["cost_centre"]), pad3)
+        sheet.write(row, 2, g["account_no"], pad2)
+        sheet.write(row, 3, g["service_no"], pad2)
+        sheet.write(row, 4, g["activity_code"], pad3)
         try:
-            sheet.write(row, 5, int(g.project), pad4)
+            sheet.write(row, 5, int(g["project_code"]), pad4)
         except ValueError:
-            sheet.write(row, 5, g.project, pad4)
+            sheet.write(row, 5, g["project_code"], pad4)
         try:
-            sheet.write(row, 6, int(g.job), pad3)
+            sheet.write(row, 6, int(g["job_code"]), pad3)
         except ValueError:
-            sheet.write(row, 6, g.job, pad3)
-        sheet.write(row, 7, g.jobName)
-        sheet.write(row, 8, g.activityName)
-        sheet.write(row, 9, g.projNameNo)
-        sheet.write(row, 19, g.mPRACategory)
+            sheet.write(row, 6, g["job_code"], pad3)
+        sheet.write(row, 7, g["job_name"])
+        sheet.write(row, 8, g["activity_name"])
+        sheet.write(row, 9, g["proj_name_no"])
+        sheet.write(row, 19, g["mpra_category"])
 
         # Write the SUM formula.
         sheet.write(row, 20, Formula("ROUND(SUM(V{}:GP{}), 0)".format(row + 1, row + 1)))
 
-        # Write ytdActual values for matching resource columns (use the dict created earlier).
-        # Use the column index of a matching resource code.
-        # If no match found, use the '0000' column (the first).
-        for gl_piv in gl_pivs:
-            if gl_piv.resource in resource_column_indexes:
-                sheet.write(row, resource_column_indexes[gl_piv.resource], gl_piv.ytdActual)
-            else:
-                sheet.write(row, resource_column_start, gl_piv.ytdActual)
+        # Write the ytdActual total of each resource column having records.
+        for column in resource_columns:
+            if g[f"resource_{column}"] is not None:
+                sheet.write(row, column, g[f"resource_{column}"])
 
         row += 1  # Advance one row, to the next Code ID.
 
@@ -237,15 +372,93 @@ def code_update_report(workbook_ro, workbook, gl, gl_codeids, nc_sp, pvs_sp, fm_
     # This is a list of unique budgetArea and projectSponsor values, written in
     # as reference data for macros.
     sheet = workbook.get_sheet(2)
-    write_budget_areas(sheet, ibm)
-    write_project_sponsors(sheet, ibm)
-    write_regional_spec_info(sheet, ibm)
+    write_ibm_lookups(sheet, ibm_values)
 
     # Select the first sheet.
     sheet = workbook.get_sheet(0)
 
 
+def render_code_update_workbook(rows, ibm_values, nc_sp, pvs_sp, fm_sp) -> bytes:
+    """Render a code update workbook from prefetched data (see code_update_workbooks), returning the .xls file
+    content. No queries are made, so the workbook may be rendered in a worker process.
+    """
+    template = get_excel_template(CODE_UPDATE_TEMPLATE)
+    workbook = template.workbook()
+    write_code_update_workbook(template, workbook, rows, nc_sp, pvs_sp, fm_sp, ibm_values)
+    content = BytesIO()
+    workbook.save(content)
+    return content.getvalue()
+
+
+def code_update_batch_data(gl, ibm) -> Dict[str, Tuple[list, list]]:
+    """From querysets of (exception) GLPivDownload objects and IBMData objects, fetch the code update rows and IBMData
+    lookup values of every cost centre having exceptions in one query each, returning a dict of cost centre:
+    (rows, IBMData lookup values) ordered by cost centre.
+    """
+    _, resource_column_indexes = get_excel_template(CODE_UPDATE_TEMPLATE).metadata("resource_columns", code_update_template_columns)
+    rows = defaultdict(list)
+    for row in code_update_rows(gl, resource_column_indexes, CODE_UPDATE_RESOURCE_COLUMN).iterator():
+        rows[row["cost_centre"]].append(row)
+    ibm_values = defaultdict(list)
+    for values in ibm.filter(costCentre__in=list(rows)).values_list(*IBM_LOOKUP_FIELDS).iterator():
+        ibm_values[values[0]].append(values)
+    return {cost_centre: (rows[cost_centre], ibm_values[cost_centre]) for cost_centre in sorted(rows)}
+
+
+def code_update_workbooks(batch_data, nc_sp, pvs_sp, fm_sp, processes=1) -> Iterator[Tuple[str, bytes]]:
+    """Render a code update workbook for each cost centre of the prefetched `batch_data` (see code_update_batch_data),
+    yielding (cost centre, .xls file content) in order. Rendering is CPU-bound, so if `processes` is greater than 1
+    the workbooks are rendered by a pool of that many forked worker processes (which inherit the parsed template).
+    """
+    render = partial(render_code_update_workbook, nc_sp=list(nc_sp), pvs_sp=list(pvs_sp), fm_sp=list(fm_sp))
+    cost_centres = list(batch_data)
+    if processes <= 1 or len(cost_centres) <= 1:
+        for cost_centre in cost_centres:
+            yield cost_centre, render(*batch_data[cost_centre])
+        return
+
+    # Forked processes must not share the parent's database connections.
+    connections.close_all()
+    chunksize = max(1, len(cost_centres) // (processes * 4))
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("fork")) as executor:
+        rows, ibm_values = zip(*batch_data.values())
+        yield from zip(cost_centres, executor.map(render, rows, ibm_values, chunksize=chunksize))
+
+
+class WorkbookRowLimitError(ValueError):
+    """Raised when a report has more rows than a worksheet of an .xls workbook can hold."""
+
+    def __init__(self, sheet_name, rows):
+        self.sheet_name = sheet_name
+        self.rows = rows
+        super().__init__(f"{sheet_name} has more than the {XLS_MAX_ROWS} rows that an .xls worksheet can hold")
+
+
+def check_row_limit(sheet, row):
+    """Raise WorkbookRowLimitError if `row` is past the last row of an .xls worksheet."""
+    if row >= XLS_MAX_ROWS:
+        raise WorkbookRowLimitError(sheet.name, row)
+
+
+def reload_jobs(gl):
+    """From a queryset of GLPivDownload objects, return a queryset of the distinct (job, jobName, job number) values,
+    sorted in the database: numeric jobs first (by number), then other jobs (by job and name). The job number is
+    None for non-numeric jobs.
+    """
+    return (
+        gl.order_by()
+        .annotate(job_number=Case(When(job__regex=r"^[0-9]+$", then=Cast("job", BigIntegerField())), default=None))
+        .values_list("job", "jobName", "job_number")
+        .distinct()
+        .order_by(F("job_number").asc(nulls_last=True), "job", "jobName")
+    )
+
+
 def reload_report(workbook, ibm, nc_sp, pvs_sp, fm_sp, gl):
+    """Write the IBMData reload template. IBMData rows are streamed from the database, and the GL code and job
+    lookup sheets are written from distinct values which are sorted in the database (see reload_jobs).
+    Raises WorkbookRowLimitError if a sheet has more rows than an .xls worksheet can hold.
+    """
     # IBMData sheet
     sheet = workbook.get_sheet(0)
     # Define cell styles
@@ -259,7 +472,8 @@ def reload_report(workbook, ibm, nc_sp, pvs_sp, fm_sp, gl):
     # Download hyperlink:
     sheet.write(1, 0, Formula('HYPERLINK("{}")'.format(settings.IBM_RELOAD_URI)))
     # Insert data:
-    for row, data in enumerate(ibm, 3):
+    for row, data in enumerate(ibm.values_list(*RELOAD_IBM_FIELDS, named=True).iterator(), 3):
+        check_row_limit(sheet, row)
         sheet.write(row, 0, int(data.costCentre), pad3)
         sheet.write(row, 1, data.account, pad2)
         sheet.write(row, 2, data.service, pad2)
@@ -290,90 +504,38 @@ def reload_report(workbook, ibm, nc_sp, pvs_sp, fm_sp, gl):
 
     # Sheet 3 - GL Codes sheet
     sheet = workbook.get_sheet(2)
-
-    for row, data in enumerate(gl):
-        sheet.write(row, 0, data.gLCode)
-        sheet.write(row, 1, data.shortCode)
-        sheet.write(row, 2, data.shortCodeName)
+    gl_codes = gl.order_by("gLCode", "shortCode", "shortCodeName").values_list("gLCode", "shortCode", "shortCodeName").distinct()
+    for row, (gl_code, short_code, short_code_name) in enumerate(gl_codes.iterator()):
+        check_row_limit(sheet, row)
+        sheet.write(row, 0, gl_code)
+        sheet.write(row, 1, short_code)
+        sheet.write(row, 2, short_code_name)
 
     sheet.col(0).width = 7500
     sheet.col(2).width = 12500
 
-    # Sheet 4 - Job and Job name
+    # Sheet 4 - Job and Job name, with numeric jobs first.
     sheet = workbook.get_sheet(3)
-
-    jobs = []
-    job_names = []
-    job_dict = {}
-    job_no_num_dict = {}
-    current_row = 0
-    for row, data in enumerate(gl):
-        if data.job not in jobs or data.jobName not in job_names:
-            # sheet.write(current_row, 0, data.job)
-            # sheet.write(current_row, 1, data.jobName)
-            if data.job.isdigit():
-                job = {"job": int(data.job), "jobName": data.jobName}
-                job_dict[current_row] = job
-            else:
-                job = {"job": data.job, "jobName": data.jobName}
-                job_no_num_dict[current_row] = job
-            jobs.append(data.job)
-            job_names.append(data.jobName)
-            current_row += 1
-        else:
-            pass
-    current_row = 0
-    for s in sorted(job_dict.items(), key=lambda k_v: k_v[1]["job"]):
-        sheet.write(current_row, 0, str(s[1]["job"]))
-        sheet.write(current_row, 1, s[1]["jobName"])
-        current_row += 1
-
-    for s in sorted(job_no_num_dict.items(), key=lambda k_v: k_v[1]["job"]):
-        sheet.write(current_row, 0, s[1]["job"])
-        sheet.write(current_row, 1, s[1]["jobName"])
-        current_row += 1
+    for row, (job, job_name, job_number) in enumerate(reload_jobs(gl).iterator()):
+        check_row_limit(sheet, row)
+        sheet.write(row, 0, str(job_number) if job_number is not None else job)
+        sheet.write(row, 1, job_name)
 
     sheet.col(1).width = 10000
     workbook.active_sheet = 0
 
 
-def write_budget_areas(sheet, ibm):
-    """From a queryset of IBMData objects, write unique budgetArea values
-    to the passed-in worksheet.
-    """
-    row = 1  # Skip the header row
-    budget_areas = sorted(set(ibm.values_list("budgetArea", "costCentre")))
-    for i in budget_areas:
-        if i[0]:  # Non-blank only.
-            sheet.write(row, 0, i[0])
-            sheet.write(row, 1, i[1])
-            row += 1
-
-
-def write_project_sponsors(sheet, ibm):
-    """From a queryset of IBMData objects, write unique projectSponsor values
-    to the passed-in worksheet.
+def write_ibm_lookups(sheet, ibm_values):
+    """From the lookup values of IBMData objects (tuples of IBM_LOOKUP_FIELDS), write the unique non-blank
+    budgetArea, projectSponsor and regionalSpecificInfo values (each with its cost centre) to the passed-in worksheet.
     """
-    row = 1  # Skip the header row
-    sponsors = sorted(set(ibm.values_list("projectSponsor", "costCentre")))
-    for i in sponsors:
-        if i[0]:  # Non-blank only.
-            sheet.write(row, 2, i[0])
-            sheet.write(row, 3, i[1])
-            row += 1
-
-
-def write_regional_spec_info(sheet, ibm):
-    """From a queryset of IBMData objects, write unique regionalSpecificInfo values
-    to the passed-in worksheet.
-    """
-    row = 1  # Skip the header row
-    reg_info = sorted(set(ibm.values_list("regionalSpecificInfo", "costCentre")))
-    for i in reg_info:
-        if i[0]:  # Non-blank only.
-            sheet.write(row, 4, i[0])
-            sheet.write(row, 5, i[1])
-            row += 1
+    for index, column in ((1, 0), (2, 2), (3, 4)):
+        row = 1  # Skip the header row
+        for value, cost_centre in sorted({(values[index], values[0]) for values in ibm_values}):
+            if value:  # Non-blank only.
+                sheet.write(row, column, value)
+                sheet.write(row, column + 1, cost_centre)
+                row += 1
 
 
 def write_service_priorities(sheet, nc_sp, pvs_sp, fm_sp):
@@ -430,201 +592,136 @@ def write_service_priorities(sheet, nc_sp, pvs_sp, fm_sp):
         row += 1
 
 
-class _Echo:
-    """A pseudo-buffer that implements the write interface expected by csv.writer, returning each value rather than storing it."""
-
-    def write(self, value):
+def _service_priority_attr(path: str) -> Callable:
+    """Return a getter for a dotted attribute path of a service priority object (e.g. "strategic_plan.aimNo"), which
+    returns "" if a related object on the path is None.
+    """
+    attrs = path.split(".")
+
+    def getter(service_priority):
+        value = service_priority
+        for attr in attrs:
+            if value is None:
+                return ""
+            value = getattr(value, attr)
         return value
 
-
-def download_report(glpiv_qs, enhanced=False, dept_programs=False):
-    """Generator that yields CSV-formatted rows for the download reports.
-
-    Intended to be consumed by StreamingHttpResponse so that rows are sent
-    to the client incrementally rather than buffering the entire CSV in memory.
+    return getter
+
+
+# Download report variants (see download_report).
+DOWNLOAD = "download"
+DOWNLOAD_ENHANCED = "enhanced"
+DOWNLOAD_DEPT_PROGRAMS = "dept_programs"
+DOWNLOAD_ALL = (DOWNLOAD, DOWNLOAD_ENHANCED, DOWNLOAD_DEPT_PROGRAMS)
+# download_report arguments of each variant.
+DOWNLOAD_VARIANTS = {
+    DOWNLOAD: {},
+    DOWNLOAD_ENHANCED: {"enhanced": True},
+    DOWNLOAD_DEPT_PROGRAMS: {"enhanced": True, "dept_programs": True},
+}
+# Columns of the download reports, in order: (header, source, variants). A string source is a GLPivDownload field path
+# read with values_list (related fields are None where the GLPivDownload object has no IBMData or DepartmentProgram
+# link). A callable source is passed the service priority object linked to the row's IBMData object, and is called
+# once per service priority rather than once per row; the column is blank if there is no service priority.
+DOWNLOAD_COLUMNS = (
+    ("IBMS ID", "codeID", DOWNLOAD_ALL),
+    ("Financial Year", "fy", DOWNLOAD_ALL),
+    ("Download Period", "downloadPeriod", DOWNLOAD_ALL),
+    ("Cost Centre", "costCentre", DOWNLOAD_ALL),
+    ("Account", "account", DOWNLOAD_ALL),
+    ("Service", "service", DOWNLOAD_ALL),
+    ("Activity", "activity", DOWNLOAD_ALL),
+    ("Resource", "resource", DOWNLOAD_ALL),
+    ("Project", "project", DOWNLOAD_ALL),
+    ("Job", "job", DOWNLOAD_ALL),
+    ("Short Code", "shortCode", DOWNLOAD_ALL),
+    ("Short Code Name", "shortCodeName", DOWNLOAD_ALL),
+    ("GL Code", "gLCode", DOWNLOAD_ALL),
+    ("ptd Actual", "ptdActual", DOWNLOAD_ALL),
+    ("ptd Budget", "ptdBudget", (DOWNLOAD,)),
+    ("ytd Actual", "ytdActual", DOWNLOAD_ALL),
+    ("ytd Budget", "ytdBudget", DOWNLOAD_ALL),
+    ("fy Budget", "fybudget", DOWNLOAD_ALL),
+    ("ytd Variance", "ytdVariance", (DOWNLOAD,)),
+    ("cc Name", "ccName", DOWNLOAD_ALL),
+    ("Service Name", "serviceName", DOWNLOAD_ALL),
+    ("Job Name", "jobName", DOWNLOAD_ALL),
+    ("Res Name No", "resNameNo", DOWNLOAD_ALL),
+    ("Act Name No", "actNameNo", DOWNLOAD_ALL),
+    ("Proj Name No", "projNameNo", DOWNLOAD_ALL),
+    ("Region/Branch", "regionBranch", DOWNLOAD_ALL),
+    ("Division", "division", DOWNLOAD_ALL),
+    ("Resource Category", "resourceCategory", DOWNLOAD_ALL),
+    ("Wildfire", "wildfire", DOWNLOAD_ALL),
+    ("Expense Revenue", "expenseRevenue", DOWNLOAD_ALL),
+    ("Fire Activities", "fireActivities", DOWNLOAD_ALL),
+    ("mPRACategory", "mPRACategory", DOWNLOAD_ALL),
+    ("Budget Area", "ibmdata__budgetArea", DOWNLOAD_ALL),
+    ("Project Sponsor", "ibmdata__projectSponsor", DOWNLOAD_ALL),
+    ("Corporate Strategy No", _service_priority_attr("corporate_strategy.corporateStrategyNo"), DOWNLOAD_ALL),
+    ("Strategic Plan No", _service_priority_attr("strategic_plan.strategicPlanNo"), DOWNLOAD_ALL),
+    ("Regional Specific Info", "ibmdata__regionalSpecificInfo", DOWNLOAD_ALL),
+    ("Service Priority No", "ibmdata__servicePriorityID", DOWNLOAD_ALL),
+    ("Annual Works Plan", "ibmdata__annualWPInfo", DOWNLOAD_ALL),
+    ("Corp Strategy Description 1", _service_priority_attr("corporate_strategy.description1"), DOWNLOAD_ALL),
+    ("Corp Strategy Description 2", _service_priority_attr("corporate_strategy.description2"), DOWNLOAD_ALL),
+    ("Nat Cons Strategic Direction No", _service_priority_attr("strategic_plan.directionNo"), DOWNLOAD_ALL),
+    ("Nat Cons Strat Direction Desc", _service_priority_attr("strategic_plan.direction"), DOWNLOAD_ALL),
+    ("Nat Cons Strat Plan Aim No", _service_priority_attr("strategic_plan.aimNo"), DOWNLOAD_ALL),
+    ("Nat Cons Strat Plan Aim Desc 1", _service_priority_attr("strategic_plan.aim1"), DOWNLOAD_ALL),
+    ("Nat Cons Strat Plan Aim Desc 2", _service_priority_attr("strategic_plan.aim2"), DOWNLOAD_ALL),
+    ("Nat Cons Strat Plan Action No", _service_priority_attr("strategic_plan.actionNo"), DOWNLOAD_ALL),
+    ("Nat Cons Strat Plan Action Description", _service_priority_attr("strategic_plan.action"), DOWNLOAD_ALL),
+    ("Service Priority Description 1", methodcaller("get_d1"), DOWNLOAD_ALL),
+    ("Service Priority Description 2", methodcaller("get_d2"), DOWNLOAD_ALL),
+    ("Priority Action No", "ibmdata__priorityActionNo", (DOWNLOAD_ENHANCED, DOWNLOAD_DEPT_PROGRAMS)),
+    ("Priority Level", "ibmdata__priorityLevel", (DOWNLOAD_ENHANCED, DOWNLOAD_DEPT_PROGRAMS)),
+    ("Marine KPI", "ibmdata__marineKPI", (DOWNLOAD_ENHANCED, DOWNLOAD_DEPT_PROGRAMS)),
+    ("Region Project", "ibmdata__regionProject", (DOWNLOAD_ENHANCED, DOWNLOAD_DEPT_PROGRAMS)),
+    ("Region Description", "ibmdata__regionDescription", (DOWNLOAD_ENHANCED, DOWNLOAD_DEPT_PROGRAMS)),
+    ("Dept Program 1", "department_program__dept_program1", (DOWNLOAD_DEPT_PROGRAMS,)),
+    ("Dept Program 2", "department_program__dept_program2", (DOWNLOAD_DEPT_PROGRAMS,)),
+    ("Dept Program 3", "department_program__dept_program3", (DOWNLOAD_DEPT_PROGRAMS,)),
+)
+
+
+class DownloadLayout(NamedTuple):
+    """The compiled columns of a download report variant (see download_layout)."""
+
+    headers: Tuple[str, ...]
+    fields: Tuple[str, ...]  # values_list fields; the last is always "ibmdata_id".
+    service_priority_getters: Tuple[Callable, ...]
+    row_getter: Callable
+
+
+@cache
+def download_layout(variant: str) -> DownloadLayout:
+    """Compile the DOWNLOAD_COLUMNS of a download report variant. Each output row is taken from a values_list row
+    with the service priority values of its IBMData object appended, using a single itemgetter.
     """
-    writer = csv.writer(_Echo())
-
-    # NOTE: the 'normal' and 'enhanced' download reports vary a little, with the enhanced report having two fewer columns.
-    download_report_headers = [
-        "IBMS ID",
-        "Financial Year",
-        "Download Period",
-        "Cost Centre",
-        "Account",
-        "Service",
-        "Activity",
-        "Resource",
-        "Project",
-        "Job",
-        "Short Code",
-        "Short Code Name",
-        "GL Code",
-        "ptd Actual",
-        "ptd Budget",  # Download report only
-        "ytd Actual",
-        "ytd Budget",
-        "fy Budget",
-        "ytd Variance",  # Download report only
-        "cc Name",
-        "Service Name",
-        "Job Name",
-        "Res Name No",
-        "Act Name No",
-        "Proj Name No",
-        "Region/Branch",
-        "Division",
-        "Resource Category",
-        "Wildfire",
-        "Expense Revenue",
-        "Fire Activities",
-        "mPRACategory",
-        "Budget Area",
-        "Project Sponsor",
-        "Corporate Strategy No",
-        "Strategic Plan No",
-        "Regional Specific Info",
-        "Service Priority No",
-        "Annual Works Plan",
-        "Corp Strategy Description 1",
-        "Corp Strategy Description 2",
-        "Nat Cons Strategic Direction No",
-        "Nat Cons Strat Direction Desc",
-        "Nat Cons Strat Plan Aim No",
-        "Nat Cons Strat Plan Aim Desc 1",
-        "Nat Cons Strat Plan Aim Desc 2",
-        "Nat Cons Strat Plan Action No",
-        "Nat Cons Strat Plan Action Description",
-        "Service Priority Description 1",
-        "Service Priority Description 2",
-    ]
-    enhanced_report_headers = [
-        "IBMS ID",
-        "Financial Year",
-        "Download Period",
-        "Cost Centre",
-        "Account",
-        "Service",
-        "Activity",
-        "Resource",
-        "Project",
-        "Job",
-        "Short Code",
-        "Short Code Name",
-        "GL Code",
-        "ptd Actual",
-        "ytd Actual",
-        "ytd Budget",
-        "fy Budget",
-        "cc Name",
-        "Service Name",
-        "Job Name",
-        "Res Name No",
-        "Act Name No",
-        "Proj Name No",
-        "Region/Branch",
-        "Division",
-        "Resource Category",
-        "Wildfire",
-        "Expense Revenue",
-        "Fire Activities",
-        "mPRACategory",
-        "Budget Area",
-        "Project Sponsor",
-        "Corporate Strategy No",
-        "Strategic Plan No",
-        "Regional Specific Info",
-        "Service Priority No",
-        "Annual Works Plan",
-        "Corp Strategy Description 1",
-        "Corp Strategy Description 2",
-        "Nat Cons Strategic Direction No",
-        "Nat Cons Strat Direction Desc",
-        "Nat Cons Strat Plan Aim No",
-        "Nat Cons Strat Plan Aim Desc 1",
-        "Nat Cons Strat Plan Aim Desc 2",
-        "Nat Cons Strat Plan Action No",
-        "Nat Cons Strat Plan Action Description",
-        "Service Priority Description 1",
-        "Service Priority Description 2",
-        "Priority Action No",
-        "Priority Level",
-        "Marine KPI",
-        "Region Project",
-        "Region Description",
-    ]
-    department_programs_headers = [
-        "Dept Program 1",
-        "Dept Program 2",
-        "Dept Program 3",
-    ]
-
-    # Yield the CSV header row.
-    if enhanced and dept_programs:
-        yield writer.writerow(enhanced_report_headers + department_programs_headers)
-    elif enhanced:
-        yield writer.writerow(enhanced_report_headers)
-    else:
-        yield writer.writerow(download_report_headers)
-
-    # Restrict the queryset to only the columns needed for the CSV output.
-    glpiv_qs = glpiv_qs.select_related("fy", "ibmdata", "department_program").only(
-        # GLPivDownload fields used in CSV rows
-        "codeID",
-        "fy__financialYear",
-        "downloadPeriod",
-        "costCentre",
-        "account",
-        "service",
-        "activity",
-        "resource",
-        "project",
-        "job",
-        "shortCode",
-        "shortCodeName",
-        "gLCode",
-        "ptdActual",
-        "ptdBudget",
-        "ytdActual",
-        "ytdBudget",
-        "fybudget",
-        "ytdVariance",
-        "ccName",
-        "serviceName",
-        "jobName",
-        "resNameNo",
-        "actNameNo",
-        "projNameNo",
-        "regionBranch",
-        "division",
-        "resourceCategory",
-        "wildfire",
-        "expenseRevenue",
-        "fireActivities",
-        "mPRACategory",
-        # IBMData: GFK fields needed for service priority cache lookup
-        "ibmdata__content_type_id",
-        "ibmdata__object_id",
-        # IBMData: data fields used in CSV rows
-        "ibmdata__budgetArea",
-        "ibmdata__projectSponsor",
-        "ibmdata__regionalSpecificInfo",
-        "ibmdata__servicePriorityID",
-        "ibmdata__annualWPInfo",
-        "ibmdata__priorityActionNo",
-        "ibmdata__priorityLevel",
-        "ibmdata__marineKPI",
-        "ibmdata__regionProject",
-        "ibmdata__regionDescription",
-        # DepartmentProgram fields used in CSV rows
-        "department_program__dept_program1",
-        "department_program__dept_program2",
-        "department_program__dept_program3",
+    columns = [(header, source) for header, source, variants in DOWNLOAD_COLUMNS if variant in variants]
+    fields = [source for _, source in columns if isinstance(source, str)] + ["ibmdata_id"]
+    service_priority_getters = [source for _, source in columns if callable(source)]
+    indexes = []
+    for _, source in columns:
+        if callable(source):
+            indexes.append(len(fields) + service_priority_getters.index(source))
+        else:
+            indexes.append(fields.index(source))
+    return DownloadLayout(
+        headers=tuple(header for header, _ in columns),
+        fields=tuple(fields),
+        service_priority_getters=tuple(service_priority_getters),
+        row_getter=itemgetter(*indexes),
     )
 
-    # Build the service priority cache using a lightweight values_list query so that the main
-    # queryset does not need to be fully evaluated into memory before row iteration begins.
-    ibmdata_gfk_rows = list(
+
+def download_service_priorities(glpiv_qs) -> Dict[int, object]:
+    """Return a dict of the service priority objects linked to the IBMData objects of the `glpiv_qs` queryset, keyed
+    by IBMData PK, reading each service priority model in one query.
+    """
+    ibmdata_gfk_rows = (
         glpiv_qs.exclude(ibmdata__isnull=True)
         .exclude(ibmdata__content_type_id__isnull=True)
         .exclude(ibmdata__object_id__isnull=True)
@@ -649,147 +746,72 @@ def download_report(glpiv_qs, enhanced=False, dept_programs=False):
         except Exception:
             pass
 
-    # Service priority cache dict keyed by ibmdata PK for lookup inside the row loop.
     ibmdata_to_sp: dict[int, object] = {}
-    for ibmdata_pk, (ct_id, obj_id) in ibmdata_pk_to_gfk.items():
-        sp = sp_cache.get((ct_id, obj_id))
+    for ibmdata_pk, gfk in ibmdata_pk_to_gfk.items():
+        sp = sp_cache.get(gfk)
         if sp is not None:
             ibmdata_to_sp[ibmdata_pk] = sp
+    return ibmdata_to_sp
 
-    # Use iterator() to stream rows from the database in chunks rather than loading
-    # all model instances into memory at once.
-    for glpiv in glpiv_qs.iterator(chunk_size=500):
-        # For each object, construct row content.
-        department_program = glpiv.department_program
-        ibmdata = glpiv.ibmdata
 
-        if ibmdata:
-            service_priority = ibmdata_to_sp.get(ibmdata.pk)
-        else:
-            service_priority = None
+def download_report(glpiv_qs, enhanced=False, dept_programs=False, chunk_size=None):
+    """Generator that yields CSV-formatted rows for the download reports.
 
-        if service_priority:
-            corporate_strategy = service_priority.corporate_strategy
-            strategic_plan = service_priority.strategic_plan
-        else:
-            corporate_strategy = None
-            strategic_plan = None
-
-        # Construct the row: either normal, enhanced, or enhanced + department programs
-        if enhanced:
-            row = [
-                glpiv.codeID,
-                glpiv.fy,
-                glpiv.downloadPeriod,
-                glpiv.costCentre,
-                glpiv.account,
-                glpiv.service,
-                glpiv.activity,
-                glpiv.resource,
-                glpiv.project,
-                glpiv.job,
-                glpiv.shortCode,
-                glpiv.shortCodeName,
-                glpiv.gLCode,
-                glpiv.ptdActual,
-                glpiv.ytdActual,
-                glpiv.ytdBudget,
-                glpiv.fybudget,
-                glpiv.ccName,
-                glpiv.serviceName,
-                glpiv.jobName,
-                glpiv.resNameNo,
-                glpiv.actNameNo,
-                glpiv.projNameNo,
-                glpiv.regionBranch,
-                glpiv.division,
-                glpiv.resourceCategory,
-                glpiv.wildfire,
-                glpiv.expenseRevenue,
-                glpiv.fireActivities,
-                glpiv.mPRACategory,
-                ibmdata.budgetArea if ibmdata else "",
-                ibmdata.projectSponsor if ibmdata else "",
-                corporate_strategy.corporateStrategyNo if corporate_strategy else "",
-                strategic_plan.strategicPlanNo if strategic_plan else "",
-                ibmdata.regionalSpecificInfo if ibmdata else "",
-                ibmdata.servicePriorityID if ibmdata else "",
-                ibmdata.annualWPInfo if ibmdata else "",
-                corporate_strategy.description1 if corporate_strategy else "",
-                corporate_strategy.description2 if corporate_strategy else "",
-                strategic_plan.directionNo if strategic_plan else "",
-                strategic_plan.direction if strategic_plan else "",
-                strategic_plan.aimNo if strategic_plan else "",
-                strategic_plan.aim1 if strategic_plan else "",
-                strategic_plan.aim2 if strategic_plan else "",
-                strategic_plan.actionNo if strategic_plan else "",
-                strategic_plan.action if strategic_plan else "",
-                service_priority.get_d1() if service_priority else "",
-                service_priority.get_d2() if service_priority else "",
-                ibmdata.priorityActionNo if ibmdata else "",
-                ibmdata.priorityLevel if ibmdata else "",
-                ibmdata.marineKPI if ibmdata else "",
-                ibmdata.regionProject if ibmdata else "",
-                ibmdata.regionDescription if ibmdata else "",
-            ]
-            if dept_programs:
-                row = row + [
-                    department_program.dept_program1 if department_program else "",
-                    department_program.dept_program2 if department_program else "",
-                    department_program.dept_program3 if department_program else "",
-                ]
-        else:
-            row = [
-                glpiv.codeID,
-                glpiv.fy,
-                glpiv.downloadPeriod,
-                glpiv.costCentre,
-                glpiv.account,
-                glpiv.service,
-                glpiv.activity,
-                glpiv.resource,
-                glpiv.project,
-                glpiv.job,
-                glpiv.shortCode,
-                glpiv.shortCodeName,
-                glpiv.gLCode,
-                glpiv.ptdActual,
-                glpiv.ptdBudget,
-                glpiv.ytdActual,
-                glpiv.ytdBudget,
-                glpiv.fybudget,
-                glpiv.ytdVariance,
-                glpiv.ccName,
-                glpiv.serviceName,
-                glpiv.jobName,
-                glpiv.resNameNo,
-                glpiv.actNameNo,
-                glpiv.projNameNo,
-                glpiv.regionBranch,
-                glpiv.division,
-                glpiv.resourceCategory,
-                glpiv.wildfire,
-                glpiv.expenseRevenue,
-                glpiv.fireActivities,
-                glpiv.mPRACategory,
-                ibmdata.budgetArea if ibmdata else "",
-                ibmdata.projectSponsor if ibmdata else "",
-                corporate_strategy.corporateStrategyNo if corporate_strategy else "",
-                strategic_plan.strategicPlanNo if strategic_plan else "",
-                ibmdata.regionalSpecificInfo if ibmdata else "",
-                ibmdata.servicePriorityID if ibmdata else "",
-                ibmdata.annualWPInfo if ibmdata else "",
-                corporate_strategy.description1 if corporate_strategy else "",
-                corporate_strategy.description2 if corporate_strategy else "",
-                strategic_plan.directionNo if strategic_plan else "",
-                strategic_plan.direction if strategic_plan else "",
-                strategic_plan.aimNo if strategic_plan else "",
-                strategic_plan.aim1 if strategic_plan else "",
-                strategic_plan.aim2 if strategic_plan else "",
-                strategic_plan.actionNo if strategic_plan else "",
-                strategic_plan.action if strategic_plan else "",
-                service_priority.get_d1() if service_priority else "",
-                service_priority.get_d2() if service_priority else "",
-            ]
-
-        yield writer.writerow(row)
+    Intended to be consumed by StreamingHttpResponse so that rows are sent
+    to the client incrementally rather than buffering the entire CSV in memory.
+    Rows are read as tuples from a server-side cursor, and mapped to the columns
+    of the report variant by the compiled layout (see download_layout).
+
+    The header row is yielded immediately, then rows are written to a buffer
+    which is yielded each time it holds at least `chunk_size` characters
+    (default: the DOWNLOAD_CHUNK_SIZE setting). A `chunk_size` of 0 yields
+    each row separately.
+    """
+    if chunk_size is None:
+        chunk_size = settings.DOWNLOAD_CHUNK_SIZE
+
+    # NOTE: the 'normal' and 'enhanced' download reports vary a little, with the enhanced report having two fewer columns.
+    if enhanced and dept_programs:
+        layout = download_layout(DOWNLOAD_DEPT_PROGRAMS)
+    elif enhanced:
+        layout = download_layout(DOWNLOAD_ENHANCED)
+    else:
+        layout = download_layout(DOWNLOAD)
+
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(layout.headers)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+
+    # Derive the service priority column values once per IBMData object, rather than once per row.
+    getters = layout.service_priority_getters
+    sp_values = {ibmdata_pk: tuple(getter(sp) for getter in getters) for ibmdata_pk, sp in download_service_priorities(glpiv_qs).items()}
+    no_sp_values = ("",) * len(getters)
+
+    row_getter = layout.row_getter
+    writerow = writer.writerow
+    for row in glpiv_qs.values_list(*layout.fields).iterator(chunk_size=2000):
+        writerow(row_getter(row + sp_values.get(row[-1], no_sp_values)))
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzip_report(chunks: Iterator[str], compresslevel: Optional[int] = None) -> Iterator[bytes]:
+    """Generator that compresses the str chunks of a streamed report (e.g. download_report) into a gzip stream,
+    yielding compressed bytes as they are produced so that the report is never held in memory. The default
+    `compresslevel` is the DOWNLOAD_GZIP_LEVEL setting.
+    """
+    if compresslevel is None:
+        compresslevel = settings.DOWNLOAD_GZIP_LEVEL
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, zlib.MAX_WBITS | 16)  # wbits 16+: gzip header and trailer
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
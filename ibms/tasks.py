@@ -1,13 +1,20 @@
+import json
 import logging
 import os
-from typing import Tuple
+import tempfile
+import zipfile
+from typing import Dict, Iterable, Optional, Tuple
 
-from azure.storage.blob import BlobServiceClient
+from azure.storage.blob import BlobClient, BlobServiceClient
 from django.conf import settings
-from django.contrib.auth.models import User
+from django.contrib.auth import get_user_model
 from django.core.mail import EmailMultiAlternatives
+from django.db.models import OuterRef
+from django.utils import timezone
+from django.utils.text import slugify
 from django_tasks import task
 
+from ibms.downloads import download_artifact_name, download_artifact_properties, store_download_artifact
 from ibms.models import (
     CorporateStrategy,
     DepartmentProgram,
@@ -16,84 +23,514 @@ from ibms.models import (
     GeneralServicePriority,
     GLPivDownload,
     IBMData,
+    ImportBatch,
+    ImportJob,
     NCServicePriority,
     NCStrategicPlan,
     PVSServicePriority,
+    ReportJob,
     ServicePriorityMapping,
     SFMServicePriority,
 )
-from ibms.utils import ibms_import_from_csv
+from ibms.reports import (
+    DOWNLOAD_VARIANTS,
+    code_update_batch_data,
+    code_update_exceptions,
+    code_update_workbooks,
+    download_report,
+    gzip_report,
+)
+from ibms.utils import (
+    CSVValidationError,
+    ImportMetrics,
+    ibms_import_from_csv,
+    import_lock,
+    import_lock_models,
+    relink_financial_year,
+    validate_csv_upload,
+)
 
 LOGGER = logging.getLogger("ibms")
 
+# Uploaded file types (see UploadForm), mapped to the model which is imported from each.
+UPLOAD_FILE_TYPE_MODELS = {
+    "gl_pivot_download": GLPivDownload,
+    "ibm_data": IBMData,
+    "corp_strategy": CorporateStrategy,
+    "nature_conservation": NCStrategicPlan,
+    "dept_program": DepartmentProgram,
+    "general_sp": GeneralServicePriority,
+    "nc_sp": NCServicePriority,
+    "pvs_sp": PVSServicePriority,
+    "sfm_sp": SFMServicePriority,
+    "er_sp": ERServicePriority,
+    "service_priority_mapping": ServicePriorityMapping,
+}
 
-@task
-def process_uploaded_csv(blob_name: str, fy: str, file_type: str, username: str) -> Tuple[str, str, int, str]:
-    """Download a CSV blob from Azure Blob Storage, count its data rows, and log the result."""
+# Uploaded file types, in the order in which they should be imported so that the links between records are set.
+UPLOAD_FILE_TYPE_ORDER = [
+    "corp_strategy",
+    "nature_conservation",
+    "general_sp",
+    "nc_sp",
+    "pvs_sp",
+    "sfm_sp",
+    "er_sp",
+    "service_priority_mapping",
+    "ibm_data",
+    "dept_program",
+    "gl_pivot_download",
+]
+
+
+def upload_blob_client(blob_name: str) -> Optional[BlobClient]:
+    """Returns an Azure BlobClient for the named blob in the upload container, which streams the blob content in
+    bounded chunks. Returns None if Azure Storage is not configured.
+    """
     connection_string = os.environ.get("AZURE_STORAGE_CONNECTION_STRING")
     if not connection_string:
-        LOGGER.error("process_uploaded_csv: AZURE_STORAGE_CONNECTION_STRING is not set")
         return None
+    # Limit the size of each ranged GET so that the blob is streamed in bounded chunks.
+    blob_service = BlobServiceClient.from_connection_string(
+        connection_string,
+        max_single_get_size=settings.CSV_READ_CHUNK_SIZE,
+        max_chunk_get_size=settings.CSV_READ_CHUNK_SIZE,
+    )
+    return blob_service.get_blob_client(container=settings.AZURE_STORAGE_CONTAINER_NAME, blob=blob_name)
+
+
+def record_import_metrics(job: ImportJob, metrics: ImportMetrics, status: str) -> dict:
+    """Record the import metrics on the ImportJob and log them as a single structured (JSON) line."""
+    result = metrics.as_dict()
+    ImportJob.objects.filter(pk=job.pk).update(metrics=result)
+    fields = {"job": job.pk, "blob": job.blob_name, "file_type": job.file_type, "fy": str(job.fy), "status": status}
+    LOGGER.info("import_metrics " + json.dumps({**fields, **result}))
+    return result
+
+
+def import_job_csv(
+    job: ImportJob, blob_client: BlobClient, metrics: ImportMetrics, validate: bool = True, link: bool = True
+) -> Tuple[str, int]:
+    """Import the uploaded CSV blob of an ImportJob, recording progress on the job and completing it on success.
+    Unless validate=False (i.e. the file has already been validated), the whole file is validated before any records
+    are written, and CSVValidationError is raised if it fails. Pass link=False to skip setting the links between
+    records. Returns the model type and record count.
+    """
+
+    def progress(phase: str, rows_processed: int, rows_committed: int) -> None:
+        """Record the import progress (and checkpoint committed rows) on the ImportJob, for the upload page to poll."""
+        with metrics.phase("progress"):
+            ImportJob.objects.filter(pk=job.pk).update(
+                status=phase, rows_processed=rows_processed, rows_committed=rows_committed, modified=timezone.now()
+            )
+
+    model = UPLOAD_FILE_TYPE_MODELS[job.file_type]
+    if validate:
+        ImportJob.objects.filter(pk=job.pk).update(status="validating", started=job.started or timezone.now(), error="")
+        # Validate the whole file before any records are written, so that every error is reported at once.
+        validation_errors = validate_csv_upload(blob_client, model, metrics=metrics)
+        if validation_errors:
+            raise CSVValidationError(validation_errors)
+
+    if model == GLPivDownload:
+        model_type, record_count = ibms_import_from_csv(
+            blob_client,
+            job.fy,
+            model,
+            mode=job.import_mode,
+            delete_missing=job.delete_missing,
+            progress=progress,
+            start_row=job.rows_committed,
+            metrics=metrics,
+            link=link,
+        )
+    else:
+        model_type, record_count = ibms_import_from_csv(
+            blob_client, job.fy, model, job.user, progress=progress, start_row=job.rows_committed, metrics=metrics, link=link
+        )
+    ImportJob.objects.filter(pk=job.pk).update(
+        status="complete",
+        rows_processed=record_count,
+        rows_committed=record_count,
+        model_type=model_type,
+        completed=timezone.now(),
+    )
+    return model_type, record_count
+
+
+def legacy_import_job(blob_name: str, fy: str, file_type: str, username: str) -> ImportJob:
+    """Return a new ImportJob for a process_uploaded_csv task which was enqueued with the arguments used before
+    uploads were recorded as import jobs, so that tasks still queued from an earlier release are processed.
+    """
+    return ImportJob.objects.create(
+        user=get_user_model().objects.get(username=username),
+        fy=FinancialYear.objects.get(financialYear=fy),
+        blob_name=blob_name,
+        file_type=file_type,
+    )
+
+
+@task
+def process_uploaded_csv(import_job_id: int, *legacy_args: str) -> Tuple[str, str, int, str, dict]:
+    """Download a CSV blob from Azure Blob Storage and import its data rows, recording progress on the ImportJob.
+    If the job has already committed some rows (i.e. it is being resumed after an interruption), those rows are
+    skipped. The blob is only deleted once the import succeeds (or the file fails validation), so that an
+    interrupted or failed import can be resumed. The elapsed time and query count of each phase of the import are
+    recorded on the ImportJob, logged and included in the notification email, including the time spent waiting for
+    any other import of the same records to finish (see import_lock).
+    """
+    if legacy_args:
+        # Enqueued as (blob_name, fy, file_type, username) by an earlier release.
+        import_job_id = legacy_import_job(import_job_id, *legacy_args).pk
+    job = ImportJob.objects.select_related("fy", "user").get(pk=import_job_id)
+    metrics = ImportMetrics()
+    # Imports which write the same records are serialised. The job is re-read once the locks are acquired, in case
+    # another run of the same job progressed while this one was waiting.
+    with import_lock(job.fy, import_lock_models(UPLOAD_FILE_TYPE_MODELS[job.file_type]), metrics):
+        job.refresh_from_db()
+        if job.status == "complete":
+            LOGGER.info(f"process_uploaded_csv: {job} has already completed")
+            return None
+
+        blob_client = upload_blob_client(job.blob_name)
+        if not blob_client:
+            LOGGER.error("process_uploaded_csv: AZURE_STORAGE_CONNECTION_STRING is not set")
+            ImportJob.objects.filter(pk=job.pk).update(status="failed", error="Azure Storage is not configured")
+            return None
+
+        file_type = job.file_type
+        user = job.user
 
-    container_name = settings.AZURE_STORAGE_CONTAINER_NAME
+        if job.rows_committed:
+            LOGGER.info(f"Resuming {job} after {job.rows_committed} committed rows")
 
-    blob_service = BlobServiceClient.from_connection_string(connection_string)
-    blob_client = blob_service.get_blob_client(container=container_name, blob=blob_name)
-    financial_year = FinancialYear.objects.get(financialYear=fy)
-    user = User.objects.get(username=username)
-    model_type = "Unknown"
-    record_count = 0
+        try:
+            model_type, record_count = import_job_csv(job, blob_client, metrics)
+            result = record_import_metrics(job, metrics, "complete")
+
+            # Send a notification email to the user who uploaded the file on success.
+            LOGGER.info(
+                f"Sending an email to {user.email}: processed {file_type} upload {blob_client.blob_name} ({record_count} {model_type} records)"
+            )
+            msg = EmailMultiAlternatives(
+                subject=f"Processed IBMS {file_type} upload: {blob_client.blob_name}",
+                body=f"Successfully processed IBMS {file_type} upload {blob_client.blob_name} ({record_count} {model_type} records)"
+                f"\n\n{metrics.summary()}",
+                from_email=settings.NOREPLY_EMAIL,
+                to=[user.email],
+            )
+            msg.send(fail_silently=True)
+        except Exception as e:
+            LOGGER.warning(e)
+            ImportJob.objects.filter(pk=job.pk).update(status="failed", error=str(e))
+            record_import_metrics(job, metrics, "failed")
+            # Send a notification email to the user who uploaded the file on failure.
+            LOGGER.info(f"Sending an email to {user.email}: failure processing uploaded file {blob_client.blob_name}")
+            body = f"Failed to process IBMS {file_type} upload {blob_client.blob_name}\n{e}"
+            if isinstance(e, CSVValidationError):
+                # Include the first errors in the message body, and attach the complete report.
+                body += "\n\n" + "\n".join(e.errors[:50])
+                if len(e.errors) > 50:
+                    body += f"\n... and {len(e.errors) - 50} more (see the attached report)"
+            body += f"\n\n{metrics.summary()}"
+            msg = EmailMultiAlternatives(
+                subject=f"Failed processing IBMS {file_type} upload {blob_client.blob_name}: {blob_client.blob_name}",
+                body=body,
+                from_email=settings.NOREPLY_EMAIL,
+                to=[user.email],
+            )
+            if isinstance(e, CSVValidationError):
+                msg.attach("validation_errors.txt", "\n".join(e.errors), "text/plain")
+            msg.send(fail_silently=True)
+            # A file which fails validation can't be resumed; otherwise, retain the uploaded CSV in blob storage.
+            if isinstance(e, CSVValidationError):
+                blob_client.delete_blob()
+                LOGGER.info(f"Deleted uploaded file {blob_client.blob_name}")
+            raise
+
+        # Remove (delete) the uploaded CSV from blob storage.
+        blob_client.delete_blob()
+        LOGGER.info(f"Deleted uploaded file {blob_client.blob_name}")
+
+        return job.blob_name, model_type, record_count, user.email, result
+
+
+@task
+def process_import_batch(import_batch_id: int) -> Dict[str, int]:
+    """Import the uploaded CSV blobs of an ImportBatch in dependency order (UPLOAD_FILE_TYPE_ORDER), then set the
+    links between records for the financial year in a single pass. Every file is validated before any records are
+    written. Each blob is deleted once its file is imported; if an import fails, the remaining files are not imported
+    and their blobs are retained, so that each can be resumed as a separate import. Each file is imported (and the
+    links are set) while holding the import locks of the records written (see import_lock), so that a batch waits for
+    any conflicting import of the same financial year. Returns counts of links updated.
+    """
+    batch = ImportBatch.objects.select_related("fy", "user").get(pk=import_batch_id)
+    jobs = sorted(
+        batch.jobs.select_related("fy", "user").exclude(status__in=("complete", "skipped")),
+        key=lambda job: UPLOAD_FILE_TYPE_ORDER.index(job.file_type),
+    )
+    blob_clients = {job.pk: upload_blob_client(job.blob_name) for job in jobs}
+    if not all(blob_clients.values()):
+        LOGGER.error("process_import_batch: AZURE_STORAGE_CONNECTION_STRING is not set")
+        ImportBatch.objects.filter(pk=batch.pk).update(status="failed", error="Azure Storage is not configured")
+        return None
+
+    user = batch.user
+    metrics = {job.pk: ImportMetrics() for job in jobs}
+    summary = []
+    job = None
 
     try:
-        if file_type == "gl_pivot_download":
-            model_type, record_count = ibms_import_from_csv(blob_client, financial_year, GLPivDownload)
-        elif file_type == "ibm_data":
-            model_type, record_count = ibms_import_from_csv(blob_client, financial_year, IBMData, user)
-        elif file_type == "corp_strategy":
-            model_type, record_count = ibms_import_from_csv(blob_client, financial_year, CorporateStrategy)
-        elif file_type == "nature_conservation":
-            model_type, record_count = ibms_import_from_csv(blob_client, financial_year, NCStrategicPlan)
-        elif file_type == "dept_program":
-            model_type, record_count = ibms_import_from_csv(blob_client, financial_year, DepartmentProgram)
-        elif file_type == "general_sp":
-            model_type, record_count = ibms_import_from_csv(blob_client, financial_year, GeneralServicePriority)
-        elif file_type == "nc_sp":
-            model_type, record_count = ibms_import_from_csv(blob_client, financial_year, NCServicePriority)
-        elif file_type == "pvs_sp":
-            model_type, record_count = ibms_import_from_csv(blob_client, financial_year, PVSServicePriority)
-        elif file_type == "sfm_sp":
-            model_type, record_count = ibms_import_from_csv(blob_client, financial_year, SFMServicePriority)
-        elif file_type == "er_sp":
-            model_type, record_count = ibms_import_from_csv(blob_client, financial_year, ERServicePriority)
-        elif file_type == "service_priority_mapping":
-            model_type, record_count = ibms_import_from_csv(blob_client, financial_year, ServicePriorityMapping)
-
-        # Send a notification email to the user who uploaded the file on success.
-        LOGGER.info(
-            f"Sending an email to {user.email}: processed {file_type} upload {blob_client.blob_name} ({record_count} {model_type} records)"
+        ImportBatch.objects.filter(pk=batch.pk).update(status="validating", error="")
+        errors = []
+        for job in jobs:
+            ImportJob.objects.filter(pk=job.pk).update(status="validating", started=job.started or timezone.now(), error="")
+            model = UPLOAD_FILE_TYPE_MODELS[job.file_type]
+            job_errors = validate_csv_upload(blob_clients[job.pk], model, metrics=metrics[job.pk])
+            if job_errors:
+                ImportJob.objects.filter(pk=job.pk).update(status="failed", error=str(CSVValidationError(job_errors)))
+                errors.extend(f"{job.blob_name}: {error}" for error in job_errors)
+        job = None
+        if errors:
+            raise CSVValidationError(errors)
+
+        ImportBatch.objects.filter(pk=batch.pk).update(status="importing")
+        for job in jobs:
+            model = UPLOAD_FILE_TYPE_MODELS[job.file_type]
+            with import_lock(batch.fy, import_lock_models(model, link=False), metrics[job.pk]):
+                model_type, record_count = import_job_csv(job, blob_clients[job.pk], metrics[job.pk], validate=False, link=False)
+            record_import_metrics(job, metrics[job.pk], "complete")
+            summary.append(f"{job.blob_name}: {record_count} {model_type} records")
+            blob_clients[job.pk].delete_blob()
+            LOGGER.info(f"Deleted uploaded file {job.blob_name}")
+        job = None
+
+        # Set the links between the records of every file in one pass.
+        ImportBatch.objects.filter(pk=batch.pk).update(status="linking")
+        counts = relink_financial_year(batch.fy)
+        ImportBatch.objects.filter(pk=batch.pk).update(status="complete", link_counts=counts, completed=timezone.now())
+
+        # Send a notification email to the user who uploaded the files on success.
+        LOGGER.info(f"Sending an email to {user.email}: processed {batch}")
+        links = ", ".join(f"{count} {label} links updated" for label, count in counts.items())
+        msg = EmailMultiAlternatives(
+            subject=f"Processed IBMS {batch.fy} upload batch",
+            body=f"Successfully processed IBMS {batch.fy} upload batch:\n" + "\n".join(summary) + f"\n\n{links}",
+            from_email=settings.NOREPLY_EMAIL,
+            to=[user.email],
+        )
+        msg.send(fail_silently=True)
+    except Exception as e:
+        LOGGER.warning(e)
+        ImportBatch.objects.filter(pk=batch.pk).update(status="failed", error=str(e))
+        if job:
+            ImportJob.objects.filter(pk=job.pk).update(status="failed", error=str(e))
+            record_import_metrics(job, metrics[job.pk], "failed")
+        not_imported = [other for other in jobs if other.pk != getattr(job, "pk", None)]
+        ImportJob.objects.filter(pk__in=[other.pk for other in not_imported], status__in=ImportJob.ACTIVE_STATUSES).update(
+            status="failed", error="Not imported, because another file in the batch failed"
         )
+        # Send a notification email to the user who uploaded the files on failure.
+        LOGGER.info(f"Sending an email to {user.email}: failure processing {batch}")
+        body = f"Failed to process IBMS {batch.fy} upload batch\n{e}"
+        if summary:
+            body += "\n\nImported before the failure:\n" + "\n".join(summary)
+        if isinstance(e, CSVValidationError):
+            body += "\n\n" + "\n".join(e.errors[:50])
+            if len(e.errors) > 50:
+                body += f"\n... and {len(e.errors) - 50} more (see the attached report)"
         msg = EmailMultiAlternatives(
-            subject=f"Processed IBMS {file_type} upload: {blob_client.blob_name}",
-            body=f"Successfully processed IBMS {file_type} upload {blob_client.blob_name} ({record_count} {model_type} records)",
+            subject=f"Failed processing IBMS {batch.fy} upload batch",
+            body=body,
+            from_email=settings.NOREPLY_EMAIL,
+            to=[user.email],
+        )
+        if isinstance(e, CSVValidationError):
+            msg.attach("validation_errors.txt", "\n".join(e.errors), "text/plain")
+            # Files which fail validation can't be resumed, so discard the whole batch.
+            for blob_client in blob_clients.values():
+                blob_client.delete_blob()
+            LOGGER.info(f"Deleted the uploaded files of {batch}")
+        msg.send(fail_silently=True)
+        raise
+
+    return counts
+
+
+def resume_import_jobs(jobs: Iterable[ImportJob]) -> int:
+    """Re-enqueue the import task for each of the passed-in (incomplete) ImportJob objects. Each import will resume
+    after its last committed batch of rows. Returns the count of jobs enqueued.
+    """
+    count = 0
+    for job in jobs:
+        if job.status == "complete":
+            continue
+        ImportJob.objects.filter(pk=job.pk).update(status="queued", error="")
+        process_uploaded_csv.enqueue(job.pk)
+        LOGGER.info(f"Re-enqueued {job} (resuming after {job.rows_committed} committed rows)")
+        count += 1
+    return count
+
+
+def find_duplicate_import(
+    fy: FinancialYear, file_type: str, content_hash: str, import_mode: str = "append", delete_missing: bool = False
+) -> Optional[ImportJob]:
+    """Returns the latest import of the file type for the financial year if it has imported (or is importing) a file
+    having identical content with the same options, i.e. importing the file again would not change any data.
+    Returns None if the latest import differs or failed, or if there is no previous import.
+    """
+    latest = ImportJob.objects.filter(fy=fy, file_type=file_type).exclude(status="skipped").first()
+    if (
+        latest
+        and latest.status != "failed"
+        and latest.content_hash == content_hash
+        and latest.import_mode == import_mode
+        and latest.delete_missing == delete_missing
+    ):
+        return latest
+    return None
+
+
+@task
+def relink(financial_year: str) -> Dict[str, int]:
+    """Recompute the service priority, IBM data and GL pivot download links for a financial year, e.g. after a batch
+    of uploads. Returns counts of links updated.
+    """
+    fy = FinancialYear.objects.get(financialYear=financial_year)
+    counts = relink_financial_year(fy)
+    LOGGER.info(f"Relinked {fy}: " + ", ".join(f"{count} {label} links updated" for label, count in counts.items()))
+    return counts
+
+
+@task
+def generate_code_update_batch(report_job_id: int) -> int:
+    """Generate the code update workbook of every cost centre having exceptions in a financial year (optionally, in
+    one region/branch), as a zip file of one workbook per cost centre which is uploaded to blob storage for download.
+    The report data is fetched once, then the workbooks are rendered by a pool of worker processes (see
+    code_update_workbooks). Returns the count of workbooks generated.
+    """
+    job = ReportJob.objects.select_related("fy", "user").get(pk=report_job_id)
+    blob_client = upload_blob_client(f"reports/code-update-{job.pk}.zip")
+    if not blob_client:
+        LOGGER.error("generate_code_update_batch: AZURE_STORAGE_CONNECTION_STRING is not set")
+        ReportJob.objects.filter(pk=job.pk).update(status="failed", error="Azure Storage is not configured")
+        return None
+
+    user = job.user
+    fy = job.fy
+    parameters = job.parameters
+    try:
+        ReportJob.objects.filter(pk=job.pk).update(status="running", started=timezone.now(), items_done=0, error="")
+        gl = GLPivDownload.objects.filter(fy=fy)
+        if parameters.get("region"):
+            gl = gl.filter(regionBranch=parameters["region"])
+        # Exceptions are matched against the IBMData objects of the same cost centre, as in a single cost centre report.
+        gl = code_update_exceptions(gl, IBMData.objects.filter(fy=fy, costCentre=OuterRef("costCentre")), parameters["report_type"])
+        batch_data = code_update_batch_data(gl, IBMData.objects.filter(fy=fy))
+        nc_sp = NCServicePriority.objects.filter(fy=fy, categoryID__in=parameters.get("ncChoice", [])).order_by("servicePriorityNo")
+        pvs_sp = PVSServicePriority.objects.filter(fy=fy, categoryID__in=parameters.get("pvsChoice", [])).order_by("servicePriorityNo")
+        fm_sp = SFMServicePriority.objects.filter(fy=fy, categoryID__in=parameters.get("fmChoice", [])).order_by("servicePriorityNo")
+        ReportJob.objects.filter(pk=job.pk).update(items_total=len(batch_data))
+
+        with tempfile.TemporaryFile() as f:
+            with zipfile.ZipFile(f, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                workbooks = code_update_workbooks(batch_data, nc_sp, pvs_sp, fm_sp, processes=settings.REPORT_WORKER_PROCESSES)
+                for done, (cost_centre, content) in enumerate(workbooks, 1):
+                    archive.writestr(f"ibms_exceptions_{cost_centre}.xls", content)
+                    # Record progress every 10 workbooks.
+                    if done % 10 == 0:
+                        ReportJob.objects.filter(pk=job.pk).update(items_done=done)
+            f.seek(0)
+            blob_client.upload_blob(f, overwrite=True)
+
+        file_name = f"ibms_exceptions_{fy}_{slugify(parameters['region'])}.zip" if parameters.get("region") else f"ibms_exceptions_{fy}.zip"
+        ReportJob.objects.filter(pk=job.pk).update(
+            status="complete", items_done=len(batch_data), blob_name=blob_client.blob_name, file_name=file_name, completed=timezone.now()
+        )
+
+        # Send a notification email to the user who requested the report on success.
+        LOGGER.info(f"Sending an email to {user.email}: generated {job}")
+        msg = EmailMultiAlternatives(
+            subject=f"Generated IBMS {fy} code update workbooks",
+            body=f"Generated {len(batch_data)} IBMS {fy} code update workbook(s), which may be downloaded from the code update "
+            "(batch) page.",
             from_email=settings.NOREPLY_EMAIL,
             to=[user.email],
         )
         msg.send(fail_silently=True)
     except Exception as e:
         LOGGER.warning(e)
-        # Send a notification email to the user who uploaded the file on failure.
-        LOGGER.info(f"Sending an email to {user.email}: failure processing uploaded file {blob_client.blob_name}")
+        ReportJob.objects.filter(pk=job.pk).update(status="failed", error=str(e))
+        # Send a notification email to the user who requested the report on failure.
+        LOGGER.info(f"Sending an email to {user.email}: failure generating {job}")
         msg = EmailMultiAlternatives(
-            subject=f"Failed processing IBMS {file_type} upload {blob_client.blob_name}: {blob_client.blob_name}",
-            body=f"Failed to process IBMS {file_type} upload {blob_client.blob_name}\n{e}",
+            subject=f"Failed generating IBMS {fy} code update workbooks",
+            body=f"Failed to generate IBMS {fy} code update workbooks\n{e}",
+            from_email=settings.NOREPLY_EMAIL,
+            to=[user.email],
+        )
+        msg.send(fail_silently=True)
+        raise
+
+    return len(batch_data)
+
+
+@task
+def generate_download(report_job_id: int) -> int:
+    """Generate a CSV download report of a financial year (optionally, filtered by cost centre, region/branch or
+    division), which is stored gzip-compressed in blob storage as the download artifact of the current data version of
+    the financial year (see ibms.downloads). Later downloads of the same report are served from the artifact, until
+    the financial year data changes. Returns the count of rows in the report.
+    """
+    job = ReportJob.objects.select_related("fy", "user").get(pk=report_job_id)
+    user = job.user
+    fy = job.fy
+    parameters = job.parameters
+    blob_client = upload_blob_client(download_artifact_name(parameters["variant"], fy, parameters["filters"]))
+    if not blob_client:
+        LOGGER.error("generate_download: AZURE_STORAGE_CONNECTION_STRING is not set")
+        ReportJob.objects.filter(pk=job.pk).update(status="failed", error="Azure Storage is not configured")
+        return None
+
+    try:
+        ReportJob.objects.filter(pk=job.pk).update(status="running", started=timezone.now(), items_done=0, error="")
+        glpiv_qs = GLPivDownload.objects.filter(fy=fy, **parameters["filters"])
+        rows = glpiv_qs.count()
+        ReportJob.objects.filter(pk=job.pk).update(items_total=rows)
+
+        # The artifact may already have been generated from the current data, e.g. by an earlier download.
+        if not download_artifact_properties(blob_client, fy.data_version):
+            with tempfile.TemporaryFile() as f:
+                for chunk in gzip_report(download_report(glpiv_qs, **DOWNLOAD_VARIANTS[parameters["variant"]])):
+                    f.write(chunk)
+                f.seek(0)
+                store_download_artifact(f, blob_client, fy.data_version)
+
+        ReportJob.objects.filter(pk=job.pk).update(
+            status="complete", items_done=rows, blob_name=blob_client.blob_name, completed=timezone.now()
+        )
+
+        # Send a notification email to the user who requested the report on success.
+        LOGGER.info(f"Sending an email to {user.email}: generated {job}")
+        msg = EmailMultiAlternatives(
+            subject=f"Generated IBMS {fy} download {job.file_name}",
+            body=f"Generated the IBMS {fy} download {job.file_name} ({rows} rows), which may be downloaded from the download page.",
+            from_email=settings.NOREPLY_EMAIL,
+            to=[user.email],
+        )
+        msg.send(fail_silently=True)
+    except Exception as e:
+        LOGGER.warning(e)
+        ReportJob.objects.filter(pk=job.pk).update(status="failed", error=str(e))
+        # Send a notification email to the user who requested the report on failure.
+        LOGGER.info(f"Sending an email to {user.email}: failure generating {job}")
+        msg = EmailMultiAlternatives(
+            subject=f"Failed generating IBMS {fy} download {job.file_name}",
+            body=f"Failed to generate the IBMS {fy} download {job.file_name}\n{e}",
             from_email=settings.NOREPLY_EMAIL,
             to=[user.email],
         )
         msg.send(fail_silently=True)
         raise
-    finally:
-        # Remove (delete) the uploaded CSV from blob storage.
-        blob_client.delete_blob()
-        LOGGER.info(f"Deleted uploaded file {blob_client.blob_name}")
 
-    return blob_name, model_type, record_count, user.email
+    return rows
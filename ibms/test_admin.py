@@ -1,6 +1,8 @@
 from django.test.client import Client
 from django.urls import reverse
+from mixer.backend.django import mixer
 
+from ibms.models import CorporateStrategy
 from ibms.tests import IbmsTestCase
 
 
@@ -39,3 +41,17 @@ class IbmsAdminTest(IbmsTestCase):
         response = self.client.post(changelist_url, {"action": "export_as_csv", "_selected_action": [self.ibmdata.pk]}, follow=True)
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response["Content-Type"], "text/csv")
+
+    def test_change_bumps_data_version(self):
+        """Changing or deleting financial year data in the admin should bump the data version of the financial year"""
+        cs = mixer.blend(CorporateStrategy, fy=self.fy, corporateStrategyNo="S01")
+        url = reverse("admin:ibms_corporatestrategy_change", kwargs={"object_id": cs.pk})
+        response = self.client.post(url, {"description1": "Changed", "description2": "Changed"})
+        self.assertEqual(response.status_code, 302)
+        self.fy.refresh_from_db()
+        self.assertEqual(self.fy.data_version, 1)
+        url = reverse("admin:ibms_corporatestrategy_changelist")
+        self.client.post(url, {"action": "delete_selected", "_selected_action": [cs.pk], "post": "yes"})
+        self.assertFalse(CorporateStrategy.objects.exists())
+        self.fy.refresh_from_db()
+        self.assertEqual(self.fy.data_version, 2)
@@ -0,0 +1,66 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+
+from ibms.models import FinancialYear, GLPivDownload, IBMData
+from ibms.tasks import UPLOAD_FILE_TYPE_MODELS
+from ibms.tests import IbmsTestCase
+from ibms.utils import validate_csv_upload
+
+
+class GenerateUploadDataTest(IbmsTestCase):
+    """Tests for the generate_upload_data and benchmark_imports management commands."""
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        call_command("generate_upload_data", self.tmpdir.name, "--gl-rows", "52", stdout=StringIO())
+        self.data_dir = os.path.join(self.tmpdir.name, "52")
+
+    def test_generated_files_are_valid(self):
+        """Every generated file should pass upload validation"""
+        for file_type, model in UPLOAD_FILE_TYPE_MODELS.items():
+            path = os.path.join(self.data_dir, f"{file_type}.csv")
+            self.assertEqual(validate_csv_upload(path, model), [], f"{file_type} failed validation")
+
+    def test_benchmark_imports(self):
+        """The benchmark should import every generated file, link the GL pivot download records and record results"""
+        output = os.path.join(self.tmpdir.name, "results.json")
+        call_command("benchmark_imports", self.data_dir, "--output", output, "--keep-data", stderr=StringIO())
+        with open(output) as f:
+            results = json.load(f)
+        self.assertEqual(len(results["results"]), len(UPLOAD_FILE_TYPE_MODELS))
+        gl = next(result for result in results["results"] if result["file_type"] == "gl_pivot_download")
+        self.assertEqual(gl["rows"], 52)
+        self.assertGreater(gl["queries"], 0)
+        self.assertIn("peak_rss_bytes", gl)
+        self.assertIn("insert", gl["phases"])
+        fy = FinancialYear.objects.get(financialYear="BENCHMARK")
+        # Every generated GL codeID matches an IBMData identifier.
+        self.assertFalse(GLPivDownload.objects.filter(fy=fy, ibmdata__isnull=True).exists())
+        self.assertFalse(IBMData.objects.filter(fy=fy, content_type__isnull=True).exists())
+
+    def test_benchmark_downloads(self):
+        """The download benchmark should stream each chunk size of the imported financial year and record results"""
+        call_command("benchmark_imports", self.data_dir, "--keep-data", stdout=StringIO(), stderr=StringIO())
+        output = os.path.join(self.tmpdir.name, "downloads.json")
+        call_command("benchmark_downloads", "--chunk-size", "0", "1024", "--gzip", "--output", output, stderr=StringIO())
+        with open(output) as f:
+            results = json.load(f)
+        self.assertEqual(results["metadata"]["rows"], 52)
+        unbuffered, unbuffered_gzip, buffered, buffered_gzip = results["results"]
+        self.assertEqual(unbuffered["chunks"], 53)
+        self.assertLess(buffered["chunks"], unbuffered["chunks"])
+        self.assertEqual(buffered["bytes"], unbuffered["bytes"])
+        self.assertLess(buffered_gzip["bytes"], buffered["bytes"])
+        self.assertEqual(buffered_gzip["bytes"], unbuffered_gzip["bytes"])
+
+    def test_benchmark_refuses_existing_data(self):
+        """The benchmark should not delete data in a financial year which already contains data"""
+        with self.assertRaises(CommandError):
+            call_command("benchmark_imports", self.data_dir, "--financial-year", self.fy.financialYear, stderr=StringIO())
+        self.assertTrue(IBMData.objects.filter(fy=self.fy).exists())
@@ -0,0 +1,38 @@
+from django.test import SimpleTestCase
+
+from ibms.downloads import download_artifact_name, parse_byte_range
+from ibms.models import FinancialYear
+
+
+class DownloadArtifactTest(SimpleTestCase):
+    """Tests for the download artifact helper functions."""
+
+    def test_download_artifact_name(self):
+        """Artifact names should be distinct for each variant, financial year and filter"""
+        fy = FinancialYear(financialYear="2024/25")
+        names = {
+            download_artifact_name("download", fy, {}),
+            download_artifact_name("enhanced", fy, {}),
+            download_artifact_name("download", FinancialYear(financialYear="2023/24"), {}),
+            download_artifact_name("download", fy, {"regionBranch": "South West"}),
+            download_artifact_name("download", fy, {"regionBranch": "South-West"}),
+        }
+        self.assertEqual(len(names), 5)
+        self.assertIn("downloads/download/202425/all.csv.gz", names)
+
+    def test_parse_byte_range(self):
+        """Single byte ranges should be parsed, and other Range headers ignored or refused"""
+        for header, expected in (
+            ("bytes=0-499", (0, 499)),
+            ("bytes=500-", (500, 999)),
+            ("bytes=-200", (800, 999)),
+            ("bytes=900-5000", (900, 999)),
+            ("bytes=-5000", (0, 999)),
+            ("bytes=5-2", None),
+            ("bytes=0-1,5-6", None),
+            ("items=0-1", None),
+        ):
+            self.assertEqual(parse_byte_range(header, 1000), expected, header)
+        for header in ("bytes=1000-", "bytes=-0"):
+            with self.assertRaises(ValueError):
+                parse_byte_range(header, 1000)
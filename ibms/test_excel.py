@@ -0,0 +1,62 @@
+from io import BytesIO
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase
+from openpyxl import load_workbook
+from xlrd import open_workbook
+
+from ibms.excel import ExcelTemplate, get_excel_template, load_excel_templates
+from ibms.reports import code_update_template_columns
+
+
+class ExcelTemplateTest(SimpleTestCase):
+    """Tests for the process-level cache of parsed Excel report templates."""
+
+    def test_template_is_parsed_once(self):
+        """A template should only be parsed the first time that it is requested"""
+        template = get_excel_template("ibms_codeupdate_base.xls")
+        with patch("ibms.excel.open_workbook") as open_workbook:
+            self.assertIs(get_excel_template("ibms_codeupdate_base.xls"), template)
+        open_workbook.assert_not_called()
+
+    def test_modified_template_is_parsed_again(self):
+        """A template should be parsed again if the file has been modified since"""
+        template = get_excel_template("ibms_codeupdate_base.xls")
+        with patch("ibms.excel.os.path.getmtime", return_value=template.mtime + 1):
+            self.assertIsNot(get_excel_template("ibms_codeupdate_base.xls"), template)
+
+    def test_workbook_copies_are_independent(self):
+        """Each copy of a template workbook should be unaffected by changes to other copies"""
+        for name in ("ibms_codeupdate_base.xls", "fm_outputs.xlsx"):
+            template = get_excel_template(name)
+            first = template.workbook()
+            second = template.workbook()
+            self.assertIsNot(first, second)
+            if template.readonly:
+                first.get_sheet(0).write(1, 0, "Modified")
+                for workbook, expected in ((first, True), (second, False)):
+                    content = BytesIO()
+                    workbook.save(content)
+                    sheet = open_workbook(file_contents=content.getvalue()).sheet_by_index(0)
+                    self.assertEqual(sheet.cell_value(1, 0) == "Modified", expected)
+            else:
+                first.active["A1"] = "Modified"
+                self.assertNotEqual(second.active["A1"].value, "Modified")
+                # Cell styles should match the template file.
+                self.assertEqual(second.active["D5"].number_format, load_workbook(template.path).active["D5"].number_format)
+
+    def test_metadata_is_derived_once(self):
+        """Metadata should be derived from the read-only workbook once, and cached with the template"""
+        template = ExcelTemplate(get_excel_template("ibms_codeupdate_base.xls").path)
+        derive = MagicMock(side_effect=code_update_template_columns)
+        max_col_idx, resource_column_indexes = template.metadata("resource_columns", derive)
+        self.assertEqual(template.metadata("resource_columns", derive), (max_col_idx, resource_column_indexes))
+        derive.assert_called_once_with(template.readonly)
+        self.assertEqual(resource_column_indexes[0], 21)  # Column V, '0000'
+        self.assertEqual(resource_column_indexes[542], 22)
+
+    def test_load_excel_templates(self):
+        """Every template in the template directory should be loaded"""
+        templates = load_excel_templates()
+        self.assertIn("ibms_codeupdate_base.xls", templates)
+        self.assertIn("fm_outputs.xlsx", templates)
@@ -79,6 +79,40 @@ class UploadFormTest(IbmsTestCase):
         self.assertFalse(form.is_valid())
         self.assertIn("upload_file_type", form.errors)
 
+    def test_upload_form_reload_mode_gl_pivot_only(self):
+        """UploadForm should only allow the reload import mode for GL Pivot Download uploads"""
+        fy = mixer.blend(FinancialYear, financialYear="2024/25")
+        csv_file = SimpleUploadedFile("test.csv", b"data", content_type="text/csv")
+        form = UploadForm(
+            data={"upload_file_type": "ibm_data", "financial_year": fy.pk, "import_mode": "reload"},
+            files={"upload_file": csv_file},
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn("import_mode", form.errors)
+        csv_file = SimpleUploadedFile("test.csv", b"data", content_type="text/csv")
+        form = UploadForm(
+            data={"upload_file_type": "gl_pivot_download", "financial_year": fy.pk, "import_mode": "reload"},
+            files={"upload_file": csv_file},
+        )
+        self.assertTrue(form.is_valid())
+
+    def test_upload_form_delete_missing_delta_only(self):
+        """UploadForm should only allow deleting missing records in the delta import mode"""
+        fy = mixer.blend(FinancialYear, financialYear="2024/25")
+        csv_file = SimpleUploadedFile("test.csv", b"data", content_type="text/csv")
+        form = UploadForm(
+            data={"upload_file_type": "gl_pivot_download", "financial_year": fy.pk, "import_mode": "append", "delete_missing": True},
+            files={"upload_file": csv_file},
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn("delete_missing", form.errors)
+        csv_file = SimpleUploadedFile("test.csv", b"data", content_type="text/csv")
+        form = UploadForm(
+            data={"upload_file_type": "gl_pivot_download", "financial_year": fy.pk, "import_mode": "delta", "delete_missing": True},
+            files={"upload_file": csv_file},
+        )
+        self.assertTrue(form.is_valid())
+
     def test_upload_form_financial_year_queryset(self):
         """UploadForm should include all available financial years"""
         fy1 = mixer.blend(FinancialYear, financialYear="2024/25")
@@ -0,0 +1,436 @@
+import gzip
+import io
+import os
+import zipfile
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+
+from azure.storage.blob import BlobClient
+from django.core import mail
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+from mixer.backend.django import mixer
+from xlrd import open_workbook
+
+from ibms.excel import get_excel_template
+from ibms.models import CorporateStrategy, GeneralServicePriority, GLPivDownload, IBMData, ImportBatch, ImportJob, ReportJob
+from ibms.reports import CODE_UPDATE_TEMPLATE, code_update_template_columns, code_update_workbooks, download_report
+from ibms.tasks import generate_code_update_batch, generate_download, process_import_batch, process_uploaded_csv, relink
+from ibms.tests import FakeBlobClient, IbmsTestCase
+from ibms.utils import CSVValidationError, ibms_import_from_csv, relink_financial_year
+
+TEST_DATA_DIR = os.path.join(os.path.dirname(__file__), "test_data")
+
+
+class ProcessUploadedCsvTest(IbmsTestCase):
+    """Tests for the process_uploaded_csv task, using a mocked Azure BlobClient to read test CSV data."""
+
+    def setUp(self):
+        super().setUp()
+        self.job = ImportJob.objects.create(user=self.admin, fy=self.fy, blob_name="glpivot_upload_test.csv", file_type="gl_pivot_download")
+
+    def run_task(self, file_name="glpivot_upload_test.csv", args=None):
+        """Run the task for self.job (or with the passed-in task arguments), returning the mocked BlobClient."""
+
+        def download_blob():
+            with open(os.path.join(TEST_DATA_DIR, file_name), "rb") as f:
+                content = f.read()
+            stream = MagicMock()
+            stream.chunks.return_value = iter([content])
+            return stream
+
+        blob_client = MagicMock()
+        blob_client.__class__ = BlobClient
+        blob_client.blob_name = self.job.blob_name
+        blob_client.download_blob.side_effect = download_blob
+        self.blob_client = blob_client
+        with (
+            patch.dict(os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "test"}),
+            patch("ibms.tasks.BlobServiceClient") as blob_service,
+        ):
+            blob_service.from_connection_string.return_value.get_blob_client.return_value = blob_client
+            process_uploaded_csv.call(*(args or (self.job.pk,)))
+        return blob_client
+
+    def test_import_records_progress_and_deletes_blob(self):
+        """A successful import should complete the job, record progress and delete the uploaded blob"""
+        blob_client = self.run_task()
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, "complete")
+        self.assertEqual(self.job.rows_processed, 4)
+        self.assertEqual(self.job.rows_committed, 4)
+        self.assertEqual(self.job.model_type, "GL Pivot Download")
+        self.assertIsNotNone(self.job.rows_per_second)
+        self.assertEqual(GLPivDownload.objects.filter(fy=self.fy).count(), 4)
+        blob_client.delete_blob.assert_called_once()
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_legacy_task_arguments(self):
+        """A task enqueued with the arguments of an earlier release should be imported as a new job"""
+        self.job.delete()
+        self.run_task(args=("glpivot_upload_test.csv", self.fy.financialYear, "gl_pivot_download", self.admin.username))
+        job = ImportJob.objects.get()
+        self.assertEqual(
+            (job.blob_name, job.fy, job.file_type, job.user), ("glpivot_upload_test.csv", self.fy, "gl_pivot_download", self.admin)
+        )
+        self.assertEqual(job.status, "complete")
+        self.assertEqual(GLPivDownload.objects.filter(fy=self.fy).count(), 4)
+
+    def test_import_records_metrics(self):
+        """A successful import should record the metrics of each phase on the job and in the notification email"""
+        with self.assertLogs("ibms", level="INFO") as logs:
+            self.run_task()
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.metrics["rows"], 4)
+        for phase in ("lock", "download", "parse", "validate", "insert", "link", "progress"):
+            self.assertIn(phase, self.job.metrics["phases"])
+        self.assertGreater(self.job.metrics["phases"]["insert"]["queries"], 0)
+        self.assertTrue(any(line.startswith("INFO:ibms:import_metrics {") for line in logs.output))
+        self.assertIn("Phase", mail.outbox[0].body)
+
+    def test_validation_failure_reports_errors_and_deletes_blob(self):
+        """A file which fails validation should fail the job without writing records, and email the error report"""
+        with self.assertRaises(CSVValidationError):
+            self.run_task(file_name="ibmdata_upload_test.csv")  # Wrong file for the file type.
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, "failed")
+        self.assertIn("validation error", self.job.error)
+        self.assertFalse(GLPivDownload.objects.exists())
+        self.blob_client.delete_blob.assert_called_once()
+        self.assertEqual(len(mail.outbox[0].attachments), 1)
+
+    def test_import_failure_retains_blob(self):
+        """An import which fails part-way should retain the uploaded blob, so that it can be resumed"""
+        with patch("ibms.tasks.ibms_import_from_csv", side_effect=Exception("Connection lost")):
+            with self.assertRaises(Exception):
+                self.run_task()
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, "failed")
+        self.assertEqual(self.job.error, "Connection lost")
+        self.blob_client.delete_blob.assert_not_called()
+
+    def test_resume_skips_committed_rows(self):
+        """A resumed import should skip rows which have already been committed"""
+        self.job.rows_committed = 2
+        self.job.status = "importing"
+        self.job.save()
+        self.run_task()
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, "complete")
+        self.assertEqual(self.job.rows_committed, 4)
+        self.assertEqual(GLPivDownload.objects.filter(fy=self.fy).count(), 2)
+
+    def test_resume_imports_command(self):
+        """The resume_imports command should re-enqueue stale in-progress imports only"""
+        stale = ImportJob.objects.create(user=self.admin, fy=self.fy, blob_name="stale.csv", file_type="ibm_data", status="importing")
+        ImportJob.objects.filter(pk=stale.pk).update(modified=timezone.now() - timedelta(hours=1))
+        complete = ImportJob.objects.create(user=self.admin, fy=self.fy, blob_name="done.csv", file_type="ibm_data", status="complete")
+        with patch("ibms.tasks.process_uploaded_csv") as task:
+            call_command("resume_imports", stdout=MagicMock())
+        task.enqueue.assert_called_once_with(stale.pk)
+        stale.refresh_from_db()
+        complete.refresh_from_db()
+        self.assertEqual(stale.status, "queued")
+        self.assertEqual(complete.status, "complete")
+
+
+def mock_blob_client(blob_name, file_name):
+    """Returns a mocked Azure BlobClient which reads the named test CSV file."""
+
+    def download_blob():
+        with open(os.path.join(TEST_DATA_DIR, file_name), "rb") as f:
+            content = f.read()
+        stream = MagicMock()
+        stream.chunks.return_value = iter([content])
+        return stream
+
+    blob_client = MagicMock()
+    blob_client.__class__ = BlobClient
+    blob_client.blob_name = blob_name
+    blob_client.download_blob.side_effect = download_blob
+    return blob_client
+
+
+class ProcessImportBatchTest(IbmsTestCase):
+    """Tests for the process_import_batch task, using mocked Azure BlobClients to read test CSV data."""
+
+    # Test CSV files for each file type, listed out of dependency order.
+    FILES = {
+        "gl_pivot_download": "glpivot_upload_test.csv",
+        "ibm_data": "ibmdata_upload_test.csv",
+        "general_sp": "generalservicepriority_upload_test.csv",
+        "corp_strategy": "corporatestrategy_upload_test.csv",
+    }
+
+    def setUp(self):
+        super().setUp()
+        GLPivDownload.objects.all().delete()
+        IBMData.objects.all().delete()
+        self.batch = ImportBatch.objects.create(user=self.admin, fy=self.fy)
+        for file_type, file_name in self.FILES.items():
+            ImportJob.objects.create(user=self.admin, fy=self.fy, batch=self.batch, blob_name=file_name, file_type=file_type)
+        self.blob_clients = {}
+
+    def run_task(self, files=None):
+        """Run the task for self.batch, reading the passed-in dict of blob name: test file name."""
+        files = files or {file_name: file_name for file_name in self.FILES.values()}
+
+        def upload_blob_client(blob_name):
+            self.blob_clients[blob_name] = mock_blob_client(blob_name, files[blob_name])
+            return self.blob_clients[blob_name]
+
+        with patch("ibms.tasks.upload_blob_client", side_effect=upload_blob_client):
+            return process_import_batch.call(self.batch.pk)
+
+    def test_batch_imports_in_order_and_links_once(self):
+        """A batch should import every file in dependency order, then set the links between records in one pass"""
+        with (
+            patch("ibms.tasks.ibms_import_from_csv", wraps=ibms_import_from_csv) as importer,
+            patch("ibms.tasks.relink_financial_year", wraps=relink_financial_year) as relinker,
+        ):
+            counts = self.run_task()
+        order = [call.args[2] for call in importer.call_args_list]
+        self.assertEqual(order, [CorporateStrategy, GeneralServicePriority, IBMData, GLPivDownload])
+        # Each file is imported without linking, then the financial year is relinked once.
+        for call in importer.call_args_list:
+            self.assertFalse(call.kwargs["link"])
+        relinker.assert_called_once_with(self.fy)
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.status, "complete")
+        self.assertEqual(self.batch.link_counts, counts)
+        self.assertFalse(self.batch.jobs.exclude(status="complete").exists())
+        for job in self.batch.jobs.all():
+            self.assertIn("lock", job.metrics["phases"])
+        self.assertTrue(GLPivDownload.objects.filter(fy=self.fy).exists())
+        self.assertFalse(GLPivDownload.objects.filter(fy=self.fy, ibmdata__isnull=True).exists())
+        for blob_client in self.blob_clients.values():
+            blob_client.delete_blob.assert_called_once()
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_batch_validation_failure(self):
+        """If any file fails validation, no records should be written and every blob should be deleted"""
+        files = {file_name: file_name for file_name in self.FILES.values()}
+        files["glpivot_upload_test.csv"] = "ibmdata_upload_test.csv"  # Wrong file for the file type.
+        strategy_count = CorporateStrategy.objects.count()
+        with self.assertRaises(CSVValidationError):
+            self.run_task(files)
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.status, "failed")
+        self.assertFalse(IBMData.objects.filter(fy=self.fy).exists())
+        self.assertEqual(CorporateStrategy.objects.count(), strategy_count)
+        self.assertEqual(self.batch.jobs.get(file_type="gl_pivot_download").status, "failed")
+        for blob_client in self.blob_clients.values():
+            blob_client.delete_blob.assert_called_once()
+        self.assertEqual(len(mail.outbox[0].attachments), 1)
+
+    def test_batch_import_failure_retains_remaining_blobs(self):
+        """If an import fails, the remaining files should not be imported and their blobs should be retained"""
+        importer = patch("ibms.tasks.ibms_import_from_csv", side_effect=[("IBMS Corporate Strategy", 1), Exception("Connection lost")])
+        with importer, self.assertRaises(Exception):
+            self.run_task()
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.status, "failed")
+        statuses = dict(self.batch.jobs.values_list("file_type", "status"))
+        self.assertEqual(statuses["corp_strategy"], "complete")
+        self.assertEqual(statuses["general_sp"], "failed")
+        self.assertEqual(self.batch.jobs.get(file_type="gl_pivot_download").error, "Not imported, because another file in the batch failed")
+        self.blob_clients["corporatestrategy_upload_test.csv"].delete_blob.assert_called_once()
+        self.blob_clients["ibmdata_upload_test.csv"].delete_blob.assert_not_called()
+
+
+@override_settings(REPORT_WORKER_PROCESSES=1)
+class GenerateCodeUpdateBatchTest(IbmsTestCase):
+    """Tests for the generate_code_update_batch task, using a mocked Azure BlobClient to receive the zip file."""
+
+    def setUp(self):
+        super().setUp()
+        # A GL code which has a matching IBMData record is not an exception.
+        mixer.blend(
+            GLPivDownload,
+            fy=self.fy,
+            codeID=self.ibmdata.ibmIdentifier,
+            costCentre="999",
+            account=1,
+            service=12,
+            activity="GC2",
+            resource=542,
+        )
+        for cost_centre, region, count in (("997", "Kimberley", 2), ("998", "Pilbara", 3)):
+            for i in range(count):
+                for resource, ytd in ((542, 10), (1, 1)):
+                    mixer.blend(
+                        GLPivDownload,
+                        fy=self.fy,
+                        codeID=f"{cost_centre}-01-12-GC2-{i:04d}-ABC",
+                        costCentre=cost_centre,
+                        regionBranch=region,
+                        account=1,
+                        service=12,
+                        activity="GC2",
+                        project=f"{i:04d}",
+                        job="ABC",
+                        resource=resource,
+                        ytdActual=ytd,
+                    )
+        mixer.blend(IBMData, fy=self.fy, costCentre="998", budgetArea="Pilbara area", ibmIdentifier="998-01-12-GC2-9999-ABC")
+
+    def run_task(self, **parameters):
+        """Run the task for a new ReportJob, returning the job and the uploaded zip file."""
+        job = ReportJob.objects.create(
+            user=self.admin, fy=self.fy, report="code_update_batch", parameters={"report_type": "no-dj0", **parameters}
+        )
+        blob_client = MagicMock()
+        blob_client.blob_name = f"reports/code-update-{job.pk}.zip"
+        uploaded = []
+        blob_client.upload_blob.side_effect = lambda f, overwrite: uploaded.append(f.read())
+        with patch("ibms.tasks.upload_blob_client", return_value=blob_client):
+            generate_code_update_batch.call(job.pk)
+        job.refresh_from_db()
+        return job, zipfile.ZipFile(io.BytesIO(uploaded[0]))
+
+    def test_batch_zip_has_workbook_per_cost_centre(self):
+        """The zip file should have one workbook per cost centre having exceptions, each having its own rows"""
+        job, archive = self.run_task()
+        self.assertEqual(archive.namelist(), ["ibms_exceptions_997.xls", "ibms_exceptions_998.xls"])
+        workbook = open_workbook(file_contents=archive.read("ibms_exceptions_998.xls"))
+        sheet = workbook.sheet_by_index(0)
+        self.assertEqual(sheet.col_values(0, 4, 7), [f"998-01-12-GC2-{i:04d}-ABC" for i in range(3)])
+        self.assertEqual(sheet.cell_value(8, 0), "#END OF INPUT")
+        self.assertEqual([sheet.cell_value(4, i) for i in (21, 22)], [1, 10])
+        # Sheet 3 has the lookup values of the cost centre's IBMData records only.
+        self.assertEqual(workbook.sheet_by_index(2).cell_value(1, 0), "Pilbara area")
+        self.assertEqual(job.status, "complete")
+        self.assertEqual((job.items_done, job.items_total), (2, 2))
+        self.assertEqual(job.file_name, f"ibms_exceptions_{self.fy}.zip")
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_batch_region(self):
+        """Only the cost centres of the selected region/branch should be included"""
+        job, archive = self.run_task(region="Kimberley")
+        self.assertEqual(archive.namelist(), ["ibms_exceptions_997.xls"])
+        self.assertEqual(job.file_name, f"ibms_exceptions_{self.fy}_kimberley.zip")
+
+    def test_batch_failure(self):
+        """A failure should be recorded on the ReportJob, and the user notified"""
+        with patch("ibms.tasks.code_update_batch_data", side_effect=Exception("Connection lost")), self.assertRaises(Exception):
+            self.run_task()
+        job = ReportJob.objects.get()
+        self.assertEqual(job.status, "failed")
+        self.assertEqual(job.error, "Connection lost")
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class GenerateDownloadTest(IbmsTestCase):
+    """Tests for the generate_download task, using an in-memory BlobClient to store the download artifact."""
+
+    def setUp(self):
+        super().setUp()
+        for i, cost_centre in enumerate(("997", "998", "998")):
+            mixer.blend(GLPivDownload, fy=self.fy, costCentre=cost_centre, codeID=f"CODE-{i}")
+        self.blobs = {}
+        patcher = patch("ibms.tasks.upload_blob_client", side_effect=lambda blob_name: FakeBlobClient(self.blobs, blob_name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_task(self, **filters):
+        """Run the task for a new ReportJob, returning the job."""
+        job = ReportJob.objects.create(
+            user=self.admin,
+            fy=self.fy,
+            report="download",
+            parameters={"variant": "download", "filters": filters},
+            file_name="ibms_data_download.csv.gz",
+        )
+        generate_download.call(job.pk)
+        job.refresh_from_db()
+        return job
+
+    def test_download_artifact(self):
+        """The download report should be stored gzip-compressed as the artifact of the current data version"""
+        job = self.run_task(costCentre="998")
+        self.assertEqual(job.status, "complete")
+        self.assertEqual((job.items_done, job.items_total), (2, 2))
+        content, metadata = self.blobs[job.blob_name]
+        self.assertEqual(metadata, {"data_version": "0"})
+        expected = "".join(download_report(GLPivDownload.objects.filter(fy=self.fy, costCentre="998"))).encode()
+        self.assertEqual(gzip.decompress(content), expected)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_current_artifact_is_reused(self):
+        """An artifact of the current data version should not be generated again"""
+        job = self.run_task()
+        with patch("ibms.tasks.download_report") as download_report:
+            self.assertEqual(self.run_task().blob_name, job.blob_name)
+        download_report.assert_not_called()
+        self.fy.bump_data_version()
+        self.fy.refresh_from_db()
+        self.run_task()
+        self.assertEqual(self.blobs[job.blob_name][1], {"data_version": "1"})
+
+    def test_download_failure(self):
+        """A failure should be recorded on the ReportJob, and the user notified"""
+        with patch("ibms.tasks.download_report", side_effect=Exception("Connection lost")), self.assertRaises(Exception):
+            self.run_task()
+        job = ReportJob.objects.get()
+        self.assertEqual(job.status, "failed")
+        self.assertEqual(job.error, "Connection lost")
+        self.assertFalse(self.blobs)
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class CodeUpdateWorkbooksTest(SimpleTestCase):
+    """Tests for rendering code update workbooks in a pool of worker processes."""
+
+    def test_process_pool(self):
+        """Workbooks rendered by worker processes should match workbooks rendered in-process, in order"""
+        row = {
+            "cost_centre": "998",
+            "account_no": 1,
+            "service_no": 12,
+            "activity_code": "GC2",
+            "project_code": "0001",
+            "job_code": "ABC",
+            "job_name": "Job",
+            "activity_name": "Activity",
+            "proj_name_no": "Project",
+            "mpra_category": "",
+        }
+        _, resource_column_indexes = get_excel_template(CODE_UPDATE_TEMPLATE).metadata("resource_columns", code_update_template_columns)
+        row.update({f"resource_{column}": None for column in resource_column_indexes.values()})
+        row.update({"resource_21": 1, "resource_22": 10})
+        batch_data = {
+            f"{cc}": ([{**row, "codeID": f"{cc}-{i}", "cost_centre": f"{cc}"} for i in range(cc % 5)], [(f"{cc}", "Area", "", "")])
+            for cc in range(900, 912)
+        }
+        with patch("ibms.reports.connections.close_all"):
+            pooled = list(code_update_workbooks(batch_data, [], [], [], processes=2))
+        self.assertEqual([cost_centre for cost_centre, _ in pooled], list(batch_data))
+        for cost_centre, content in pooled:
+            sheet = open_workbook(file_contents=content).sheet_by_index(0)
+            self.assertEqual(sheet.col_values(0, 4, 4 + len(batch_data[cost_centre][0])), [r["codeID"] for r in batch_data[cost_centre][0]])
+        self.assertEqual(pooled, list(code_update_workbooks(batch_data, [], [], [], processes=1)))
+
+
+class RelinkTest(IbmsTestCase):
+    """Tests for the relink task and management command."""
+
+    def setUp(self):
+        super().setUp()
+        self.sp = mixer.blend(GeneralServicePriority, fy=self.fy, servicePriorityNo=self.ibmdata.servicePriorityID)
+        IBMData.objects.filter(pk=self.ibmdata.pk).update(content_type=None, object_id=None)
+
+    def test_relink_task(self):
+        """The relink task should link IBMData to its service priority"""
+        counts = relink.call(self.fy.financialYear)
+        self.assertEqual(counts["IBM data"], 1)
+        self.ibmdata.refresh_from_db()
+        self.assertEqual(self.ibmdata.service_priority, self.sp)
+
+    def test_relink_command(self):
+        """The relink command should relink the given financial year"""
+        call_command("relink", self.fy.financialYear, stdout=MagicMock())
+        self.ibmdata.refresh_from_db()
+        self.assertEqual(self.ibmdata.service_priority, self.sp)
+        with self.assertRaises(CommandError):
+            call_command("relink", "1999/00", stdout=MagicMock())
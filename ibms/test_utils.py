@@ -1,17 +1,23 @@
 import os
 import tempfile
+import threading
 from contextlib import contextmanager
 from datetime import date, datetime
+from decimal import Decimal
 from pathlib import Path
+from unittest import skipUnless
 from unittest.mock import MagicMock, patch
 
+from django.db import connections
 from django.test import TestCase
 from mixer.backend.django import mixer
+from reversion.models import Revision
 
 from ibms.models import (
     CorporateStrategy,
     DepartmentProgram,
     ERServicePriority,
+    FinancialYear,
     GeneralServicePriority,
     GLPivDownload,
     IBMData,
@@ -23,13 +29,28 @@ from ibms.models import (
 )
 from ibms.tests import IbmsTestCase
 from ibms.utils import (
+    CSV_UPLOAD_COLUMNS,
     ColumnCountError,
+    CSVColumn,
     FieldLengthError,
     IBMSValidationError,
+    ImportMetrics,
+    blobload_context,
+    get_csv_parser_engine,
     get_download_period,
     ibms_import_from_csv,
+    import_lock,
+    import_lock_key,
+    import_lock_models,
+    iter_decoded_lines,
+    link_glpivdownload,
+    pyarrow,
+    record_batch_context,
+    relink_financial_year,
     validate_char_field,
     validate_column_count,
+    validate_csv_columns,
+    validate_csv_upload,
     validate_integer_field,
 )
 
@@ -226,6 +247,288 @@ class ValidateColumnCountTest(TestCase):
             validate_column_count([], 1)
 
 
+class IterDecodedLinesTest(TestCase):
+    """Test iter_decoded_lines and the chunked CSV readers built on it."""
+
+    def test_lines_split_across_chunks(self):
+        """Lines spanning chunk boundaries should be reassembled"""
+        chunks = [b"a,b\r\nc,", b"d\r", b"\ne,f"]
+        self.assertEqual(list(iter_decoded_lines(chunks)), ["a,b\r\n", "c,d\r\n", "e,f"])
+
+    def test_multibyte_character_split_across_chunks(self):
+        """A multi-byte UTF-8 character split between chunks should decode correctly"""
+        data = "caf\u00e9,x\n".encode("utf-8")
+        chunks = [data[:4], data[4:]]  # Split inside the two-byte \u00e9
+        self.assertEqual(list(iter_decoded_lines(chunks)), ["caf\u00e9,x\n"])
+
+    def test_invalid_bytes_ignored(self):
+        """Undecodable bytes should be dropped rather than raising"""
+        self.assertEqual(list(iter_decoded_lines([b"a\xff,b\n"])), ["a,b\n"])
+
+    def test_blobload_context_streams_chunks(self):
+        """blobload_context should read blob chunks and skip the header row"""
+        blob_client = MagicMock()
+        blob_client.download_blob.return_value.chunks.return_value = iter(
+            [b"code,desc\r\nA1,\"multi", b"\r\nline\"\r\nB2,plain\r\n"]
+        )
+        with blobload_context(blob_client) as reader:
+            rows = list(reader)
+        self.assertEqual(rows, [["A1", "multi\r\nline"], ["B2", "plain"]])
+        blob_client.download_blob.return_value.readall.assert_not_called()
+
+
+class ImportMetricsTest(IbmsTestCase):
+    """Test the ImportMetrics phase timings and query counts."""
+
+    def test_nested_phases_are_exclusive(self):
+        """Queries within a nested phase should only be counted against the innermost phase"""
+        metrics = ImportMetrics()
+        with metrics.phase("insert"):
+            FinancialYear.objects.count()
+            with metrics.phase("link"):
+                FinancialYear.objects.count()
+                FinancialYear.objects.count()
+        result = metrics.as_dict()
+        self.assertEqual(result["phases"]["insert"]["queries"], 1)
+        self.assertEqual(result["phases"]["link"]["queries"], 2)
+        self.assertEqual(result["queries"], 3)
+
+    def test_import_records_phases(self):
+        """An import should record the rows imported and the parse, insert and link phases"""
+        metrics = ImportMetrics()
+        file_path = os.path.join(TEST_DATA_DIR, "glpivot_upload_test.csv")
+        ibms_import_from_csv(file_path, self.fy, GLPivDownload, metrics=metrics, engine="csv")
+        result = metrics.as_dict()
+        self.assertEqual(result["rows"], 4)
+        self.assertEqual(set(result["phases"]), {"insert", "download", "parse", "link"})
+        self.assertIn("Total", metrics.summary())
+
+
+class ImportLockTest(IbmsTestCase):
+    """Test the per-(financial year, model) import advisory locks, using a second database connection."""
+
+    def setUp(self):
+        super().setUp()
+        self.other = connections.create_connection("default")
+        self.addCleanup(self.other.close)
+
+    def other_try_lock(self, fy, model):
+        """Try to acquire (and immediately release) the import lock from the other connection."""
+        with self.other.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s, %s)", import_lock_key(fy, model))
+            acquired = cursor.fetchone()[0]
+            if acquired:
+                cursor.execute("SELECT pg_advisory_unlock(%s, %s)", import_lock_key(fy, model))
+        return acquired
+
+    def test_import_lock_models(self):
+        """An import should lock its own model, plus the models whose links are set afterwards"""
+        self.assertEqual(import_lock_models(GLPivDownload), [GLPivDownload])
+        self.assertEqual(import_lock_models(IBMData), [IBMData, GLPivDownload])
+        self.assertEqual(import_lock_models(IBMData, link=False), [IBMData])
+        models = import_lock_models(GeneralServicePriority)
+        self.assertEqual(len(models), len(set(models)))
+        self.assertTrue({GeneralServicePriority, NCServicePriority, IBMData, GLPivDownload} <= set(models))
+
+    def test_lock_serialises_conflicting_imports(self):
+        """The lock should only conflict with imports of the same model and financial year"""
+        other_fy = mixer.blend(FinancialYear)
+        with import_lock(self.fy, [IBMData]):
+            self.assertFalse(self.other_try_lock(self.fy, IBMData))
+            self.assertTrue(self.other_try_lock(self.fy, GLPivDownload))
+            self.assertTrue(self.other_try_lock(other_fy, IBMData))
+            # Locks are reentrant within a session.
+            with import_lock(self.fy, [IBMData]):
+                pass
+            self.assertFalse(self.other_try_lock(self.fy, IBMData))
+        self.assertTrue(self.other_try_lock(self.fy, IBMData))
+
+    def test_lock_wait_is_recorded(self):
+        """Waiting for a lock held by another import should be recorded as the lock phase"""
+        key = import_lock_key(self.fy, GLPivDownload)
+        with self.other.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_lock(%s, %s)", key)
+
+        def release():
+            with self.other.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s, %s)", key)
+
+        self.other.inc_thread_sharing()
+        self.addCleanup(self.other.dec_thread_sharing)
+        timer = threading.Timer(0.3, release)
+        metrics = ImportMetrics()
+        with self.assertLogs("ibms", level="INFO") as logs:
+            timer.start()
+            with import_lock(self.fy, [GLPivDownload], metrics):
+                pass
+        timer.join()
+        self.assertGreaterEqual(metrics.as_dict()["phases"]["lock"]["seconds"], 0.25)
+        self.assertTrue(any("Waiting for another import" in line for line in logs.output))
+
+
+    def test_failed_release_closes_connection(self):
+        """If the locks cannot be released, the session holding them should be closed rather than reused"""
+        with patch("ibms.utils.connection", self.other), patch("ibms.utils.release_import_locks", return_value=False):
+            with import_lock(self.fy, [IBMData]):
+                raw_connection = self.other.connection
+        self.assertTrue(raw_connection.closed)
+        self.assertIsNone(self.other.connection)
+        with connections["default"].cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s, %s)", import_lock_key(self.fy, IBMData))
+            self.assertTrue(cursor.fetchone()[0])
+            cursor.execute("SELECT pg_advisory_unlock(%s, %s)", import_lock_key(self.fy, IBMData))
+
+
+class ValidateCsvUploadTest(TestCase):
+    """Tests for the validation-only pass over uploaded CSV files."""
+
+    def test_test_data_files_are_valid(self):
+        """Each of the test data files should pass validation for its model"""
+        files = {
+            GLPivDownload: "glpivot_upload_test.csv",
+            IBMData: "ibmdata_upload_test.csv",
+            CorporateStrategy: "corporatestrategy_upload_test.csv",
+            NCStrategicPlan: "ncstrategicplan_upload_test.csv",
+            DepartmentProgram: "dept_program_upload_test.csv",
+            GeneralServicePriority: "generalservicepriority_upload_test.csv",
+            NCServicePriority: "ncservicepriority_upload_test.csv",
+            PVSServicePriority: "pvsservicepriority_upload_test.csv",
+            SFMServicePriority: "sfmservicepriority_upload_test.csv",
+            ERServicePriority: "erservicepriority_upload_test.csv",
+            ServicePriorityMapping: "serviceprioritymapping_upload_test.csv",
+        }
+        for model, file_name in files.items():
+            with self.subTest(model=model.__name__):
+                self.assertEqual(validate_csv_upload(os.path.join(TEST_DATA_DIR, file_name), model), [])
+
+    def test_validate_csv_columns_reports_all_errors_in_row_order(self):
+        """Every invalid value should be reported, ordered by row"""
+        columns = [
+            CSVColumn("code", max_length=3),
+            CSVColumn("count", "int"),
+            CSVColumn("amount", "decimal"),
+            CSVColumn("period", "date"),
+        ]
+        rows = [
+            ["ABC", "1", "1.50", "30/04/2025"],
+            ["ABCD", "x", "1.50", "2025-04-30"],
+            ["ABC", "1"],
+            ["ABC", "2", "NaN", "30/04/2025"],
+        ]
+        errors = validate_csv_columns(rows, columns)
+        self.assertEqual(len(errors), 5)
+        self.assertTrue(errors[0].startswith("Row 2: code exceeds maximum length of 3"))
+        self.assertTrue(errors[1].startswith("Row 2: count must be an integer"))
+        self.assertTrue(errors[2].startswith("Row 2: period must be a date"))
+        self.assertTrue(errors[3].startswith("Row 3: unexpected column count"))
+        self.assertTrue(errors[4].startswith("Row 4: amount must be a number"))
+
+    def test_validate_csv_upload_numbers_rows_across_blocks(self):
+        """Row numbers should be continuous across blocks of rows"""
+        bad_csv = tempfile.NamedTemporaryFile(mode="w", suffix=".csv", delete=False)
+        bad_csv.write("costCentreNo,wildlifeManagement,parksManagement,forestManagement\n")
+        for i in range(5):
+            bad_csv.write("12345,WM,PM,FM\n" if i in (1, 4) else "123,WM,PM,FM\n")
+        bad_csv.close()
+        try:
+            with self.settings(CSV_IMPORT_BATCH_SIZE=2):
+                errors = validate_csv_upload(bad_csv.name, ServicePriorityMapping)
+            self.assertEqual(len(errors), 2)
+            self.assertTrue(errors[0].startswith("Row 2: costCentreNo"))
+            self.assertTrue(errors[1].startswith("Row 5: costCentreNo"))
+        finally:
+            Path(bad_csv.name).unlink()
+
+
+class CSVParserEngineTest(IbmsTestCase):
+    """Test the csv and arrow CSV parser engines."""
+
+    columns = [CSVColumn("period", "date"), CSVColumn("count", "int"), CSVColumn("amount", "decimal"), CSVColumn("name")]
+
+    def write_csv(self, content: str) -> str:
+        f = tempfile.NamedTemporaryFile(mode="w", suffix=".csv", delete=False)
+        f.write(content)
+        f.close()
+        self.addCleanup(os.unlink, f.name)
+        return f.name
+
+    def parse(self, path: str, engine: str, start_row: int = 0, columns=None) -> list:
+        with record_batch_context(path, columns or self.columns, engine, start_row) as batches:
+            return [row for batch in batches for row in batch.rows()]
+
+    def test_csv_engine_types(self):
+        """The csv engine should skip the header and convert values to the column types"""
+        path = self.write_csv('Period,Count,Amount,Name\n30/04/2025, 7,2.345,"Multi\nline"\n1/5/2025,8,-10,Plain\n')
+        rows = self.parse(path, "csv")
+        self.assertEqual(rows[0], (date(2025, 4, 30), 7, Decimal("2.34"), "Multi\nline"))
+        self.assertEqual(rows[1], (date(2025, 5, 1), 8, Decimal("-10.00"), "Plain"))
+        self.assertEqual(self.parse(path, "csv", start_row=1), rows[1:])
+
+    def test_csv_engine_invalid_values(self):
+        """The csv engine should raise a validation error for an unparseable value or wrong column count"""
+        with self.assertRaises(IBMSValidationError):
+            self.parse(self.write_csv("30/04/2025,7,1.00,Name\n30/04/2025,seven,1.00,Name\n"), "csv")
+        with self.assertRaises(ColumnCountError):
+            self.parse(self.write_csv("30/04/2025,7,1.00,Name\n30/04/2025,7,1.00\n"), "csv")
+
+    @skipUnless(pyarrow, "pyarrow is not installed")
+    def test_arrow_engine_matches_csv_engine(self):
+        """The arrow engine should return the same typed values as the csv engine"""
+        path = self.write_csv('Period,Count,Amount,Name\n30/04/2025, 7,2.345,"Multi\nline"\n1/5/2025,8,-10,Plain\n')
+        self.assertEqual(self.parse(path, "arrow"), self.parse(path, "csv"))
+        self.assertEqual(self.parse(path, "arrow", start_row=1), self.parse(path, "csv", start_row=1))
+        gl_path = os.path.join(TEST_DATA_DIR, "glpivot_upload_test.csv")
+        gl_columns = CSV_UPLOAD_COLUMNS[GLPivDownload]
+        self.assertEqual(self.parse(gl_path, "arrow", columns=gl_columns), self.parse(gl_path, "csv", columns=gl_columns))
+
+    @skipUnless(pyarrow, "pyarrow is not installed")
+    def test_arrow_engine_invalid_values(self):
+        """The arrow engine should raise a validation error for an unparseable value or wrong column count"""
+        with self.assertRaises(IBMSValidationError):
+            self.parse(self.write_csv("30/04/2025,7,1.00,Name\n30/04/2025,seven,1.00,Name\n"), "arrow")
+        with self.assertRaises(ColumnCountError):
+            self.parse(self.write_csv("30/04/2025,7,1.00,Name\n30/04/2025,7,1.00\n"), "arrow")
+
+    @skipUnless(pyarrow, "pyarrow is not installed")
+    def test_arrow_engine_import(self):
+        """A GL pivot download import using the arrow engine should write the same records as the csv engine"""
+        csv_path = os.path.join(TEST_DATA_DIR, "glpivot_upload_test.csv")
+        fields = [f.attname for f in GLPivDownload._meta.concrete_fields if not f.primary_key]
+        ibms_import_from_csv(csv_path, self.fy, GLPivDownload, mode="reload", engine="csv")
+        expected = list(GLPivDownload.objects.filter(fy=self.fy).order_by("gLCode").values_list(*fields))
+        ibms_import_from_csv(csv_path, self.fy, GLPivDownload, mode="reload", engine="arrow")
+        self.assertEqual(list(GLPivDownload.objects.filter(fy=self.fy).order_by("gLCode").values_list(*fields)), expected)
+
+    @skipUnless(pyarrow, "pyarrow is not installed")
+    def test_validate_csv_upload_uses_engine(self):
+        """A GL pivot download file should be validated by the engine which will import it"""
+        gl_path = os.path.join(TEST_DATA_DIR, "glpivot_upload_test.csv")
+        with open(gl_path) as f:
+            content = f.read()
+        self.assertEqual(validate_csv_upload(gl_path, GLPivDownload, engine="arrow"), [])
+        # The account value is an integer for Python, but not for the arrow engine.
+        path = self.write_csv(content.replace("30/04/2025,151,1,32,", "30/04/2025,151,1_000,32,", 1))
+        self.assertEqual(validate_csv_upload(path, GLPivDownload, engine="csv"), [])
+        ibms_import_from_csv(path, self.fy, GLPivDownload, mode="reload", engine="csv")
+        errors = validate_csv_upload(path, GLPivDownload, engine="arrow")
+        self.assertEqual(errors, ["Row 1: account must be an integer, got: 1_000"])
+        with self.assertRaises(IBMSValidationError):
+            ibms_import_from_csv(path, self.fy, GLPivDownload, mode="reload", engine="arrow")
+        # Rows having the wrong number of columns are reported by the csv engine.
+        lines = content.splitlines()
+        path = self.write_csv("\n".join(lines[:2] + [lines[2].rpartition(",")[0]] + lines[3:]) + "\n")
+        errors = validate_csv_upload(path, GLPivDownload, engine="arrow")
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(errors[0].startswith("Row 2: unexpected column count"))
+
+    def test_arrow_engine_fallback(self):
+        """The arrow engine should fall back to the csv engine if pyarrow is not installed"""
+        with patch("ibms.utils.pyarrow", None):
+            self.assertEqual(get_csv_parser_engine("arrow"), "csv")
+        with self.assertRaises(ValueError):
+            get_csv_parser_engine("pandas")
+
+
 class IbmsImportFromCsvGLPivDownloadTest(IbmsTestCase):
     """Test ibms_import_from_csv for GLPivDownload using real test CSV data."""
 
@@ -259,6 +562,152 @@ class IbmsImportFromCsvGLPivDownloadTest(IbmsTestCase):
         self.assertIsNotNone(gl.ibmdata)
         self.assertEqual(gl.ibmdata.ibmIdentifier, "418-01-12-GC2-GAS1-945")
 
+    def test_import_links_department_program_when_present(self):
+        """GLPivDownload import should set department_program FK when a matching DepartmentProgram record exists"""
+        mixer.blend(DepartmentProgram, fy=self.fy, ibmIdentifier="418-01-12-GC2-GAS1-945")
+        ibms_import_from_csv(self.csv_path, self.fy, GLPivDownload)
+        gl = GLPivDownload.objects.filter(fy=self.fy, codeID="418-01-12-GC2-GAS1-945").first()
+        self.assertIsNotNone(gl.department_program)
+
+    def test_link_glpivdownload(self):
+        """link_glpivdownload should set missing FK links only, and return the count of links set"""
+        ibms_import_from_csv(self.csv_path, self.fy, GLPivDownload)
+        self.assertFalse(GLPivDownload.objects.filter(fy=self.fy, ibmdata__isnull=False).exists())
+        ibmdata = mixer.blend(IBMData, fy=self.fy, ibmIdentifier="418-01-12-GC2-GAS1-945")
+        gl_count = GLPivDownload.objects.filter(fy=self.fy, codeID=ibmdata.ibmIdentifier).count()
+        self.assertEqual(link_glpivdownload(self.fy), (gl_count, 0))
+        self.assertEqual(GLPivDownload.objects.filter(fy=self.fy, ibmdata=ibmdata).count(), gl_count)
+        # A second pass has nothing left to link.
+        self.assertEqual(link_glpivdownload(self.fy), (0, 0))
+
+    def test_import_reload_replaces_financial_year(self):
+        """Reload mode should replace existing GLPivDownload records for the financial year only"""
+        stale = mixer.blend(GLPivDownload, fy=self.fy, gLCode="STALE-CODE")
+        other_fy = mixer.blend(FinancialYear, financialYear="2023/24")
+        other = mixer.blend(GLPivDownload, fy=other_fy, gLCode="OTHER-CODE")
+        desc, count = ibms_import_from_csv(self.csv_path, self.fy, GLPivDownload, mode="reload")
+        self.assertEqual(count, 4)
+        self.assertEqual(GLPivDownload.objects.filter(fy=self.fy).count(), 4)
+        self.assertFalse(GLPivDownload.objects.filter(pk=stale.pk).exists())
+        self.assertTrue(GLPivDownload.objects.filter(pk=other.pk).exists())
+
+    def test_import_reload_keeps_permanent_table_of_staging_name(self):
+        """Reload mode should only drop its temporary staging table, not a permanent table of the same name"""
+        with connections["default"].cursor() as cursor:
+            cursor.execute("CREATE TABLE public.ibms_glpivdownload_staging (id integer)")
+            ibms_import_from_csv(self.csv_path, self.fy, GLPivDownload, mode="reload")
+            cursor.execute("SELECT to_regclass('public.ibms_glpivdownload_staging')")
+            self.assertIsNotNone(cursor.fetchone()[0])
+
+    def test_import_reload_sets_fields_and_links(self):
+        """Reload mode should set field values and FK links in the same way as a normal import"""
+        ibmdata = mixer.blend(IBMData, fy=self.fy, ibmIdentifier="418-01-12-GC2-GAS1-945")
+        dept_program = mixer.blend(DepartmentProgram, fy=self.fy, ibmIdentifier="418-01-12-GC2-GAS1-945")
+        ibms_import_from_csv(self.csv_path, self.fy, GLPivDownload, mode="reload")
+        gl = GLPivDownload.objects.get(fy=self.fy, codeID="418-01-12-GC2-GAS1-945")
+        self.assertEqual(gl.download_period.strftime("%d/%m/%Y"), "30/04/2025")
+        self.assertEqual(gl.division, "Nature Based Tourism")
+        self.assertEqual(gl.ibmdata, ibmdata)
+        self.assertEqual(gl.department_program, dept_program)
+
+    def test_import_reload_invalid_row_keeps_existing_records(self):
+        """Reload mode should leave existing records in place if the file fails validation"""
+        existing = mixer.blend(GLPivDownload, fy=self.fy)
+        bad_csv = tempfile.NamedTemporaryFile(mode="w", suffix=".csv", delete=False)
+        bad_csv.write("Download Period,CC\n")
+        bad_csv.write("30/04/2025,151\n")
+        bad_csv.close()
+        try:
+            with self.assertRaises(ColumnCountError):
+                ibms_import_from_csv(bad_csv.name, self.fy, GLPivDownload, mode="reload")
+            self.assertTrue(GLPivDownload.objects.filter(pk=existing.pk).exists())
+        finally:
+            Path(bad_csv.name).unlink()
+
+    def test_import_resume_behind_committed_rows(self):
+        """Resuming an import whose checkpoint is one batch behind the committed rows should skip existing records"""
+        with self.settings(CSV_IMPORT_BATCH_SIZE=2):
+            ibms_import_from_csv(self.csv_path, self.fy, GLPivDownload)
+            # The second batch was committed, but the checkpoint was still at the first batch.
+            desc, count = ibms_import_from_csv(self.csv_path, self.fy, GLPivDownload, start_row=2)
+        self.assertEqual(count, 4)
+        self.assertEqual(GLPivDownload.objects.filter(fy=self.fy).count(), 4)
+
+    def test_import_batch_is_committed_with_checkpoint(self):
+        """A batch of records should not be committed if its progress checkpoint fails"""
+        progress = MagicMock(side_effect=[None, Exception("Connection lost")])
+        with self.settings(CSV_IMPORT_BATCH_SIZE=2), self.assertRaises(Exception):
+            ibms_import_from_csv(self.csv_path, self.fy, GLPivDownload, progress=progress)
+        self.assertEqual(GLPivDownload.objects.filter(fy=self.fy).count(), 2)
+
+    def test_import_delta_inserts_updates_and_keeps_unchanged(self):
+        """Delta mode should insert new records, update changed records and leave unchanged records alone"""
+        ibms_import_from_csv(self.csv_path, self.fy, GLPivDownload)
+        gl_codes = list(GLPivDownload.objects.filter(fy=self.fy).values_list("gLCode", flat=True))
+        changed = GLPivDownload.objects.get(fy=self.fy, gLCode=gl_codes[0])
+        changed.ytdActual = 0
+        changed.save()
+        GLPivDownload.objects.filter(fy=self.fy, gLCode=gl_codes[1]).delete()
+        extra = mixer.blend(GLPivDownload, fy=self.fy, gLCode="NOT-IN-FILE")
+        pks = dict(GLPivDownload.objects.filter(fy=self.fy).values_list("gLCode", "pk"))
+
+        desc, count = ibms_import_from_csv(self.csv_path, self.fy, GLPivDownload, mode="delta")
+        self.assertEqual(count, 4)
+        self.assertEqual(GLPivDownload.objects.filter(fy=self.fy).count(), 5)
+        changed.refresh_from_db()
+        self.assertNotEqual(changed.ytdActual, 0)
+        # Existing records are updated in place.
+        self.assertEqual(changed.pk, pks[gl_codes[0]])
+        self.assertTrue(GLPivDownload.objects.filter(fy=self.fy, gLCode=gl_codes[1]).exists())
+        self.assertTrue(GLPivDownload.objects.filter(pk=extra.pk).exists())
+
+    def test_import_delta_new_download_period(self):
+        """Delta mode should only update records whose values changed, not every record of a new download period"""
+        ibms_import_from_csv(self.csv_path, self.fy, GLPivDownload)
+        with open(self.csv_path) as f:
+            lines = f.read().splitlines(keepends=True)
+        # The next month's file: a new download period on every row, and one changed amount.
+        lines = [lines[0]] + [line.replace("30/04/2025", "31/05/2025", 1) for line in lines[1:]]
+        lines[1] = lines[1].replace(",33981.8,", ",40000,", 1)
+        next_csv = tempfile.NamedTemporaryFile(mode="w", suffix=".csv", delete=False)
+        next_csv.writelines(lines)
+        next_csv.close()
+        self.addCleanup(os.unlink, next_csv.name)
+
+        with self.assertLogs("ibms", level="INFO") as logs:
+            ibms_import_from_csv(next_csv.name, self.fy, GLPivDownload, mode="delta")
+        self.assertTrue(any("4 rows read, 0 inserted, 1 updated, 0 deleted" in line for line in logs.output))
+        changed = GLPivDownload.objects.get(fy=self.fy, ytdActual=40000)
+        self.assertEqual((changed.downloadPeriod, changed.download_period), ("31/05/2025", date(2025, 5, 31)))
+        # Unchanged records keep their earlier download period.
+        self.assertEqual(GLPivDownload.objects.filter(fy=self.fy, downloadPeriod="30/04/2025").count(), 3)
+        self.assertEqual(get_download_period(), date(2025, 5, 31))
+
+    def test_import_delta_delete_missing(self):
+        """Delta mode with delete_missing should delete records not present in the CSV for the financial year"""
+        extra = mixer.blend(GLPivDownload, fy=self.fy, gLCode="NOT-IN-FILE")
+        other_fy = mixer.blend(FinancialYear, financialYear="2023/24")
+        other = mixer.blend(GLPivDownload, fy=other_fy, gLCode="NOT-IN-FILE")
+        ibms_import_from_csv(self.csv_path, self.fy, GLPivDownload, mode="delta", delete_missing=True)
+        self.assertEqual(GLPivDownload.objects.filter(fy=self.fy).count(), 4)
+        self.assertFalse(GLPivDownload.objects.filter(pk=extra.pk).exists())
+        self.assertTrue(GLPivDownload.objects.filter(pk=other.pk).exists())
+
+    def test_import_delta_links_new_records(self):
+        """Delta mode should set FK links on inserted records and keep links on unchanged records"""
+        ibmdata = mixer.blend(IBMData, fy=self.fy, ibmIdentifier="418-01-12-GC2-GAS1-945")
+        ibms_import_from_csv(self.csv_path, self.fy, GLPivDownload, mode="delta")
+        gl = GLPivDownload.objects.get(fy=self.fy, codeID="418-01-12-GC2-GAS1-945")
+        self.assertEqual(gl.ibmdata, ibmdata)
+        ibms_import_from_csv(self.csv_path, self.fy, GLPivDownload, mode="delta")
+        gl.refresh_from_db()
+        self.assertEqual(gl.ibmdata, ibmdata)
+
+    def test_import_reload_other_model_raises_error(self):
+        """Reload mode is not supported for models other than GLPivDownload"""
+        with self.assertRaises(ValueError):
+            ibms_import_from_csv(self.csv_path, self.fy, IBMData, mode="reload")
+
     def test_import_invalid_date_raises_error(self):
         """A row with an unparseable downloadPeriod should raise IBMSValidationError"""
         bad_csv = tempfile.NamedTemporaryFile(mode="w", suffix=".csv", delete=False)
@@ -351,6 +800,36 @@ class IbmsImportFromCsvIBMDataTest(IbmsTestCase):
         desc, count = ibms_import_from_csv(self.csv_path, self.fy, IBMData, user=None)
         self.assertEqual(count, 4)
 
+    def test_import_creates_single_revision(self):
+        """All IBMData records in one upload should be versioned under a single revision"""
+        ibms_import_from_csv(self.csv_path, self.fy, IBMData, user=self.user)
+        self.assertEqual(Revision.objects.count(), 1)
+        revision = Revision.objects.get()
+        self.assertEqual(revision.user, self.user)
+        self.assertEqual(revision.version_set.count(), 4)
+
+    def test_import_reports_progress_per_batch(self):
+        """Progress should be reported after each batch of IBMData records is committed"""
+        progress = MagicMock()
+        with self.settings(CSV_IMPORT_BATCH_SIZE=2):
+            ibms_import_from_csv(self.csv_path, self.fy, IBMData, progress=progress)
+        progress.assert_any_call("importing", 2, 2)
+        progress.assert_any_call("importing", 4, 4)
+
+    def test_import_start_row_skips_committed_rows(self):
+        """Resuming an import from start_row should skip rows that were already committed"""
+        desc, count = ibms_import_from_csv(self.csv_path, self.fy, IBMData, start_row=2)
+        self.assertEqual(count, 4)
+        self.assertFalse(IBMData.objects.filter(fy=self.fy, ibmIdentifier="418-01-12-GC2-GAS1-945").exists())
+        self.assertEqual(IBMData.objects.filter(fy=self.fy).count(), 3)  # 2 new + 1 from setUp
+
+    def test_import_links_service_priority(self):
+        """Imported IBMData should be linked to a matching service priority in the same FY"""
+        sp = mixer.blend(GeneralServicePriority, fy=self.fy, servicePriorityNo="General 01")
+        ibms_import_from_csv(self.csv_path, self.fy, IBMData)
+        ibm = IBMData.objects.get(fy=self.fy, ibmIdentifier="418-01-12-GC2-GAS1-945")
+        self.assertEqual(ibm.service_priority, sp)
+
     def test_import_invalid_account_raises_error(self):
         """A non-integer account value should raise IBMSValidationError"""
         bad_csv = tempfile.NamedTemporaryFile(mode="w", suffix=".csv", delete=False)
@@ -480,6 +959,32 @@ class IbmsImportFromCsvGeneralServicePriorityTest(IbmsTestCase):
         self.assertEqual(gsp.categoryID, "General-All")
         self.assertEqual(gsp.description, "Organisational Support - Mgt & Ops Sup ")
 
+    def test_import_links_corporate_strategy_and_strategic_plan(self):
+        """Imported GeneralServicePriority should be linked to matching CorporateStrategy and NCStrategicPlan records"""
+        cs = mixer.blend(CorporateStrategy, fy=self.fy, corporateStrategyNo="E&C-01")
+        sp = mixer.blend(NCStrategicPlan, fy=self.fy, strategicPlanNo="General 01")
+        ibms_import_from_csv(self.csv_path, self.fy, GeneralServicePriority)
+        gsp = GeneralServicePriority.objects.get(fy=self.fy, servicePriorityNo="General 01")
+        self.assertEqual(gsp.corporate_strategy, cs)
+        self.assertEqual(gsp.strategic_plan, sp)
+        self.assertIsNone(GeneralServicePriority.objects.get(fy=self.fy, servicePriorityNo="General 02").corporate_strategy)
+
+    def test_import_updates_existing_record(self):
+        """Re-importing should update an existing GeneralServicePriority, relinking its corporate strategy"""
+        cs = mixer.blend(CorporateStrategy, fy=self.fy, corporateStrategyNo="E&C-01")
+        other = mixer.blend(CorporateStrategy, fy=self.fy, corporateStrategyNo="Other")
+        mixer.blend(GeneralServicePriority, fy=self.fy, servicePriorityNo="General 01", categoryID="Old", corporate_strategy=other)
+        ibms_import_from_csv(self.csv_path, self.fy, GeneralServicePriority)
+        gsp = GeneralServicePriority.objects.get(fy=self.fy, servicePriorityNo="General 01")
+        self.assertEqual(gsp.categoryID, "General-All")
+        self.assertEqual(gsp.corporate_strategy, cs)
+
+    def test_import_query_count_is_independent_of_row_count(self):
+        """Records should be written in batches, not with several queries per row"""
+        # Two preload queries and one INSERT ... ON CONFLICT, plus the relink statements, locks and data version updates.
+        with self.assertNumQueries(16):
+            ibms_import_from_csv(self.csv_path, self.fy, GeneralServicePriority)
+
 
 class IbmsImportFromCsvNCServicePriorityTest(IbmsTestCase):
     """Test ibms_import_from_csv for NCServicePriority using real test CSV data."""
@@ -595,6 +1100,68 @@ class IbmsImportFromCsvServicePriorityMappingTest(IbmsTestCase):
         spm = ServicePriorityMapping.objects.get(fy=self.fy, costCentreNo="151")
         self.assertEqual(spm.forestManagement, "")
 
+    def test_import_does_not_duplicate_existing_records(self):
+        """Re-importing the same ServicePriorityMapping CSV should not create duplicate records"""
+        ibms_import_from_csv(self.csv_path, self.fy, ServicePriorityMapping)
+        ibms_import_from_csv(self.csv_path, self.fy, ServicePriorityMapping)
+        self.assertEqual(ServicePriorityMapping.objects.filter(fy=self.fy).count(), 4)
+
+
+class RelinkFinancialYearTest(IbmsTestCase):
+    """Test relink_financial_year, which recomputes links independently of upload order."""
+
+    def test_corporate_strategy_uploaded_after_service_priority(self):
+        """Uploading a CorporateStrategy after its service priorities should link them"""
+        gsp = mixer.blend(GeneralServicePriority, fy=self.fy, servicePriorityNo="General 01", corporateStrategyNo="S01")
+        self.assertIsNone(gsp.corporate_strategy)
+        ibms_import_from_csv(os.path.join(TEST_DATA_DIR, "corporatestrategy_upload_test.csv"), self.fy, CorporateStrategy)
+        gsp.refresh_from_db()
+        self.assertEqual(gsp.corporate_strategy.corporateStrategyNo, "S01")
+
+    def test_ibmdata_links_by_precedence(self):
+        """IBMData should link to a GeneralServicePriority in preference to other service priority models"""
+        ncsp = mixer.blend(NCServicePriority, fy=self.fy, servicePriorityNo="SP01")
+        ibm = mixer.blend(IBMData, fy=self.fy, servicePriorityID="SP01", content_type=None, object_id=None)
+        relink_financial_year(self.fy)
+        ibm.refresh_from_db()
+        self.assertEqual(ibm.service_priority, ncsp)
+        gsp = mixer.blend(GeneralServicePriority, fy=self.fy, servicePriorityNo="SP01")
+        counts = relink_financial_year(self.fy)
+        ibm.refresh_from_db()
+        self.assertEqual(ibm.service_priority, gsp)
+        self.assertEqual(counts["IBM data"], 1)
+
+    def test_stale_links_are_replaced_or_cleared(self):
+        """Links which no longer match should be replaced, or cleared if there is no match"""
+        cs = mixer.blend(CorporateStrategy, fy=self.fy, corporateStrategyNo="S01")
+        gsp = mixer.blend(
+            GeneralServicePriority, fy=self.fy, servicePriorityNo="General 01", corporateStrategyNo="S02", corporate_strategy=cs
+        )
+        other = mixer.blend(IBMData, fy=self.fy, ibmIdentifier="OTHER")
+        gl = mixer.blend(GLPivDownload, fy=self.fy, codeID=self.ibmdata.ibmIdentifier, ibmdata=other, department_program=None)
+        relink_financial_year(self.fy)
+        gsp.refresh_from_db()
+        gl.refresh_from_db()
+        self.assertIsNone(gsp.corporate_strategy)
+        self.assertEqual(gl.ibmdata, self.ibmdata)
+
+    def test_data_version_is_bumped(self):
+        """Imports and relinks should bump the data version of the financial year"""
+        ibms_import_from_csv(os.path.join(TEST_DATA_DIR, "corporatestrategy_upload_test.csv"), self.fy, CorporateStrategy)
+        self.fy.refresh_from_db()
+        version = self.fy.data_version
+        self.assertGreater(version, 0)
+        relink_financial_year(self.fy)
+        self.fy.refresh_from_db()
+        self.assertEqual(self.fy.data_version, version + 1)
+
+    def test_unchanged_links_are_not_written(self):
+        """A second relink should not update any rows"""
+        mixer.blend(GeneralServicePriority, fy=self.fy, servicePriorityNo=self.ibmdata.servicePriorityID)
+        mixer.blend(GLPivDownload, fy=self.fy, codeID=self.ibmdata.ibmIdentifier)
+        relink_financial_year(self.fy)
+        self.assertEqual(relink_financial_year(self.fy), {"service priority": 0, "IBM data": 0, "GL pivot download": 0})
+
 
 class IbmsImportFromCsvBlobClientTest(IbmsTestCase):
     """Test ibms_import_from_csv routes to blobload_context when given a BlobClient."""
@@ -604,6 +1171,7 @@ class IbmsImportFromCsvBlobClientTest(IbmsTestCase):
         """Passing a BlobClient source should use blobload_context, not csvload_context"""
         import csv
         import io
+
         from azure.storage.blob import BlobClient
 
         rows = [
@@ -621,5 +1189,5 @@ class IbmsImportFromCsvBlobClientTest(IbmsTestCase):
         mock_blob.__class__ = BlobClient
         desc, count = ibms_import_from_csv(mock_blob, self.fy, IBMData)
 
-        mock_blobload.assert_called_once_with(mock_blob)
+        mock_blobload.assert_called_once_with(mock_blob, None)
         self.assertEqual(count, 1)
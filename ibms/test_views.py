@@ -1,14 +1,37 @@
+import csv
+import gzip
+import hashlib
+import io
 import os
+import zipfile
 from datetime import date
+from unittest.mock import MagicMock, patch
 
+from django.contrib.contenttypes.models import ContentType
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import override_settings
 from django.test.client import Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from mixer.backend.django import mixer
 from reversion.models import Version
-
-from ibms.models import FinancialYear, GLPivDownload, IBMData
-from ibms.tests import IbmsTestCase
+from xlrd import open_workbook
+
+from ibms.models import (
+    CorporateStrategy,
+    DepartmentProgram,
+    FinancialYear,
+    GeneralServicePriority,
+    GLPivDownload,
+    IBMData,
+    ImportBatch,
+    ImportJob,
+    ReportJob,
+)
+from ibms.reports import download_report
+from ibms.tasks import generate_download
+from ibms.tests import FakeBlobClient, IbmsTestCase
 
 
 class IbmsViewsTest(IbmsTestCase):
@@ -182,6 +205,7 @@ class ClearGLPivotViewTest(IbmsTestCase):
 
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, "Deleted 3 GL Pivot entries")
+        self.assertEqual(FinancialYear.objects.get(pk=self.fy.pk).data_version, 1)
 
     def test_clear_glpivot_cancel_button_redirects(self):
         """Clear GLPivot cancel button should not delete records"""
@@ -249,6 +273,155 @@ class UploadViewTest(IbmsTestCase):
         # Should redirect with error message
         self.assertEqual(response.status_code, 302)
 
+    def test_upload_lists_import_jobs(self):
+        """The upload page should list recent import jobs"""
+        mixer.blend(ImportJob, user=self.admin, fy=self.fy, blob_name="ibmdata_upload.csv", status="importing")
+        url = reverse("ibms:upload")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "ibmdata_upload.csv")
+        self.assertTrue(response.context["import_jobs_active"])
+
+    def test_import_jobs_json(self):
+        """The import jobs endpoint should return job progress to superusers only"""
+        job = mixer.blend(ImportJob, user=self.admin, fy=self.fy, status="importing", rows_processed=4000, rows_committed=2000)
+        url = reverse("ibms:ajax_import_jobs")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        jobs = response.json()["jobs"]
+        self.assertEqual(jobs[0]["id"], job.pk)
+        self.assertEqual(jobs[0]["rows_committed"], 2000)
+        self.assertTrue(jobs[0]["active"])
+        self.client.logout()
+        self.client.login(username="testuser", password="test")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 403)
+
+
+class UploadViewDuplicateTest(IbmsTestCase):
+    """Tests for the UploadView content-hash deduplication of uploaded files."""
+
+    client = Client()
+
+    def upload(self, content=b"ibmIdentifier\r\n", force_reprocess=False):
+        """Post an upload with a mocked Azure BlobServiceClient and task, returning the (mocked) BlobClient and task."""
+        data = {
+            "upload_file_type": "ibm_data",
+            "upload_file": SimpleUploadedFile("ibmdata_upload.csv", content, content_type="text/csv"),
+            "financial_year": self.fy.financialYear,
+            "force_reprocess": force_reprocess,
+        }
+        with (
+            patch.dict(os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "test"}),
+            patch("ibms.views.BlobServiceClient") as blob_service,
+            patch("ibms.views.process_uploaded_csv") as task,
+        ):
+            blob_client = blob_service.from_connection_string.return_value.get_blob_client.return_value
+            # Read the uploaded stream in small chunks, as the Azure client does.
+            blob_client.upload_blob.side_effect = lambda stream, **kwargs: list(iter(lambda: stream.read(4), b""))
+            response = self.client.post(reverse("ibms:upload"), data=data, follow=True)
+        self.assertEqual(response.status_code, 200)
+        return blob_client, task
+
+    def test_upload_records_content_hash(self):
+        """An upload should record the hash of the file content on the import job"""
+        _, task = self.upload()
+        job = ImportJob.objects.get()
+        self.assertEqual(job.content_hash, hashlib.sha256(b"ibmIdentifier\r\n").hexdigest())
+        task.enqueue.assert_called_once_with(job.pk)
+
+    def test_upload_blob_names_are_unique(self):
+        """Each upload should be stored as its own blob, even if the file name is reused"""
+        self.upload()
+        self.upload(content=b"ibmIdentifier\r\nchanged\r\n")
+        blob_names = ImportJob.objects.values_list("blob_name", flat=True)
+        self.assertEqual(len(set(blob_names)), 2)
+        for blob_name in blob_names:
+            self.assertRegex(blob_name, r"^upload-[0-9a-f]{32}/ibmdata_upload\.csv$")
+
+    def test_duplicate_upload_skipped(self):
+        """Uploading identical content again should skip the import and delete the blob"""
+        self.upload()
+        ImportJob.objects.update(status="complete")
+        blob_client, task = self.upload()
+        task.enqueue.assert_not_called()
+        blob_client.delete_blob.assert_called_once()
+        self.assertEqual(ImportJob.objects.first().status, "skipped")
+
+    def test_changed_upload_imported(self):
+        """Uploading different content, or identical content after a failed import, should import the file"""
+        self.upload()
+        ImportJob.objects.update(status="complete")
+        _, task = self.upload(content=b"ibmIdentifier\r\nchanged\r\n")
+        task.enqueue.assert_called_once()
+        ImportJob.objects.update(status="failed")
+        _, task = self.upload(content=b"ibmIdentifier\r\nchanged\r\n")
+        task.enqueue.assert_called_once()
+
+    def test_force_reprocess(self):
+        """Force reprocess should import a file even if identical content has been imported"""
+        self.upload()
+        ImportJob.objects.update(status="complete")
+        _, task = self.upload(force_reprocess=True)
+        task.enqueue.assert_called_once()
+        self.assertFalse(ImportJob.objects.filter(status="skipped").exists())
+
+
+class BatchUploadViewTest(IbmsTestCase):
+    """Tests for the BatchUploadView."""
+
+    client = Client()
+
+    def setUp(self):
+        super().setUp()
+        self.client.login(username="admin", password="test")
+
+    def post(self, files):
+        """Post a batch upload with a mocked Azure BlobServiceClient and task, returning the response and task."""
+        data = {"upload_files": files, "financial_year": self.fy.financialYear, "import_mode": "reload"}
+        with (
+            patch.dict(os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "test"}),
+            patch("ibms.views.BlobServiceClient") as blob_service,
+            patch("ibms.views.process_import_batch") as task,
+        ):
+            blob_service.from_connection_string.return_value.get_blob_client.side_effect = lambda container, blob: MagicMock(blob_name=blob)
+            response = self.client.post(reverse("ibms:upload_batch"), data=data, follow=True)
+        return response, task
+
+    def test_batch_upload_zip_and_csv(self):
+        """A zip file and CSV files named after their file types should be uploaded as one batch"""
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            archive.writestr("corp_strategy.csv", "IBMSCSNo,IBMSCSDesc1,IBMSCSDesc2\r\n")
+            archive.writestr("general_sp.csv", "CategoryID,SerPriNo,StratPlanNo,IBMCS,Description 1,Description 2\r\n")
+        files = [
+            SimpleUploadedFile("ibms_refresh.zip", buffer.getvalue(), content_type="application/zip"),
+            SimpleUploadedFile("gl_pivot_download.csv", b"Download Period\r\n", content_type="text/csv"),
+        ]
+        response, task = self.post(files)
+        self.assertEqual(response.status_code, 200)
+        batch = ImportBatch.objects.get()
+        task.enqueue.assert_called_once_with(batch.pk)
+        jobs = {job.file_type: job for job in batch.jobs.all()}
+        self.assertEqual(set(jobs), {"corp_strategy", "general_sp", "gl_pivot_download"})
+        self.assertEqual(jobs["gl_pivot_download"].import_mode, "reload")
+        self.assertEqual(jobs["corp_strategy"].import_mode, "append")
+        self.assertEqual(jobs["corp_strategy"].blob_name, f"batch-{batch.pk}/corp_strategy.csv")
+
+    def test_batch_upload_rejects_unknown_file_names(self):
+        """Files which are not named after a file type should be rejected"""
+        response, task = self.post([SimpleUploadedFile("export.csv", b"a,b\r\n", content_type="text/csv")])
+        self.assertContains(response, "is not named after an upload file type")
+        task.enqueue.assert_not_called()
+        self.assertFalse(ImportBatch.objects.exists())
+
+    def test_batch_upload_superuser_only(self):
+        """Non-superusers should be denied access to batch upload"""
+        self.client.logout()
+        self.client.login(username="testuser", password="test")
+        response = self.client.get(reverse("ibms:upload_batch"))
+        self.assertEqual(response.status_code, 302)
+
 
 class DataAmendmentListViewTest(IbmsTestCase):
     """Tests for DataAmendmentListView filtering and pagination."""
@@ -281,6 +454,447 @@ class DataAmendmentListViewTest(IbmsTestCase):
         self.assertContains(response, ibmdata.ibmIdentifier)
 
 
+class CodeUpdateAdminViewTest(IbmsTestCase):
+    """Tests for the CodeUpdateAdminView exceptions report."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.login(username="admin", password="test")
+        # A GL code which has a matching IBMData record is not an exception.
+        mixer.blend(GLPivDownload, fy=self.fy, codeID=self.ibmdata.ibmIdentifier, account=1, service=12, activity="GC2", resource=542)
+
+    def create_codes(self, start, count):
+        """Create GL records for `count` unmatched codeIDs, each having two resources with template columns (0542 and
+        0705) and two without (which are totalled in the 0000 column).
+        """
+        for i in range(start, start + count):
+            for resource, ytd in ((542, 10), (705, 20), (1, 1), (2, 2)):
+                mixer.blend(
+                    GLPivDownload,
+                    fy=self.fy,
+                    codeID=f"998-01-12-GC2-{i:04d}-ABC",
+                    costCentre="998",
+                    account=1,
+                    service=12,
+                    activity="GC2",
+                    project=f"{i:04d}",
+                    job="ABC",
+                    resource=resource,
+                    ytdActual=ytd,
+                )
+
+    def post(self):
+        return self.client.post(reverse("ibms:code_update_admin"), {"financial_year": self.fy.financialYear, "report_type": "no-dj0"})
+
+    def test_code_update_report(self):
+        """The report should have one row per unmatched codeID, with resource totals pivoted into columns"""
+        self.create_codes(0, 3)
+        response = self.post()
+        self.assertEqual(response.status_code, 200)
+        sheet = open_workbook(file_contents=response.content).sheet_by_index(0)
+        self.assertEqual(sheet.col_values(0, 4, 7), [f"998-01-12-GC2-{i:04d}-ABC" for i in range(3)])
+        self.assertEqual(sheet.cell_value(7, 0), "")
+        self.assertEqual(sheet.cell_value(8, 0), "#END OF INPUT")
+        self.assertEqual([sheet.cell_value(4, i) for i in (21, 22, 23, 24)], [3, 10, 20, ""])
+
+    def test_code_update_report_query_count(self):
+        """The number of queries should not depend on the number of codeIDs in the report"""
+        self.create_codes(0, 2)
+        with CaptureQueriesContext(connection) as queries:
+            self.post()
+        self.create_codes(2, 8)
+        with self.assertNumQueries(len(queries)):
+            self.post()
+
+
+class CodeUpdateBatchViewTest(IbmsTestCase):
+    """Tests for the CodeUpdateBatchView and the download of generated reports."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.login(username="admin", password="test")
+
+    def post(self, data):
+        """Post the form with a mocked task, returning the response and task."""
+        with patch.dict(os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "test"}), patch("ibms.views.generate_code_update_batch") as task:
+            response = self.client.post(reverse("ibms:code_update_batch"), data=data, follow=True)
+        return response, task
+
+    def test_code_update_batch_enqueues_task(self):
+        """Posting the form should record a ReportJob of the filters and enqueue the task"""
+        mixer.blend(GLPivDownload, fy=self.fy, regionBranch="Pilbara")
+        response, task = self.post({"financial_year": self.fy.financialYear, "report_type": "dj0", "region": "Pilbara"})
+        self.assertEqual(response.status_code, 200)
+        job = ReportJob.objects.get()
+        task.enqueue.assert_called_once_with(job.pk)
+        self.assertEqual((job.user, job.fy, job.report), (self.admin, self.fy, "code_update_batch"))
+        self.assertEqual(job.parameters["report_type"], "dj0")
+        self.assertEqual(job.parameters["region"], "Pilbara")
+        self.assertContains(response, "Generating code update workbooks")
+
+    def test_code_update_batch_superuser_only(self):
+        """Non-superusers should be denied access to the batch code update"""
+        self.client.logout()
+        self.client.login(username="testuser", password="test")
+        response, task = self.post({"financial_year": self.fy.financialYear, "report_type": "dj0"})
+        self.assertRedirects(response, reverse("site_home"))
+        task.enqueue.assert_not_called()
+
+    def test_report_job_download(self):
+        """A complete report should be streamed from blob storage to the user who requested it, and to superusers"""
+        job = ReportJob.objects.create(
+            user=self.user, fy=self.fy, report="code_update_batch", status="complete", blob_name="reports/test.zip", file_name="test.zip"
+        )
+        blob_client = MagicMock()
+        blob_client.download_blob.return_value.chunks.side_effect = lambda: iter([b"PK", b"zip"])
+        for username in ("testuser", "admin"):
+            self.client.login(username=username, password="test")
+            with patch("ibms.views.upload_blob_client", return_value=blob_client):
+                response = self.client.get(job.get_absolute_url())
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Content-Disposition"], 'attachment; filename="test.zip"')
+            self.assertEqual(b"".join(response.streaming_content), b"PKzip")
+
+        # Other users can't download the report.
+        self.client.login(username=self._create_user("other").username, password="test")
+        self.assertEqual(self.client.get(job.get_absolute_url()).status_code, 403)
+
+    def test_report_job_download_incomplete(self):
+        """An incomplete report can't be downloaded"""
+        job = ReportJob.objects.create(user=self.admin, fy=self.fy, report="code_update_batch")
+        self.assertEqual(self.client.get(job.get_absolute_url()).status_code, 400)
+
+
+class DataAmendmentReportViewTest(IbmsTestCase):
+    """Tests for the data amendment and service priority workbook downloads."""
+
+    def create_codes(self, start, count, cost_centre="998"):
+        """Create an IBMData record and two GL records (with totals of 30 YTD actual and 300 FY budget) for each of
+        `count` codeIDs, and an unmatched GL record.
+        """
+        for i in range(start, start + count):
+            code_id = f"{cost_centre}-01-12-GC2-{i:04d}-ABC"
+            mixer.blend(
+                IBMData, fy=self.fy, ibmIdentifier=code_id, costCentre=cost_centre, budgetArea=f"Area {i}", projectSponsor="Sponsor"
+            )
+            for ytd in (10, 20):
+                mixer.blend(
+                    GLPivDownload,
+                    fy=self.fy,
+                    codeID=code_id,
+                    costCentre=cost_centre,
+                    regionBranch="Pilbara",
+                    account=1,
+                    service=12,
+                    activity="GC2",
+                    project=f"{i:04d}",
+                    job="ABC",
+                    ytdActual=ytd,
+                    fybudget=ytd * 10,
+                )
+        mixer.blend(GLPivDownload, fy=self.fy, codeID=f"{cost_centre}-99-99-GC2-0000-ABC", costCentre=cost_centre, regionBranch="Pilbara")
+
+    def post(self, url, **data):
+        return self.client.post(reverse(url), {"financial_year": self.fy.financialYear, **data})
+
+    def test_data_amendment_report(self):
+        """The report should have one row per matched codeID, with its IBMData values and totals"""
+        self.create_codes(0, 3)
+        response = self.post("ibms:data_amendment_report", cost_centre="998")
+        self.assertEqual(response.status_code, 200)
+        workbook = open_workbook(file_contents=response.content)
+        sheet = workbook.sheet_by_index(0)
+        self.assertEqual(sheet.col_values(0, 4, 7), [f"998-01-12-GC2-{i:04d}-ABC" for i in range(3)])
+        self.assertEqual([sheet.cell_value(4, i) for i in (10, 11, 20, 21)], ["Area 0", "Sponsor", 30, 300])
+        self.assertEqual(sheet.cell_value(8, 0), "#END OF INPUT")
+        # Sheet 3 has the lookup values of the cost centre.
+        self.assertEqual(workbook.sheet_by_index(2).col_values(0, 1, 4), ["Area 0", "Area 1", "Area 2"])
+
+    def test_data_amendment_report_filters(self):
+        """The budget area filter should limit the codeIDs, but not the lookup values"""
+        self.create_codes(0, 3)
+        response = self.post("ibms:data_amendment_report", region="Pilbara", budget_area="Area 1")
+        workbook = open_workbook(file_contents=response.content)
+        self.assertEqual(workbook.sheet_by_index(0).col_values(0, 4, 6), ["998-01-12-GC2-0001-ABC", ""])
+        self.assertEqual(workbook.sheet_by_index(2).col_values(0, 1, 4), ["Area 0", "Area 1", "Area 2"])
+
+    def test_service_priority_report(self):
+        """The report should have one row per matched codeID, with its IBMData values and totals"""
+        self.create_codes(0, 2)
+        response = self.post("ibms:service_priority_report", cost_centre="998")
+        self.assertEqual(response.status_code, 200)
+        sheet = open_workbook(file_contents=response.content).sheet_by_index(0)
+        self.assertEqual(sheet.col_values(0, 4, 6), [f"998-01-12-GC2-{i:04d}-ABC" for i in range(2)])
+        self.assertEqual([sheet.cell_value(5, i) for i in (10, 16, 17)], ["Area 1", 30, 300])
+        self.assertEqual(sheet.cell_value(7, 0), "#END OF INPUT")
+
+    def test_report_query_count(self):
+        """The number of queries should not depend on the number of codeIDs in the report"""
+        self.create_codes(0, 2)
+        for start, url in ((10, "ibms:data_amendment_report"), (20, "ibms:service_priority_report")):
+            with CaptureQueriesContext(connection) as queries:
+                self.post(url, region="Pilbara")
+            self.create_codes(start, 5, cost_centre="997")
+            with self.assertNumQueries(len(queries)):
+                self.post(url, region="Pilbara")
+
+    def test_report_requires_cost_centre_or_region(self):
+        """Non-superusers must choose a cost centre or region/branch"""
+        response = self.post("ibms:data_amendment_report")
+        self.assertContains(response, "You must choose either Cost Centre OR Region/Branch")
+
+
+class ReloadReportViewTest(IbmsTestCase):
+    """Tests for the IBM data reload workbook download."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.login(username="admin", password="test")
+        jobs = (("010", "Ten"), ("2", "Two"), ("ABC", "Letters"), ("010", "Ten"), ("2", "Two again"), ("", "None"))
+        for i, (job, job_name) in enumerate(jobs):
+            mixer.blend(GLPivDownload, fy=self.fy, costCentre="999", gLCode=f"GL-{5 - i}", shortCode=f"S{i}", job=job, jobName=job_name)
+
+    def post(self, **data):
+        return self.client.post(reverse("ibms:reload_report"), {"financial_year": self.fy.financialYear, **data})
+
+    def test_reload_report(self):
+        """Jobs should be distinct, with numeric jobs first; GL codes should be sorted"""
+        mixer.blend(IBMData, fy=self.fy, costCentre="998", ibmIdentifier="998-01-12-GC2-0000-ABC", project="0000", job="ABC")
+        response = self.post(cost_centre="999")
+        self.assertEqual(response.status_code, 200)
+        workbook = open_workbook(file_contents=response.content)
+        # IBMData of the cost centre only.
+        self.assertEqual(workbook.sheet_by_index(0).col_values(0, 3), [999])
+        self.assertEqual(workbook.sheet_by_index(2).col_values(0), [f"GL-{i}" for i in range(6)])
+        sheet = workbook.sheet_by_index(3)
+        jobs = list(zip(sheet.col_values(0), sheet.col_values(1)))
+        self.assertEqual(jobs, [("2", "Two"), ("2", "Two again"), ("10", "Ten"), ("", "None"), ("ABC", "Letters")])
+
+    def test_reload_report_query_count(self):
+        """The number of queries should not depend on the number of records in the report"""
+        with CaptureQueriesContext(connection) as queries:
+            self.post()
+        for i in range(10):
+            mixer.blend(IBMData, fy=self.fy, costCentre="999", ibmIdentifier=f"999-{i}", project="0000", job="ABC")
+            mixer.blend(GLPivDownload, fy=self.fy, costCentre="999", gLCode=f"GL-X{i}", job=f"{i}")
+        with self.assertNumQueries(len(queries)):
+            self.post()
+
+    def test_reload_report_row_limit(self):
+        """A report with more rows than an .xls worksheet holds should be refused"""
+        with patch("ibms.reports.XLS_MAX_ROWS", 5):
+            response = self.post()
+        self.assertContains(response, "Sheet3 has more than the 5 rows that an .xls worksheet can hold")
+
+
+class DownloadViewTest(IbmsTestCase):
+    """Tests for the CSV download reports."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.login(username="admin", password="test")
+        corporate_strategy = mixer.blend(CorporateStrategy, fy=self.fy, corporateStrategyNo="CS1", description1="Strategy")
+        service_priority = mixer.blend(
+            GeneralServicePriority, fy=self.fy, corporate_strategy=corporate_strategy, description="SP one", description2="SP two"
+        )
+        IBMData.objects.filter(pk=self.ibmdata.pk).update(
+            content_type=ContentType.objects.get_for_model(GeneralServicePriority), object_id=service_priority.pk, marineKPI="KPI"
+        )
+        department_program = mixer.blend(DepartmentProgram, fy=self.fy, dept_program1="Program 1", dept_program2=None)
+        mixer.blend(GLPivDownload, fy=self.fy, codeID="LINKED", ibmdata=self.ibmdata, department_program=department_program)
+        mixer.blend(GLPivDownload, fy=self.fy, codeID="UNLINKED")
+
+    def download(self, view):
+        response = self.client.post(reverse(f"ibms:{view}"), {"financial_year": self.fy.financialYear})
+        self.assertEqual(response.status_code, 200)
+        headers, *rows = csv.reader(io.StringIO(b"".join(response.streaming_content).decode()))
+        return {row[0]: dict(zip(headers, row, strict=True)) for row in rows}
+
+    def test_download_columns(self):
+        """Each download variant should have its own columns, with blank values where a row has no linked object"""
+        for view, columns in (("download", 50), ("download_enhanced", 53), ("download_dept_program", 56)):
+            rows = self.download(view)
+            linked, unlinked = rows["LINKED"], rows["UNLINKED"]
+            self.assertEqual(len(linked), columns)
+            self.assertEqual(linked["Financial Year"], self.fy.financialYear)
+            self.assertEqual(linked["Budget Area"], "Admin")
+            self.assertEqual(linked["Corporate Strategy No"], "CS1")
+            self.assertEqual(linked["Corp Strategy Description 1"], "Strategy")
+            self.assertEqual(linked["Strategic Plan No"], "")
+            self.assertEqual(linked["Service Priority Description 1"], "SP one")
+            self.assertEqual(linked["Service Priority Description 2"], "SP two")
+            self.assertEqual(unlinked["Budget Area"], "")
+            self.assertEqual(unlinked["Service Priority Description 1"], "")
+            self.assertEqual("ptd Budget" in linked, view == "download")
+            self.assertEqual(linked.get("Marine KPI"), None if view == "download" else "KPI")
+            if view == "download_dept_program":
+                self.assertEqual((linked["Dept Program 1"], linked["Dept Program 2"]), ("Program 1", ""))
+                self.assertEqual(unlinked["Dept Program 1"], "")
+
+    def test_download_chunks(self):
+        """Rows should be buffered into chunks of the configured size, following the header row"""
+        for i in range(20):
+            mixer.blend(GLPivDownload, fy=self.fy, codeID=f"CODE-{i}")
+        glpiv_qs = GLPivDownload.objects.filter(fy=self.fy).order_by("codeID")
+        rows = list(download_report(glpiv_qs, chunk_size=0))
+        self.assertEqual(len(rows), 23)
+        with self.settings(DOWNLOAD_CHUNK_SIZE=1000):
+            chunks = list(download_report(glpiv_qs))
+        self.assertEqual(chunks[0], rows[0])
+        self.assertLess(len(chunks), len(rows))
+        self.assertTrue(all(len(chunk) >= 1000 for chunk in chunks[1:-1]))
+        self.assertEqual("".join(chunks), "".join(rows))
+
+    def test_download_gzip(self):
+        """The download should be gzip-encoded if the client accepts it, or a .csv.gz file if requested"""
+        url = reverse("ibms:download")
+        response = self.client.post(url, {"financial_year": self.fy.financialYear})
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertIn("Accept-Encoding", response["Vary"])
+        content = b"".join(response.streaming_content)
+
+        response = self.client.post(url, {"financial_year": self.fy.financialYear}, HTTP_ACCEPT_ENCODING="gzip, deflate, br")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), content)
+
+        response = self.client.post(url, {"financial_year": self.fy.financialYear, "compressed": "on"}, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertEqual(response["Content-Disposition"], "attachment; filename=ibms_data_download.csv.gz")
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), content)
+
+
+class DownloadArtifactTest(IbmsTestCase):
+    """Tests for downloads served from cached download artifacts."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.login(username="admin", password="test")
+        for i in range(5):
+            mixer.blend(GLPivDownload, fy=self.fy, costCentre="999", codeID=f"CODE-{i}")
+        self.blobs = {}
+        patcher = patch("ibms.views.upload_blob_client", side_effect=lambda blob_name: FakeBlobClient(self.blobs, blob_name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.url = reverse("ibms:download")
+        self.data = {"financial_year": self.fy.financialYear, "cost_centre": "999"}
+
+    def download(self, **headers):
+        response = self.client.get(self.url, self.data, headers={"Accept-Encoding": "gzip", **headers})
+        return response, b"".join(response.streaming_content) if response.streaming else response.content
+
+    def test_artifact_is_cached(self):
+        """A download should be stored as an artifact, which is served for later downloads of the same data version"""
+        response, content = self.download()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertFalse(response.has_header("ETag"))
+        (blob_name,) = self.blobs
+        self.assertEqual(blob_name, "downloads/download/202425/costCentre-999-" + hashlib.sha256(b"999").hexdigest()[:12] + ".csv.gz")
+        self.assertEqual(self.blobs[blob_name], (content, {"data_version": "0"}))
+
+        with patch("ibms.views.download_report") as download_report:
+            response, cached = self.download()
+        download_report.assert_not_called()
+        self.assertEqual(cached, content)
+        self.assertEqual(response["Content-Length"], str(len(content)))
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertTrue(response.has_header("ETag"))
+
+        # Other filters and report variants are stored separately, once the download is complete.
+        for url, data in ((reverse("ibms:download_enhanced"), self.data), (self.url, {"financial_year": self.fy.financialYear})):
+            count = len(self.blobs)
+            response = self.client.get(url, data)
+            self.assertEqual(len(self.blobs), count)
+            b"".join(response.streaming_content)
+            self.assertEqual(len(self.blobs), count + 1)
+
+    def test_artifact_is_replaced_for_new_data_version(self):
+        """An artifact from an earlier data version of the financial year should be generated again"""
+        _, content = self.download()
+        mixer.blend(GLPivDownload, fy=self.fy, costCentre="999", codeID="CODE-NEW")
+        self.fy.bump_data_version()
+        _, content = self.download()
+        self.assertIn(b"CODE-NEW", gzip.decompress(content))
+        self.assertEqual(list(self.blobs.values()), [(content, {"data_version": "1"})])
+
+    def test_artifact_conditional_and_range_requests(self):
+        """A cached artifact should support conditional requests and single byte ranges"""
+        _, content = self.download()
+        response, _ = self.download()
+        etag = response["ETag"]
+
+        response, _ = self.download(If_None_Match=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response, partial = self.download(Range="bytes=5-24", If_Range=etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes 5-24/{len(content)}")
+        self.assertEqual(partial, content[5:25])
+
+        response, partial = self.download(Range="bytes=-5")
+        self.assertEqual(partial, content[-5:])
+
+        # A range of a different version of the artifact is not served.
+        response, full = self.download(Range="bytes=5-24", If_Range='"other"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(full, content)
+
+        response, _ = self.download(Range=f"bytes={len(content)}-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{len(content)}")
+
+    def test_artifact_decompressed(self):
+        """A cached artifact should be decompressed for a client that does not accept gzip"""
+        _, content = self.download()
+        response = self.client.get(self.url, self.data)
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertTrue(response["ETag"].startswith("W/"))
+        self.assertEqual(b"".join(response.streaming_content), gzip.decompress(content))
+
+        response = self.client.get(self.url, {**self.data, "compressed": "on"})
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertEqual(b"".join(response.streaming_content), content)
+
+    @override_settings(DOWNLOAD_BACKGROUND_ROWS=5)
+    def test_large_download_in_background(self):
+        """A download of at least DOWNLOAD_BACKGROUND_ROWS rows should be generated by a task, and linked once ready"""
+        with patch("ibms.views.generate_download") as task:
+            response = self.client.get(self.url, self.data)
+            self.assertRedirects(response, self.url, fetch_redirect_response=False)
+            job = ReportJob.objects.get()
+            self.assertEqual((job.report, job.user, job.fy), ("download", self.admin, self.fy))
+            self.assertEqual(job.parameters, {"variant": "download", "filters": {"costCentre": "999"}})
+            self.assertEqual(job.file_name, "ibms_data_download.csv.gz")
+            task.enqueue.assert_called_once_with(job.pk)
+            # A download which is already being generated is not queued again.
+            self.client.get(self.url, self.data)
+            self.assertEqual(ReportJob.objects.count(), 1)
+        self.assertFalse(self.blobs)
+
+        with patch("ibms.tasks.upload_blob_client", side_effect=lambda blob_name: FakeBlobClient(self.blobs, blob_name)):
+            generate_download.call(job.pk)
+        job.refresh_from_db()
+        response = self.client.get(self.url)
+        self.assertContains(response, job.get_absolute_url())
+        response = self.client.get(job.get_absolute_url())
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        content = b"".join(response.streaming_content)
+        # Later downloads are served from the artifact generated by the task.
+        self.assertEqual(self.download()[1], content)
+        self.assertEqual(ReportJob.objects.count(), 1)
+
+    @override_settings(DOWNLOAD_BACKGROUND_ROWS=6)
+    def test_small_download_is_streamed(self):
+        """A download of fewer than DOWNLOAD_BACKGROUND_ROWS rows should be streamed by the web worker"""
+        with patch("ibms.views.generate_download") as task:
+            response, _ = self.download()
+        self.assertEqual(response.status_code, 200)
+        task.enqueue.assert_not_called()
+        self.assertFalse(ReportJob.objects.exists())
+
+
 class CodeUpdateCreateViewTest(IbmsTestCase):
     """Tests for CodeUpdateCreateView creating IBMData records."""
 
@@ -386,6 +1000,8 @@ class DataAmendmentUpdateViewTest(IbmsTestCase):
         self.assertEqual(response.status_code, 302)
         ibmdata = IBMData.objects.first()
         self.assertEqual(ibmdata.budgetArea, "Operations")
+        # The amendment should invalidate any cached downloads of the financial year.
+        self.assertEqual(FinancialYear.objects.get(pk=self.fy.pk).data_version, 1)
 
     def test_data_amendment_update_creates_revision(self):
         """DataAmendmentUpdateView should create an audit trail (versions) via django-reversion"""
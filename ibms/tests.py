@@ -1,5 +1,9 @@
+import hashlib
 from random import randint
+from types import SimpleNamespace
+from unittest.mock import MagicMock
 
+from azure.core.exceptions import ResourceNotFoundError
 from django.contrib.auth import get_user_model
 from django.test import TestCase
 from faker import Faker
@@ -52,3 +56,25 @@ class IbmsTestCase(TestCase):
             username=username,
             password="test",
         )
+
+
+class FakeBlobClient:
+    """An in-memory stand-in for an Azure BlobClient, storing blobs in the passed-in dict."""
+
+    def __init__(self, blobs, blob_name):
+        self.blobs = blobs
+        self.blob_name = blob_name
+
+    def get_blob_properties(self):
+        if self.blob_name not in self.blobs:
+            raise ResourceNotFoundError("The specified blob does not exist.")
+        content, metadata = self.blobs[self.blob_name]
+        return SimpleNamespace(size=len(content), etag=f'"{hashlib.md5(content).hexdigest()}"', metadata=metadata)
+
+    def upload_blob(self, data, overwrite=False, metadata=None, **kwargs):
+        self.blobs[self.blob_name] = (data.read(), metadata)
+
+    def download_blob(self, offset=0, length=None, **kwargs):
+        content = self.blobs[self.blob_name][0]
+        content = content[offset : offset + length if length else None]
+        return MagicMock(chunks=lambda: iter([content[:10], content[10:]]))
@@ -2,30 +2,43 @@ from django.urls import path
 
 from ibms.models import GLPivDownload, IBMData, ServicePriorityMapping
 from ibms.views import (
+    BatchUploadView,
     ClearGLPivotView,
     CodeUpdateAdminView,
+    CodeUpdateBatchView,
     CodeUpdateCreateView,
     DataAmendmentList,
+    DataAmendmentReportView,
     DataAmendmentUpdate,
     DownloadDeptProgramView,
     DownloadEnhancedView,
     DownloadView,
     IbmsModelFieldJSON,
+    ImportJobJSON,
+    ReloadReportView,
+    ReportJobDownloadView,
     ServicePriorityMappingJSON,
+    ServicePriorityReportView,
     UploadView,
 )
 
 app_name = "ibms"
 urlpatterns = [
     path("upload/", UploadView.as_view(), name="upload"),
+    path("upload/batch/", BatchUploadView.as_view(), name="upload_batch"),
     path("download/", DownloadView.as_view(), name="download"),
     path("download-enhanced/", DownloadEnhancedView.as_view(), name="download_enhanced"),
     path("download-dept-program/", DownloadDeptProgramView.as_view(), name="download_dept_program"),
     path("code-update/", CodeUpdateCreateView.as_view(), name="code_update"),
     path("code-update-admin/", CodeUpdateAdminView.as_view(), name="code_update_admin"),
+    path("code-update-admin/batch/", CodeUpdateBatchView.as_view(), name="code_update_batch"),
     path("data-amendment/", DataAmendmentList.as_view(), name="data_amendment_list"),
     path("data-amendment/<int:pk>/", DataAmendmentUpdate.as_view(), name="data_amendment_update"),
+    path("data-amendment/report/", DataAmendmentReportView.as_view(), name="data_amendment_report"),
+    path("service-priority/", ServicePriorityReportView.as_view(), name="service_priority_report"),
+    path("reload/", ReloadReportView.as_view(), name="reload_report"),
     path("clear-gl-pivot/", ClearGLPivotView.as_view(), name="clearglpivot"),
+    path("reports/<int:pk>/download/", ReportJobDownloadView.as_view(), name="report_job_download"),
     # AJAX model field endpoints.
     # Note to future self: these views return JSON data suitable for insert
     # into form select lists. In some cases, the background query requires text
@@ -85,6 +98,7 @@ urlpatterns = [
         IbmsModelFieldJSON.as_view(model=GLPivDownload, fieldname="division"),
         name="ajax_glpivdownload_division",
     ),
+    path("ajax/import-jobs/", ImportJobJSON.as_view(), name="ajax_import_jobs"),
     path(
         "ajax/mappings",
         ServicePriorityMappingJSON.as_view(model=ServicePriorityMapping, fieldname="wildlifeManagement, parksManagement, forestManagement"),
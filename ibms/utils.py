@@ -1,17 +1,33 @@
 import codecs
 import csv
+import hashlib
 import io
+import itertools
+import logging
 import os
-from contextlib import contextmanager
+import time
+import zlib
+from contextlib import contextmanager, nullcontext
 from datetime import date, datetime
-from typing import Literal, Optional, Sequence, Tuple
+from decimal import Decimal, InvalidOperation
+from typing import Callable, Dict, Iterable, Iterator, List, Literal, NamedTuple, Optional, Sequence, Tuple
 
 from azure.storage.blob import BlobClient
 from django.conf import settings
 from django.contrib.auth.models import User
-from reversion import create_revision, set_comment, set_user
+from django.contrib.contenttypes.models import ContentType
+from django.db import DatabaseError, connection, transaction
+from reversion import add_to_revision, create_revision, set_comment, set_user
+
+try:
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.csv
+except ImportError:  # pyarrow is optional; see CSV_PARSER_ENGINE.
+    pyarrow = None
 
 from ibms.models import (
+    SERVICE_PRIORITY_MODELS,
     CorporateStrategy,
     DepartmentProgram,
     ERServicePriority,
@@ -26,6 +42,29 @@ from ibms.models import (
     SFMServicePriority,
 )
 
+LOGGER = logging.getLogger("ibms")
+
+# IBMData fields which are set from uploaded CSV data.
+IBMDATA_UPLOAD_FIELDS = [
+    "ibmIdentifier",
+    "costCentre",
+    "account",
+    "service",
+    "activity",
+    "project",
+    "job",
+    "budgetArea",
+    "projectSponsor",
+    "regionalSpecificInfo",
+    "servicePriorityID",
+    "annualWPInfo",
+    "priorityActionNo",
+    "priorityLevel",
+    "marineKPI",
+    "regionProject",
+    "regionDescription",
+]
+
 
 class IBMSValidationError(Exception):
     """Base validation error for IBMS data import"""
@@ -45,6 +84,14 @@ class ColumnCountError(IBMSValidationError):
     pass
 
 
+class CSVValidationError(IBMSValidationError):
+    """An uploaded CSV file failed validation; the complete list of errors found is available as `errors`"""
+
+    def __init__(self, errors: List[str]):
+        self.errors = errors
+        super().__init__(f"{len(errors)} validation error(s) found in uploaded file")
+
+
 def get_download_period() -> date:
     """Return the 'newest' download_period date value for all the GLPivDownload objects."""
     if not GLPivDownload.objects.exists():
@@ -75,39 +122,1211 @@ def validate_column_count(row: Sequence, count: int) -> Literal[True]:
     return True
 
 
+# Import progress callback, called with (phase, rows processed, rows committed).
+ProgressCallback = Callable[[str, int, int], None]
+
+
+class HashingReader:
+    """File-like wrapper which computes the SHA-256 digest of a file's content as it is read, so that an upload can
+    be hashed while it is streamed to blob storage.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.hash = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.f.read(size)
+        self.hash.update(data)
+        return data
+
+    def hexdigest(self) -> str:
+        return self.hash.hexdigest()
+
+
+class ImportMetrics:
+    """Records the elapsed time and database query count of each phase of an import (e.g. download, parse, validate,
+    insert, revision, link). Phases may be nested: time and queries are attributed to the innermost phase only, so
+    that the phases of an import add up to its total.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.rows = 0
+        self._stack = []
+        self._start = self._mark = time.perf_counter()
+
+    def _count_query(self, execute, sql, params, many, context):
+        if self._stack:
+            self.phases[self._stack[-1]]["queries"] += 1
+        return execute(sql, params, many, context)
+
+    def _switch(self, name: Optional[str] = None) -> None:
+        # Attribute the time since the last switch to the current phase, then enter phase `name` (or exit if None).
+        now = time.perf_counter()
+        if self._stack:
+            self.phases[self._stack[-1]]["seconds"] += now - self._mark
+        self._mark = now
+        if name:
+            self.phases.setdefault(name, {"seconds": 0.0, "queries": 0})
+            self._stack.append(name)
+        else:
+            self._stack.pop()
+
+    @contextmanager
+    def phase(self, name: str):
+        """Context manager to record time and queries against the named phase."""
+        wrapper = connection.execute_wrapper(self._count_query) if not self._stack else nullcontext()
+        with wrapper:
+            self._switch(name)
+            try:
+                yield
+            finally:
+                self._switch()
+
+    def timed(self, iterable: Iterable, name: str) -> Iterator:
+        """Wrap an iterable so that the time spent producing each item is recorded against the named phase."""
+        iterator = iter(iterable)
+        while True:
+            self._switch(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._switch()
+            yield item
+
+    def as_dict(self) -> dict:
+        """Return the metrics as a JSON-serialisable dict."""
+        seconds = time.perf_counter() - self._start
+        return {
+            "rows": self.rows,
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(self.rows / seconds, 1) if seconds else None,
+            "queries": sum(phase["queries"] for phase in self.phases.values()),
+            "phases": {
+                name: {"seconds": round(phase["seconds"], 3), "queries": phase["queries"]} for name, phase in self.phases.items()
+            },
+        }
+
+    def summary(self) -> str:
+        """Return a plain-text table of the metrics, for inclusion in notification emails."""
+        metrics = self.as_dict()
+        lines = [f"{'Phase':<12}{'Seconds':>10}{'Queries':>10}"]
+        for name, phase in metrics["phases"].items():
+            lines.append(f"{name:<12}{phase['seconds']:>10.3f}{phase['queries']:>10}")
+        lines.append(f"{'Total':<12}{metrics['seconds']:>10.3f}{metrics['queries']:>10}")
+        lines.append(f"{metrics['rows']} rows, {metrics['rows_per_second']} rows/sec")
+        return "\n".join(lines)
+
+
+def metrics_phase(metrics: Optional[ImportMetrics], name: str):
+    """Return a context manager recording the named phase on `metrics`, or a no-op context manager if it is None."""
+    return metrics.phase(name) if metrics else nullcontext()
+
+
+class CSVColumn(NamedTuple):
+    """Validation rule for a single column of an uploaded CSV file."""
+
+    name: str
+    type: Literal["char", "int", "decimal", "date"] = "char"
+    max_length: Optional[int] = None
+
+
+class RecordBatch(NamedTuple):
+    """A batch of typed CSV records, held as a list of values for each column (in CSV column order).
+    Values are converted according to the CSVColumn type: int, Decimal (rounded to 2 decimal places), date or str.
+    """
+
+    columns: List[list]
+
+    @property
+    def row_count(self) -> int:
+        return len(self.columns[0]) if self.columns else 0
+
+    def rows(self) -> Iterator[tuple]:
+        return zip(*self.columns)
+
+
+def _glpivdownload_csv_columns() -> List[CSVColumn]:
+    """Return the validation rules for GL pivot download CSV columns, based on the GLPivDownload model fields."""
+    names = [
+        "downloadPeriod", "costCentre", "account", "service", "activity", "resource", "project", "job", "shortCode",
+        "shortCodeName", "gLCode", "ptdActual", "ptdBudget", "ytdActual", "ytdBudget", "fybudget", "ytdVariance",
+        "ccName", "serviceName", "activityName", "resourceName", "projectName", "jobName", "codeID", "resNameNo",
+        "actNameNo", "projNameNo", "regionBranch", "division", "resourceCategory", "wildfire", "expenseRevenue",
+        "fireActivities", "mPRACategory",
+    ]  # fmt: skip
+    columns = []
+    for name in names:
+        field = GLPivDownload._meta.get_field(name)
+        if name == "downloadPeriod":
+            columns.append(CSVColumn(name, "date"))
+        elif field.get_internal_type() == "IntegerField":
+            columns.append(CSVColumn(name, "int"))
+        elif field.get_internal_type() == "DecimalField":
+            columns.append(CSVColumn(name, "decimal"))
+        else:
+            columns.append(CSVColumn(name, "char", field.max_length))
+    return columns
+
+
+# Validation rules for the columns of each type of uploaded CSV file, matching those applied during import.
+CSV_UPLOAD_COLUMNS = {
+    GLPivDownload: _glpivdownload_csv_columns(),
+    IBMData: [
+        CSVColumn("ibmIdentifier", max_length=50),
+        CSVColumn("costCentre", max_length=4),
+        CSVColumn("account", "int"),
+        CSVColumn("service", "int"),
+        CSVColumn("activity", max_length=4),
+        CSVColumn("project", max_length=6),
+        CSVColumn("job", max_length=6),
+        CSVColumn("budgetArea", max_length=50),
+        CSVColumn("projectSponsor", max_length=50),
+        CSVColumn("regionalSpecificInfo"),
+        CSVColumn("servicePriorityID", max_length=100),
+        CSVColumn("annualWPInfo"),
+        CSVColumn("priorityActionNo"),
+        CSVColumn("priorityLevel"),
+        CSVColumn("marineKPI"),
+        CSVColumn("regionProject"),
+        CSVColumn("regionDescription"),
+    ],
+    CorporateStrategy: [
+        CSVColumn("corporateStrategyNo", max_length=10),
+        CSVColumn("description1"),
+        CSVColumn("description2"),
+    ],
+    NCStrategicPlan: [
+        CSVColumn("strategicPlanNo", max_length=20),
+        CSVColumn("directionNo", max_length=20),
+        CSVColumn("direction"),
+        CSVColumn("aimNo", max_length=20),
+        CSVColumn("aim1"),
+        CSVColumn("aim2"),
+        CSVColumn("actionNo", max_length=20),
+        CSVColumn("action"),
+    ],
+    DepartmentProgram: [
+        CSVColumn("ibmIdentifier", max_length=100),
+        CSVColumn("dept_program1", max_length=500),
+        CSVColumn("dept_program2", max_length=500),
+        CSVColumn("dept_program3", max_length=500),
+    ],
+    GeneralServicePriority: [
+        CSVColumn("categoryID", max_length=30),
+        CSVColumn("servicePriorityNo", max_length=20),
+        CSVColumn("strategicPlanNo", max_length=20),
+        CSVColumn("corporateStrategyNo"),
+        CSVColumn("description"),
+        CSVColumn("description2"),
+    ],
+    NCServicePriority: [
+        CSVColumn("categoryID", max_length=30),
+        CSVColumn("servicePriorityNo", max_length=100),
+        CSVColumn("strategicPlanNo", max_length=100),
+        CSVColumn("corporateStrategyNo", max_length=100),
+        CSVColumn("assetNo", max_length=5),
+        CSVColumn("asset"),
+        CSVColumn("targetNo", max_length=30),
+        CSVColumn("target"),
+        CSVColumn("actionNo"),
+        CSVColumn("action"),
+        CSVColumn("mileNo", max_length=30),
+        CSVColumn("milestone"),
+    ],
+    PVSServicePriority: [
+        CSVColumn("categoryID", max_length=30),
+        CSVColumn("servicePriorityNo", max_length=100),
+        CSVColumn("strategicPlanNo", max_length=100),
+        CSVColumn("corporateStrategyNo"),
+        CSVColumn("servicePriority1"),
+        CSVColumn("description"),
+        CSVColumn("pvsExampleAnnWP"),
+        CSVColumn("pvsExampleActNo"),
+    ],
+    SFMServicePriority: [
+        CSVColumn("categoryID", max_length=30),
+        CSVColumn("regionBranch", max_length=20),
+        CSVColumn("servicePriorityNo", max_length=20),
+        CSVColumn("strategicPlanNo", max_length=20),
+        CSVColumn("corporateStrategyNo"),
+        CSVColumn("description"),
+        CSVColumn("description2"),
+    ],
+    ERServicePriority: [
+        CSVColumn("categoryID", max_length=30),
+        CSVColumn("servicePriorityNo", max_length=10),
+        CSVColumn("strategicPlanNo", max_length=10),
+        CSVColumn("corporateStrategyNo"),
+        CSVColumn("classification"),
+        CSVColumn("description"),
+    ],
+    ServicePriorityMapping: [
+        CSVColumn("costCentreNo", max_length=4),
+        CSVColumn("wildlifeManagement", max_length=100),
+        CSVColumn("parksManagement", max_length=100),
+        CSVColumn("forestManagement", max_length=100),
+    ],
+}
+
+
+def _is_integer(value: str) -> bool:
+    try:
+        int(value.strip())
+    except ValueError:
+        return False
+    return True
+
+
+def _is_decimal(value: str) -> bool:
+    """Returns True if the value is a number which will fit a DecimalField(max_digits=14, decimal_places=2)."""
+    try:
+        number = Decimal(value.strip())
+    except InvalidOperation:
+        return False
+    return number.is_finite() and abs(number) < 10**12
+
+
+def _is_date(value: str) -> bool:
+    try:
+        datetime.strptime(value, "%d/%m/%Y")
+    except ValueError:
+        return False
+    return True
+
+
+COLUMN_TYPE_CHECKS = {"int": _is_integer, "decimal": _is_decimal, "date": _is_date}
+COLUMN_TYPE_ERRORS = {
+    "int": "must be an integer",
+    "decimal": "must be a number with at most 12 digits before the decimal point",
+    "date": "must be a date in the format DD/MM/YYYY",
+}
+
+
+def column_error(column: CSVColumn) -> str:
+    """Returns the validation error message for an invalid value of the passed-in CSVColumn."""
+    return COLUMN_TYPE_ERRORS.get(column.type, f"exceeds maximum length of {column.max_length}")
+
+
+def validate_csv_columns(rows: Sequence[Sequence], columns: Sequence[CSVColumn], first_row_number: int = 1) -> List[str]:
+    """For a passed-in block of CSV rows and the column validation rules for that file type, return a list of
+    all the errors found. Rows having the wrong number of columns are reported and skipped; the remaining rows
+    are transposed into column arrays and each column is checked as a whole.
+    """
+    errors = []  # List of (row number, error) tuples.
+    row_numbers = []
+    valid_rows = []
+    for row_number, row in enumerate(rows, start=first_row_number):
+        if len(row) != len(columns):
+            errors.append((row_number, f"unexpected column count; expected {len(columns)}, received {len(row)}"))
+        else:
+            row_numbers.append(row_number)
+            valid_rows.append(row)
+
+    for column, values in zip(columns, zip(*valid_rows)):
+        if column.type in COLUMN_TYPE_CHECKS:
+            invalid = [i for i, valid in enumerate(map(COLUMN_TYPE_CHECKS[column.type], values)) if not valid]
+        elif column.max_length:
+            invalid = [i for i, value in enumerate(values) if len(value.strip()) > column.max_length]
+        else:
+            continue
+        errors.extend((row_numbers[i], f"{column.name} {column_error(column)}, got: {values[i]}") for i in invalid)
+
+    # Errors are found column by column; report them in row order.
+    return [f"Row {row_number}: {error}" for row_number, error in sorted(errors, key=lambda e: e[0])]
+
+
+# GLPivDownload database fields, in the order in which their values are written during imports.
+GLPIVDOWNLOAD_FIELDS = [f for f in GLPivDownload._meta.concrete_fields if not f.primary_key]
+
+
+def glpivdownload_values(batch: RecordBatch, fy: FinancialYear) -> Iterator[tuple]:
+    """For a passed-in batch of typed GL pivot download records, yield a tuple of database values for each record,
+    in GLPIVDOWNLOAD_FIELDS order.
+    """
+    csv_columns = {column.name: values for column, values in zip(CSV_UPLOAD_COLUMNS[GLPivDownload], batch.columns)}
+    download_periods = csv_columns["downloadPeriod"]
+    # The downloadPeriod column is stored both as a date and as DD/MM/YYYY text (a file has few distinct periods).
+    period_text = {period: period.strftime("%d/%m/%Y") for period in set(download_periods)}
+    fy_id = GLPivDownload(fy=fy).fy_id
+    columns = []
+    for field in GLPIVDOWNLOAD_FIELDS:
+        if field.name == "fy":
+            columns.append(itertools.repeat(fy_id))
+        elif field.name == "download_period":
+            columns.append(download_periods)
+        elif field.name == "downloadPeriod":
+            columns.append([period_text[period] for period in download_periods])
+        elif field.name in csv_columns:
+            columns.append(csv_columns[field.name])
+        else:  # The IBMData and DepartmentProgram FK links, which are set afterwards.
+            columns.append(itertools.repeat(None))
+    return zip(*columns)
+
+
+def link_glpivdownload(fy: FinancialYear, table: str = GLPivDownload._meta.db_table) -> Tuple[int, int]:
+    """For a passed-in financial year, set the IBMData and DepartmentProgram FK links on all unlinked GLPivDownload
+    records having a matching codeID value. This is the set-based equivalent of calling GLPivDownload.save() on each
+    object, and returns a tuple of (IBMData links, DepartmentProgram links) set.
+    The optional `table` argument allows links to be set on a staging table having the same columns.
+    """
+    # Raw SQL is used here deliberately for performance: one joined UPDATE per table, instead of (up to) four queries
+    # per GLPivDownload object. The parameterised queries prevent SQL injection; `table` is never user input.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""UPDATE {table} AS gl SET ibmdata_id = ibm.id
+            FROM ibms_ibmdata AS ibm
+            WHERE gl.fy_id = %s AND gl.ibmdata_id IS NULL AND ibm.fy_id = gl.fy_id AND ibm."ibmIdentifier" = gl."codeID"
+            """,
+            [fy.financialYear],
+        )
+        ibmdata_count = cursor.rowcount
+        cursor.execute(
+            f"""UPDATE {table} AS gl SET department_program_id = dp.id
+            FROM ibms_departmentprogram AS dp
+            WHERE gl.fy_id = %s AND gl.department_program_id IS NULL AND dp.fy_id = gl.fy_id AND dp."ibmIdentifier" = gl."codeID"
+            """,
+            [fy.financialYear],
+        )
+        department_program_count = cursor.rowcount
+    return ibmdata_count, department_program_count
+
+
+GLPIVDOWNLOAD_STAGING_TABLE = "ibms_glpivdownload_staging"
+
+
 @contextmanager
-def csvload_context(file_name: str):
+def glpivdownload_staging_context(
+    batches: Iterable[RecordBatch], fy: FinancialYear, progress: Optional[ProgressCallback] = None
+):
+    """For passed-in batches of typed GL pivot download records and a financial year, load all records into a
+    temporary staging table (using COPY) having the same columns as the GLPivDownload table (minus the identity
+    column), and yield a tuple of (cursor, record count). The staging table is dropped on exit.
+    Records are copied one batch at a time, with progress reported after each batch.
+    """
+    columns = ", ".join(f'"{f.column}"' for f in GLPIVDOWNLOAD_FIELDS)
+    record_count = 0
+
+    with connection.cursor() as cursor:
+        # Schema-qualified, so that only a temporary table left on a pooled connection is dropped (never a permanent
+        # table of the same name on the search path).
+        cursor.execute(f"DROP TABLE IF EXISTS pg_temp.{GLPIVDOWNLOAD_STAGING_TABLE}")
+        try:
+            # The staging table copies the column definitions of the GLPivDownload table (without constraints),
+            # minus the identity column which is generated when rows are copied across.
+            cursor.execute(f"CREATE TEMPORARY TABLE {GLPIVDOWNLOAD_STAGING_TABLE} AS SELECT * FROM ibms_glpivdownload WITH NO DATA")
+            cursor.execute(f"ALTER TABLE {GLPIVDOWNLOAD_STAGING_TABLE} DROP COLUMN id")
+            for batch in batches:
+                # Each batch is parsed (and validated) before starting the COPY, so that an error doesn't abort it.
+                with cursor.cursor.copy(f"COPY {GLPIVDOWNLOAD_STAGING_TABLE} ({columns}) FROM STDIN") as copy:
+                    for values in glpivdownload_values(batch, fy):
+                        copy.write_row(values)
+                record_count += batch.row_count
+                if progress:
+                    progress("importing", record_count, 0)
+            cursor.execute(f'CREATE INDEX ON {GLPIVDOWNLOAD_STAGING_TABLE} ("gLCode")')
+            cursor.execute(f'CREATE INDEX ON {GLPIVDOWNLOAD_STAGING_TABLE} ("codeID")')
+            cursor.execute(f"ANALYZE {GLPIVDOWNLOAD_STAGING_TABLE}")
+            yield cursor, record_count
+        finally:
+            cursor.execute(f"DROP TABLE IF EXISTS pg_temp.{GLPIVDOWNLOAD_STAGING_TABLE}")
+
+
+def reload_glpivdownload(batches: Iterable[RecordBatch], fy: FinancialYear, progress: Optional[ProgressCallback] = None) -> int:
+    """For passed-in batches of typed GL pivot download records and a financial year, replace all GLPivDownload records for that year.
+    Rows are first loaded into a staging table and FK links are set there, then the existing records are
+    swapped out for the staged records in a single short transaction. Readers therefore see either the
+    complete old data or the complete new data, never a partially-loaded financial year.
+    Returns the count of records loaded.
+    """
+    columns = ", ".join(f'"{f.column}"' for f in GLPIVDOWNLOAD_FIELDS)
+
+    with glpivdownload_staging_context(batches, fy, progress) as (cursor, record_count):
+        if progress:
+            progress("linking", record_count, 0)
+        link_glpivdownload(fy, table=GLPIVDOWNLOAD_STAGING_TABLE)
+        # Swap the staged records into place for this financial year.
+        with transaction.atomic():
+            cursor.execute("DELETE FROM ibms_glpivdownload WHERE fy_id = %s", [fy.financialYear])
+            cursor.execute(f"INSERT INTO ibms_glpivdownload ({columns}) SELECT {columns} FROM {GLPIVDOWNLOAD_STAGING_TABLE}")
+
+    return record_count
+
+
+def delta_glpivdownload(
+    batches: Iterable[RecordBatch], fy: FinancialYear, delete_missing: bool = False, progress: Optional[ProgressCallback] = None
+) -> Tuple[int, int, int, int]:
+    """For passed-in batches of typed GL pivot download records and a financial year, apply only the differences
+    between the CSV data and the
+    existing GLPivDownload records for that year, matched on gLCode:
+    - rows having a new gLCode are inserted,
+    - existing records are updated only where one or more values have changed,
+    - optionally, existing records having a gLCode not present in the CSV are deleted.
+    FK links are only set on inserted records (or where a changed codeID invalidates the existing links).
+    Every row of a file has the same download period, so the period is not compared: otherwise each month's file
+    would update every record. Unchanged records therefore keep the download period of the file which last changed
+    them (get_download_period returns the newest period of any record).
+    Returns a tuple of (records read, inserted, updated, deleted).
+    """
+    columns = ", ".join(f'"{f.column}"' for f in GLPIVDOWNLOAD_FIELDS)
+    # Values updated: everything except the financial year, the gLCode key and the FK links.
+    data_fields = [f for f in GLPIVDOWNLOAD_FIELDS if f.name not in ("fy", "gLCode", "ibmdata", "department_program")]
+    # Values compared: the updated values except the download period.
+    compared_fields = [f for f in data_fields if f.name not in ("download_period", "downloadPeriod")]
+    assignments = ", ".join(f'"{f.column}" = s."{f.column}"' for f in data_fields)
+    gl_values = ", ".join(f'gl."{f.column}"' for f in compared_fields)
+    staged_values = ", ".join(f's."{f.column}"' for f in compared_fields)
+    deleted_count = 0
+
+    with glpivdownload_staging_context(batches, fy, progress) as (cursor, record_count):
+        if progress:
+            progress("linking", record_count, 0)
+        with transaction.atomic():
+            cursor.execute(
+                f"""UPDATE ibms_glpivdownload AS gl SET {assignments},
+                ibmdata_id = CASE WHEN gl."codeID" = s."codeID" THEN gl.ibmdata_id END,
+                department_program_id = CASE WHEN gl."codeID" = s."codeID" THEN gl.department_program_id END
+                FROM {GLPIVDOWNLOAD_STAGING_TABLE} AS s
+                WHERE gl.fy_id = %s AND gl."gLCode" = s."gLCode" AND ({gl_values}) IS DISTINCT FROM ({staged_values})
+                """,
+                [fy.financialYear],
+            )
+            updated_count = cursor.rowcount
+            cursor.execute(
+                f"""INSERT INTO ibms_glpivdownload ({columns}) SELECT {columns} FROM {GLPIVDOWNLOAD_STAGING_TABLE} AS s
+                WHERE NOT EXISTS (SELECT 1 FROM ibms_glpivdownload AS gl WHERE gl.fy_id = %s AND gl."gLCode" = s."gLCode")
+                """,
+                [fy.financialYear],
+            )
+            inserted_count = cursor.rowcount
+            if delete_missing:
+                cursor.execute(
+                    f"""DELETE FROM ibms_glpivdownload AS gl
+                    WHERE gl.fy_id = %s AND NOT EXISTS (SELECT 1 FROM {GLPIVDOWNLOAD_STAGING_TABLE} AS s WHERE s."gLCode" = gl."gLCode")
+                    """,
+                    [fy.financialYear],
+                )
+                deleted_count = cursor.rowcount
+            link_glpivdownload(fy)
+
+    return record_count, inserted_count, updated_count, deleted_count
+
+
+def ibmdata_values_from_row(row: Sequence) -> dict:
+    """Return a dict of validated IBMData field values from a row of IBM data CSV data."""
+    return {
+        "ibmIdentifier": validate_char_field("ibmIdentifier", 50, row[0].upper()),
+        "costCentre": validate_char_field("costCentre", 4, row[1]),
+        "account": validate_integer_field("account", row[2]),
+        "service": validate_integer_field("service", row[3]),
+        "activity": validate_char_field("activity", 4, row[4]),
+        "project": validate_char_field("project", 6, row[5]),
+        "job": validate_char_field("job", 6, row[6]),
+        "budgetArea": validate_char_field("budgetArea", 50, row[7]),
+        "projectSponsor": validate_char_field("projectSponsor", 50, str(row[8])),
+        "regionalSpecificInfo": str(row[9]),
+        "servicePriorityID": validate_char_field("servicePriorityID", 100, row[10]),
+        "annualWPInfo": str(row[11]),
+        "priorityActionNo": str(row[12]),
+        "priorityLevel": str(row[13]),
+        "marineKPI": str(row[14]),
+        "regionProject": str(row[15]),
+        "regionDescription": str(row[16]),
+    }
+
+
+def upsert_ibmdata(objs: Iterable[IBMData]) -> None:
+    """Bulk insert or update IBMData objects (INSERT ... ON CONFLICT DO UPDATE) and add each to the current revision.
+    Must be called within a reversion revision block.
+    """
+    objs = list(objs)
+    IBMData.objects.bulk_create(
+        objs,
+        update_conflicts=True,
+        unique_fields=["ibmIdentifier", "fy"],
+        update_fields=IBMDATA_UPLOAD_FIELDS + ["modifier", "modified"],
+    )
+    for obj in objs:
+        add_to_revision(obj)
+
+
+def link_ibmdata_service_priority(fy: FinancialYear) -> int:
+    """For a passed-in financial year, set the service priority generic relation on all unlinked IBMData records
+    having a matching service priority. This is the set-based equivalent of calling IBMData.save() on each object,
+    and returns the number of links set.
+    """
+    count = 0
+    with connection.cursor() as cursor:
+        # Models are linked in order of precedence: each UPDATE only touches records that are still unlinked.
+        for model in SERVICE_PRIORITY_MODELS:
+            cursor.execute(
+                f"""UPDATE ibms_ibmdata AS ibm SET content_type_id = %s, object_id = sp.id
+                FROM {model._meta.db_table} AS sp
+                WHERE ibm.fy_id = %s AND ibm.content_type_id IS NULL AND sp.fy_id = ibm.fy_id AND sp."servicePriorityNo" = ibm."servicePriorityID"
+                """,
+                [ContentType.objects.get_for_model(model).pk, fy.financialYear],
+            )
+            count += cursor.rowcount
+    return count
+
+
+def corporatestrategy_values_from_row(row: Sequence) -> dict:
+    """Return a dict of validated CorporateStrategy field values from a row of CSV data."""
+    return {
+        "corporateStrategyNo": validate_char_field("corporateStrategyNo", 10, row[0]),
+        "description1": str(row[1]),
+        "description2": str(row[2]),
+    }
+
+
+def ncstrategicplan_values_from_row(row: Sequence) -> dict:
+    """Return a dict of validated NCStrategicPlan field values from a row of CSV data."""
+    return {
+        "strategicPlanNo": validate_char_field("strategicPlanNo", 20, row[0]),
+        "directionNo": validate_char_field("directionNo", 20, row[1]),
+        "direction": str(row[2]),
+        "aimNo": validate_char_field("directionNo", 20, row[3]),
+        "aim1": str(row[4]),
+        "aim2": str(row[5]),
+        "actionNo": validate_char_field("directionNo", 20, row[6]),
+        "action": str(row[7]),
+    }
+
+
+def generalservicepriority_values_from_row(row: Sequence) -> dict:
+    """Return a dict of validated GeneralServicePriority field values from a row of CSV data."""
+    return {
+        "categoryID": validate_char_field("categoryID", 30, row[0]),
+        "servicePriorityNo": validate_char_field("servicePriorityNo", 20, row[1]),
+        "strategicPlanNo": validate_char_field("strategicPlanNo", 20, row[2]),
+        "corporateStrategyNo": row[3],
+        "description": str(row[4]),
+        "description2": str(row[5]),
+    }
+
+
+def ncservicepriority_values_from_row(row: Sequence) -> dict:
+    """Return a dict of validated NCServicePriority field values from a row of CSV data."""
+    return {
+        "categoryID": validate_char_field("categoryID", 30, row[0]),
+        "servicePriorityNo": validate_char_field("servicePriorityNo", 100, row[1]),
+        "strategicPlanNo": validate_char_field("strategicPlanNo", 100, row[2]),
+        "corporateStrategyNo": validate_char_field("corporateStrategyNo", 100, row[3]),
+        "assetNo": validate_char_field("AssetNo", 5, row[4]),
+        "asset": str(row[5]),
+        "targetNo": validate_char_field("Asset", 30, row[6]),
+        "target": str(row[7]),
+        "actionNo": str(row[8]),
+        "action": str(row[9]),
+        "mileNo": validate_char_field("MileNo", 30, row[10]),
+        "milestone": str(row[11]),
+    }
+
+
+def pvsservicepriority_values_from_row(row: Sequence) -> dict:
+    """Return a dict of validated PVSServicePriority field values from a row of CSV data."""
+    return {
+        "categoryID": validate_char_field("categoryID", 30, row[0]),
+        "servicePriorityNo": validate_char_field("servicePriorityNo", 100, row[1]),
+        "strategicPlanNo": validate_char_field("strategicPlanNo", 100, row[2]),
+        "corporateStrategyNo": row[3],
+        "servicePriority1": str(row[4]),
+        "description": str(row[5]),
+        "pvsExampleAnnWP": str(row[6]),
+        "pvsExampleActNo": str(row[7]),
+    }
+
+
+def sfmservicepriority_values_from_row(row: Sequence) -> dict:
+    """Return a dict of validated SFMServicePriority field values from a row of CSV data."""
+    return {
+        "categoryID": validate_char_field("categoryID", 30, row[0]),
+        "regionBranch": validate_char_field("regionBranch", 20, row[1]),
+        "servicePriorityNo": validate_char_field("servicePriorityNo", 20, row[2]),
+        "strategicPlanNo": validate_char_field("strategicPlanNo", 20, row[3]),
+        "corporateStrategyNo": row[4],
+        "description": str(row[5]),
+        "description2": str(row[6]),
+    }
+
+
+def erservicepriority_values_from_row(row: Sequence) -> dict:
+    """Return a dict of validated ERServicePriority field values from a row of CSV data."""
+    return {
+        "categoryID": validate_char_field("categoryID", 30, row[0]),
+        "servicePriorityNo": validate_char_field("servicePriorityNo", 10, row[1]),
+        "strategicPlanNo": validate_char_field("strategicPlanNo", 10, row[2]),
+        "corporateStrategyNo": row[3],
+        "classification": str(row[4]),
+        "description": str(row[5]),
+    }
+
+
+def serviceprioritymapping_values_from_row(row: Sequence) -> dict:
+    """Return a dict of validated ServicePriorityMapping field values from a row of CSV data."""
+    return {
+        "costCentreNo": validate_char_field("costCentreNo", 4, row[0]),
+        "wildlifeManagement": validate_char_field("wildlifeManagement", 100, row[1]),
+        "parksManagement": validate_char_field("parksManagement", 100, row[2]),
+        "forestManagement": validate_char_field("forestManagement", 100, row[3]),
+    }
+
+
+def bulk_upsert_from_rows(
+    reader: Iterable[Sequence],
+    fy: FinancialYear,
+    model: type,
+    values_from_row: Callable[[Sequence], dict],
+    column_count: int,
+    unique_fields: Sequence[str],
+    progress: Optional[ProgressCallback] = None,
+    record_count: int = 0,
+) -> int:
+    """Validate rows of CSV data and write them to `model` for the financial year in batches, updating any existing
+    record having the same `unique_fields` values (INSERT ... ON CONFLICT DO UPDATE). This is the batched
+    equivalent of calling update_or_create() for each row, and returns the updated record count.
+    Models having no fields other than `unique_fields` (i.e. ServicePriorityMapping) only have new records inserted.
+    For ServicePriority models, the corporate_strategy and strategic_plan FKs are resolved in memory.
+    """
+    if model in SERVICE_PRIORITY_MODELS:
+        corporate_strategies = dict(CorporateStrategy.objects.filter(fy=fy).values_list("corporateStrategyNo", "pk"))
+        strategic_plans = dict(NCStrategicPlan.objects.filter(fy=fy).values_list("strategicPlanNo", "pk"))
+    # No unique constraint exists to upsert against when every field is a unique field, so only insert new records.
+    insert_only = {field.name for field in model._meta.concrete_fields if not field.primary_key} == {*unique_fields, "fy"}
+    existing = set(model.objects.filter(fy=fy).values_list(*unique_fields)) if insert_only else set()
+
+    def write_batch(batch: dict) -> None:
+        objs = [model(fy=fy, **data) for data in batch.values()]
+        if insert_only:
+            model.objects.bulk_create([obj for key, obj in zip(batch.keys(), objs) if key not in existing])
+            existing.update(batch.keys())
+            return
+        update_fields = [field for field in next(iter(batch.values())) if field not in unique_fields]
+        if model in SERVICE_PRIORITY_MODELS:
+            for obj in objs:
+                obj.corporate_strategy_id = corporate_strategies.get(obj.corporateStrategyNo)
+                obj.strategic_plan_id = strategic_plans.get(obj.strategicPlanNo)
+            update_fields += ["corporate_strategy", "strategic_plan"]
+        model.objects.bulk_create(objs, update_conflicts=True, unique_fields=[*unique_fields, "fy"], update_fields=update_fields)
+
+    # Rows are de-duplicated within each batch (the last row wins), as a single INSERT ... ON CONFLICT statement
+    # cannot affect the same record twice.
+    batch = {}
+    for row in reader:
+        _ = validate_column_count(row, column_count)
+        record_count += 1
+        data = values_from_row(row)
+        batch[tuple(data[field] for field in unique_fields)] = data
+        if len(batch) >= settings.CSV_IMPORT_BATCH_SIZE:
+            write_batch(batch)
+            batch = {}
+            if progress:
+                progress("importing", record_count, record_count)
+    if batch:
+        write_batch(batch)
+
+    return record_count
+
+
+# Models whose records (for a financial year) are written by relink_financial_year.
+RELINK_LOCK_MODELS = [*SERVICE_PRIORITY_MODELS, IBMData, GLPivDownload]
+
+
+def import_lock_models(model: type, link: bool = True) -> List[type]:
+    """Return the models whose records (for a financial year) are written by importing a CSV file of the passed-in
+    model, including those whose links are set afterwards unless link=False.
+    """
+    models = [model]
+    if link and model in (IBMData, DepartmentProgram):
+        models.append(GLPivDownload)
+    elif link and model in (CorporateStrategy, NCStrategicPlan, *SERVICE_PRIORITY_MODELS):
+        models += RELINK_LOCK_MODELS
+    return list(dict.fromkeys(models))
+
+
+def import_lock_key(fy: FinancialYear, model: type) -> Tuple[int, int]:
+    """Return the PostgreSQL advisory lock key (a pair of signed 32-bit integers) for the financial year and model."""
+    return tuple(zlib.crc32(value.encode()) - 2**31 for value in (fy.financialYear, model._meta.label_lower))
+
+
+def release_import_locks(cursor, keys: Sequence[Tuple[int, int]]) -> bool:
+    """Release the passed-in import (advisory) locks held by the database session, in one query. Returns False if
+    any of the locks was not held by the session.
+    """
+    if not keys:
+        return True
+    cursor.execute(
+        "SELECT pg_advisory_unlock(k1, k2) FROM unnest(%s::int[], %s::int[]) AS k(k1, k2)",
+        [[key[0] for key in keys], [key[1] for key in keys]],
+    )
+    return all(row[0] for row in cursor.fetchall())
+
+
+def discard_connection() -> None:
+    """Close the database connection's session, e.g. to release session-level advisory locks which could not be
+    released. With a connection pool, closing the Django connection only returns the session to the pool (still
+    holding its locks), so the underlying connection is closed first and the pool discards it.
+    """
+    if connection.connection is not None:
+        connection.connection.close()
+    connection.close()
+
+
+@contextmanager
+def import_lock(fy: FinancialYear, models: Iterable[type], metrics: Optional[ImportMetrics] = None):
+    """Context manager which holds a PostgreSQL session-level advisory lock on each (financial year, model), so that
+    imports which write the same records are serialised while imports of other models or financial years run in
+    parallel. Session-level locks are held across the transactions committed during an import, and are reentrant.
+    Locks are always acquired in the same (sorted) order, so that imports cannot deadlock. The time spent waiting
+    for the locks is recorded as the "lock" phase. If the locks cannot be released, the connection is closed (see
+    discard_connection) so that a pooled session is never reused while still holding them.
+    """
+    models = {import_lock_key(fy, model): model for model in models}
+    keys = sorted(models)
+    acquired = []
+    try:
+        with metrics_phase(metrics, "lock"), connection.cursor() as cursor:
+            # Try to acquire every lock in one query. If any is held by another import, release those acquired and
+            # wait for each lock in turn (in order).
+            cursor.execute(
+                "SELECT k1, k2 FROM unnest(%s::int[], %s::int[]) AS k(k1, k2) WHERE pg_try_advisory_lock(k1, k2)",
+                [[key[0] for key in keys], [key[1] for key in keys]],
+            )
+            acquired = [tuple(row) for row in cursor.fetchall()]
+            if len(acquired) < len(keys):
+                release_import_locks(cursor, acquired)
+                acquired = []
+                for key in keys:
+                    cursor.execute("SELECT pg_try_advisory_lock(%s, %s)", key)
+                    if not cursor.fetchone()[0]:
+                        LOGGER.info(f"Waiting for another import of {fy} {models[key]._meta.verbose_name} records to finish")
+                        start = time.perf_counter()
+                        cursor.execute("SELECT pg_advisory_lock(%s, %s)", key)
+                        LOGGER.info(f"Acquired the {fy} {models[key]._meta.verbose_name} import lock after {time.perf_counter() - start:.1f}s")
+                    acquired.append(key)
+        yield
+    finally:
+        released = False
+        try:
+            with connection.cursor() as cursor:
+                released = release_import_locks(cursor, acquired)
+        except DatabaseError as e:
+            LOGGER.warning(f"Unable to release the {fy} import locks: {e}")
+        if not released:
+            # Session-level locks are only released when the session ends, so the connection must not be reused.
+            LOGGER.warning(f"Closing the database connection to release the {fy} import locks")
+            discard_connection()
+
+
+@contextmanager
+def bumps_data_version(fy: FinancialYear):
+    """Context manager which bumps the data version of the financial year on exit (see
+    FinancialYear.bump_data_version), including on failure, since imports commit their records in batches.
+    """
+    try:
+        yield
+    finally:
+        fy.bump_data_version()
+
+
+def relink_financial_year(fy: FinancialYear) -> Dict[str, int]:
+    """For a passed-in financial year, recompute every link which is otherwise set as a side effect of saving objects:
+    the ServicePriority corporate_strategy / strategic_plan FKs, the IBMData service priority generic relation
+    (respecting the SERVICE_PRIORITY_MODELS order of precedence) and the GLPivDownload IBMData / DepartmentProgram FKs.
+    Unlike save(), existing links are replaced (or cleared) where they no longer match, so the result does not depend
+    on the order in which files were uploaded. Only changed rows are written; returns counts of links updated.
+    The import locks of the relinked models are held while relinking (see import_lock), and the data version of the
+    financial year is bumped once the changes are committed.
+    """
+    counts = {"service priority": 0, "IBM data": 0, "GL pivot download": 0}
+    with import_lock(fy, RELINK_LOCK_MODELS), bumps_data_version(fy), transaction.atomic(), connection.cursor() as cursor:
+        for model in SERVICE_PRIORITY_MODELS:
+            table = model._meta.db_table
+            cursor.execute(
+                f"""UPDATE {table} AS sp SET corporate_strategy_id = cs.id, strategic_plan_id = pl.id
+                FROM {table} AS s
+                LEFT JOIN ibms_corporatestrategy AS cs ON cs.fy_id = s.fy_id AND cs."corporateStrategyNo" = s."corporateStrategyNo"
+                LEFT JOIN ibms_ncstrategicplan AS pl ON pl.fy_id = s.fy_id AND pl."strategicPlanNo" = s."strategicPlanNo"
+                WHERE s.id = sp.id AND sp.fy_id = %s
+                AND (sp.corporate_strategy_id IS DISTINCT FROM cs.id OR sp.strategic_plan_id IS DISTINCT FROM pl.id)
+                """,
+                [fy.financialYear],
+            )
+            counts["service priority"] += cursor.rowcount
+
+        # Rank each service priority number by model precedence, so that each IBMData record links to the first match.
+        sp_union = " UNION ALL ".join(
+            f"""SELECT "servicePriorityNo", %s AS content_type_id, id, {precedence} AS precedence
+            FROM {model._meta.db_table} WHERE fy_id = %s"""
+            for precedence, model in enumerate(SERVICE_PRIORITY_MODELS)
+        )
+        sp_params = []
+        for model in SERVICE_PRIORITY_MODELS:
+            sp_params += [ContentType.objects.get_for_model(model).pk, fy.financialYear]
+        cursor.execute(
+            f"""WITH sp AS (
+                SELECT DISTINCT ON ("servicePriorityNo") "servicePriorityNo", content_type_id, id
+                FROM ({sp_union}) AS ranked ORDER BY "servicePriorityNo", precedence, id
+            )
+            UPDATE ibms_ibmdata AS ibm SET content_type_id = sp.content_type_id, object_id = sp.id
+            FROM ibms_ibmdata AS i LEFT JOIN sp ON sp."servicePriorityNo" = i."servicePriorityID"
+            WHERE i.id = ibm.id AND ibm.fy_id = %s
+            AND (ibm.content_type_id IS DISTINCT FROM sp.content_type_id OR ibm.object_id IS DISTINCT FROM sp.id)
+            """,
+            sp_params + [fy.financialYear],
+        )
+        counts["IBM data"] = cursor.rowcount
+
+        cursor.execute(
+            """UPDATE ibms_glpivdownload AS gl SET ibmdata_id = ibm.id, department_program_id = dp.id
+            FROM ibms_glpivdownload AS g
+            LEFT JOIN ibms_ibmdata AS ibm ON ibm.fy_id = g.fy_id AND ibm."ibmIdentifier" = g."codeID"
+            LEFT JOIN ibms_departmentprogram AS dp ON dp.fy_id = g.fy_id AND dp."ibmIdentifier" = g."codeID"
+            WHERE g.id = gl.id AND gl.fy_id = %s
+            AND (gl.ibmdata_id IS DISTINCT FROM ibm.id OR gl.department_program_id IS DISTINCT FROM dp.id)
+            """,
+            [fy.financialYear],
+        )
+        counts["GL pivot download"] = cursor.rowcount
+
+    return counts
+
+
+def iter_decoded_lines(chunks: Iterable[bytes], encoding: str = "utf-8") -> Iterator[str]:
+    """For a passed-in iterable of byte chunks, incrementally decode the content (ignoring errors) and
+    yield it one line at a time (including the line ending), so that only a single chunk needs to be
+    held in memory. Multi-byte characters split across chunk boundaries are decoded correctly.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors="ignore")
+    pending = ""
+    for chunk in chunks:
+        pending += decoder.decode(chunk)
+        if "\n" not in pending:
+            continue
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+def csv_reader_from_chunks(chunks: Iterable[bytes]):
+    """For a passed-in iterable of byte chunks, returns a CSV reader over the decoded content.
+    The first line is skipped if it looks like a header row.
+    """
+    csv.field_size_limit(settings.CSV_FILE_LIMIT)
+    lines = iter_decoded_lines(chunks)
+    first_line = next(lines, "")
+    if not csv.Sniffer().has_header(sample=first_line):
+        lines = itertools.chain([first_line], lines)
+    return csv.reader(lines, dialect="excel")
+
+
+def timed_csv_reader(chunks: Iterable[bytes], metrics: Optional[ImportMetrics] = None):
+    """Returns a CSV reader over the passed-in byte chunks. If `metrics` is passed in, the time spent reading chunks
+    is recorded as the "download" phase, and the time spent decoding and parsing rows as the "parse" phase.
+    """
+    if not metrics:
+        return csv_reader_from_chunks(chunks)
+    with metrics.phase("parse"):
+        reader = csv_reader_from_chunks(metrics.timed(chunks, "download"))
+    return metrics.timed(reader, "parse")
+
+
+@contextmanager
+def csvload_context(file_name: str, metrics: Optional[ImportMetrics] = None):
     """For a passed-in CSV file path, returns a reader instance having context on the underlying file
     sufficient to close the file after processing via a `with` statement.
+    The file is read and decoded in chunks of CSV_READ_CHUNK_SIZE bytes.
     """
-    csvfile = codecs.open(file_name, encoding="utf-8", errors="ignore")
-    csv.field_size_limit(settings.CSV_FILE_LIMIT)
+    csvfile = open(file_name, "rb")
     try:
-        reader = csv.reader(csvfile, dialect="excel")
-        if not csv.Sniffer().has_header(sample=csvfile.readline()):
-            reader.seek(0)
-        yield reader
+        chunks = iter(lambda: csvfile.read(settings.CSV_READ_CHUNK_SIZE), b"")
+        yield timed_csv_reader(chunks, metrics)
     finally:
         csvfile.close()
 
 
 @contextmanager
-def blobload_context(blob_client: BlobClient):
+def blobload_context(blob_client: BlobClient, metrics: Optional[ImportMetrics] = None):
     """For a passed-in Azure BlobClient, streams the blob content and returns a CSV reader.
-    The blob is decoded as UTF-8 (ignoring errors) and wrapped in a StringIO so it can be
-    iterated without writing to disk.
+    The blob is downloaded in chunks and decoded incrementally as UTF-8 (ignoring errors), so the
+    whole file is never held in memory at once.
     """
-    csv.field_size_limit(settings.CSV_FILE_LIMIT)
-    stream = blob_client.download_blob()
-    content = stream.readall().decode("utf-8", errors="ignore")
-    csvfile = io.StringIO(content)
+    with metrics_phase(metrics, "download"):
+        stream = blob_client.download_blob()
+    yield timed_csv_reader(stream.chunks(), metrics)
+
+
+def csv_source_context(source: str | BlobClient, metrics: Optional[ImportMetrics] = None):
+    """Returns the reader context manager for a CSV source (file path or Azure BlobClient)."""
+    return blobload_context(source, metrics) if isinstance(source, BlobClient) else csvload_context(source, metrics)
+
+
+CSV_PARSER_ENGINES = ("csv", "arrow")
+CENTS = Decimal("0.01")
+
+
+def get_csv_parser_engine(engine: Optional[str] = None) -> str:
+    """Returns the CSV parser engine to use: the passed-in engine, or else the CSV_PARSER_ENGINE setting.
+    Falls back to the csv engine if the arrow engine is selected but pyarrow is not installed.
+    """
+    engine = engine or settings.CSV_PARSER_ENGINE
+    if engine not in CSV_PARSER_ENGINES:
+        raise ValueError(f"Unknown CSV parser engine {engine}")
+    if engine == "arrow" and pyarrow is None:
+        LOGGER.warning("pyarrow is not installed; using the csv parser engine")
+        return "csv"
+    return engine
+
+
+def _convert_csv_column(values: Sequence[str], column: CSVColumn) -> list:
+    """Convert a column of CSV values to the type of the CSVColumn."""
     try:
-        reader = csv.reader(csvfile, dialect="excel")
-        if not csv.Sniffer().has_header(sample=csvfile.readline()):
-            csvfile.seek(0)
-        yield reader
-    finally:
-        csvfile.close()
+        if column.type == "int":
+            return [int(value) for value in values]
+        elif column.type == "decimal":
+            return [Decimal(value).quantize(CENTS) for value in values]
+        elif column.type == "date":
+            return [datetime.strptime(value, "%d/%m/%Y").date() for value in values]
+    except (ValueError, InvalidOperation) as e:
+        raise IBMSValidationError(f"Unable to parse {column.name} value as {column.type}: {e}")
+    return list(values)
+
+
+def csv_record_batches(reader: Iterable[Sequence], columns: Sequence[CSVColumn]) -> Iterator[RecordBatch]:
+    """The csv parser engine: for a passed-in CSV reader, yields RecordBatch objects of CSV_IMPORT_BATCH_SIZE records
+    converted column by column in Python. Raises ColumnCountError for a row having the wrong number of columns.
+    """
+    while block := list(itertools.islice(reader, settings.CSV_IMPORT_BATCH_SIZE)):
+        for row in block:
+            _ = validate_column_count(row, len(columns))
+        yield RecordBatch([_convert_csv_column(values, column) for column, values in zip(columns, zip(*block))])
+
+
+class ChunkStream(io.RawIOBase):
+    """Read-only binary stream over an iterable of byte chunks, for readers which require a file object."""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._pending = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._pending = memoryview(chunk)
+        count = min(len(buffer), len(self._pending))
+        buffer[:count] = self._pending[:count]
+        self._pending = self._pending[count:]
+        return count
+
+
+def iter_utf8_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """For a passed-in iterable of byte chunks, yield the content as valid UTF-8 chunks (dropping undecodable bytes,
+    as iter_decoded_lines does).
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    for chunk in chunks:
+        yield decoder.decode(chunk).encode("utf-8")
+    yield decoder.decode(b"", final=True).encode("utf-8")
+
+
+def _cast_arrow_column(array, column: CSVColumn):
+    """Cast a pyarrow array of CSV string values to the type of the CSVColumn."""
+    pc = pyarrow.compute
+    try:
+        if column.type == "int":
+            array = pc.cast(pc.utf8_trim_whitespace(array), pyarrow.int64())
+        elif column.type == "decimal":
+            # Round half to even to two places, as Django does when saving a DecimalField(decimal_places=2).
+            array = pc.cast(pc.utf8_trim_whitespace(array), pyarrow.decimal128(38, 18))
+            array = pc.cast(pc.round(array, ndigits=2, round_mode="half_to_even"), pyarrow.decimal128(14, 2))
+        elif column.type == "date":
+            array = pc.cast(pc.strptime(array, format="%d/%m/%Y", unit="s"), pyarrow.date32())
+    except pyarrow.ArrowInvalid as e:
+        raise IBMSValidationError(f"Unable to parse {column.name} value as {column.type}: {e}")
+    return array
+
+
+def _convert_arrow_column(array, column: CSVColumn) -> list:
+    """Convert a pyarrow array of CSV string values to a list of values of the type of the CSVColumn."""
+    return _cast_arrow_column(array, column).to_pylist()
+
+
+def arrow_string_batches(chunks: Iterable[bytes], columns: Sequence[CSVColumn], start_row: int = 0) -> Iterator:
+    """For a passed-in iterable of byte chunks, parse the CSV content with pyarrow's streaming CSV reader and yield
+    pyarrow record batches of (at most) CSV_IMPORT_BATCH_SIZE rows of string values.
+    As for the csv engine, the first line is skipped if it looks like a header row, and ColumnCountError is raised
+    for a row having the wrong number of columns. A non-zero `start_row` skips that number of data rows.
+    """
+    chunks = iter_utf8_chunks(chunks)
+    head = b""
+    for chunk in chunks:
+        head += chunk
+        if b"\n" in head:
+            break
+    first_line = head.partition(b"\n")[0].decode("utf-8")
+    has_header = csv.Sniffer().has_header(sample=first_line) if first_line else False
+
+    names = [column.name for column in columns]
+    try:
+        # The reader parses the first block as it is opened, so opening it may also raise a parse error.
+        reader = pyarrow.csv.open_csv(
+            ChunkStream(itertools.chain([head], chunks)),
+            read_options=pyarrow.csv.ReadOptions(
+                column_names=names,
+                skip_rows=1 if has_header else 0,
+                skip_rows_after_names=start_row,
+                block_size=settings.CSV_READ_CHUNK_SIZE,
+            ),
+            parse_options=pyarrow.csv.ParseOptions(newlines_in_values=True),
+            convert_options=pyarrow.csv.ConvertOptions(
+                column_types={name: pyarrow.string() for name in names}, strings_can_be_null=False, quoted_strings_can_be_null=False
+            ),
+        )
+        for arrow_batch in reader:
+            for offset in range(0, arrow_batch.num_rows, settings.CSV_IMPORT_BATCH_SIZE):
+                yield arrow_batch.slice(offset, settings.CSV_IMPORT_BATCH_SIZE)
+    except pyarrow.ArrowInvalid as e:
+        if "columns" in str(e):
+            raise ColumnCountError(f"Unexpected column count; expected {len(columns)}: {e}")
+        raise IBMSValidationError(str(e))
+
+
+def arrow_record_batches(chunks: Iterable[bytes], columns: Sequence[CSVColumn], start_row: int = 0) -> Iterator[RecordBatch]:
+    """The arrow parser engine: for a passed-in iterable of byte chunks, yield RecordBatch objects of (at most)
+    CSV_IMPORT_BATCH_SIZE records, parsed by arrow_string_batches and converted column by column.
+    """
+    for block in arrow_string_batches(chunks, columns, start_row):
+        yield RecordBatch([_convert_arrow_column(block.column(i), column) for i, column in enumerate(columns)])
+
+
+def _invalid_arrow_values(array, column: CSVColumn) -> List[int]:
+    """For a pyarrow array of CSV string values, return the indexes of the values which cannot be converted to the type
+    of the CSVColumn. The array is converted as a whole, and only an array which fails is split in half and rechecked.
+    """
+    try:
+        _cast_arrow_column(array, column)
+    except IBMSValidationError:
+        if len(array) == 1:
+            return [0]
+        middle = len(array) // 2
+        return _invalid_arrow_values(array.slice(0, middle), column) + [
+            middle + i for i in _invalid_arrow_values(array.slice(middle), column)
+        ]
+    return []
+
+
+def validate_arrow_columns(block, columns: Sequence[CSVColumn], first_row_number: int = 1) -> List[str]:
+    """As validate_csv_columns, for a pyarrow record batch of string values: each column is checked with the
+    conversions used by the arrow parser engine, so that the values accepted are the values which the engine imports.
+    """
+    errors = []  # List of (row number, error) tuples.
+    for column, array in zip(columns, block.columns):
+        if column.type in COLUMN_TYPE_ERRORS:
+            invalid = _invalid_arrow_values(array, column)
+        elif column.max_length:
+            lengths = pyarrow.compute.utf8_length(pyarrow.compute.utf8_trim_whitespace(array))
+            invalid = pyarrow.compute.indices_nonzero(pyarrow.compute.greater(lengths, column.max_length)).to_pylist()
+        else:
+            continue
+        errors.extend((first_row_number + i, f"{column.name} {column_error(column)}, got: {array[i].as_py()}") for i in invalid)
+
+    return [f"Row {row_number}: {error}" for row_number, error in sorted(errors, key=lambda e: e[0])]
+
+
+@contextmanager
+def csv_chunks_context(source: str | BlobClient, metrics: Optional[ImportMetrics] = None):
+    """For a passed-in CSV source (file path or Azure BlobClient), yields an iterator of the raw byte chunks of the
+    content. A file is read in chunks of CSV_READ_CHUNK_SIZE bytes, and a blob is streamed in the chunks of its download.
+    """
+    if isinstance(source, BlobClient):
+        with metrics_phase(metrics, "download"):
+            stream = source.download_blob()
+        yield stream.chunks()
+    else:
+        with open(source, "rb") as csvfile:
+            yield iter(lambda: csvfile.read(settings.CSV_READ_CHUNK_SIZE), b"")
+
+
+@contextmanager
+def record_batch_context(
+    source: str | BlobClient,
+    columns: Sequence[CSVColumn],
+    engine: Optional[str] = None,
+    start_row: int = 0,
+    metrics: Optional[ImportMetrics] = None,
+):
+    """For a passed-in CSV source (file path or Azure BlobClient), yields an iterator of RecordBatch objects of typed
+    records, parsed by the selected engine (see get_csv_parser_engine). A non-zero `start_row` skips that number of
+    data rows. If `metrics` is passed in, parsing and type conversion are recorded as the "parse" phase (for the arrow
+    engine, this includes reading the content).
+    """
+    if get_csv_parser_engine(engine) == "arrow":
+        with csv_chunks_context(source, metrics) as chunks:
+            batches = arrow_record_batches(chunks, columns, start_row)
+            yield metrics.timed(batches, "parse") if metrics else batches
+    else:
+        with csv_source_context(source, metrics) as reader:
+            if start_row:
+                reader = itertools.islice(reader, start_row, None)
+            batches = csv_record_batches(reader, columns)
+            yield metrics.timed(batches, "parse") if metrics else batches
+
+
+def validate_csv_upload(
+    source: str | BlobClient, model: type, metrics: Optional[ImportMetrics] = None, engine: Optional[str] = None
+) -> List[str]:
+    """For a passed-in CSV source (file path or Azure BlobClient) and IBMS model, carry out a validation-only pass
+    of the whole file (no records are written) and return a list of every error found, sorted by row.
+    Rows are numbered from the first data row (i.e. excluding any header row).
+    The file is read in blocks of CSV_IMPORT_BATCH_SIZE rows, so memory use does not grow with file size.
+    GL pivot download files are validated with the CSV parser `engine` which will import them (see
+    get_csv_parser_engine). If the arrow engine is unable to parse the file, it is validated by the csv engine instead
+    (which reports each row having the wrong number of columns).
+    """
+    columns = CSV_UPLOAD_COLUMNS[model]
+    if model == GLPivDownload and get_csv_parser_engine(engine) == "arrow":
+        errors = []
+        row_count = 0
+        try:
+            with metrics_phase(metrics, "validate"), csv_chunks_context(source, metrics) as chunks:
+                for block in arrow_string_batches(chunks, columns):
+                    errors.extend(validate_arrow_columns(block, columns, first_row_number=row_count + 1))
+                    row_count += block.num_rows
+            return errors
+        except IBMSValidationError as e:
+            return validate_csv_upload(source, model, metrics, engine="csv") or [str(e)]
+
+    errors = []
+    row_count = 0
+    with metrics_phase(metrics, "validate"), csv_source_context(source, metrics) as reader:
+        while block := list(itertools.islice(reader, settings.CSV_IMPORT_BATCH_SIZE)):
+            errors.extend(validate_csv_columns(block, columns, first_row_number=row_count + 1))
+            row_count += len(block)
+    return errors
+
+
+def checkpoint_rows(reader: Iterable[Sequence], progress: ProgressCallback, start_row: int = 0) -> Iterator[Sequence]:
+    """Wrap a CSV reader to call `progress` after each CSV_IMPORT_BATCH_SIZE rows, for imports which save records
+    individually (i.e. each row has been committed by the time the following row is requested).
+    """
+    count = start_row
+    for row in reader:
+        yield row
+        count += 1
+        if count % settings.CSV_IMPORT_BATCH_SIZE == 0:
+            progress("importing", count, count)
 
 
 def ibms_import_from_csv(
@@ -127,160 +1346,129 @@ def ibms_import_from_csv(
         | ServicePriorityMapping
     ],
     user: Optional[User] = None,
+    mode: Literal["append", "reload", "delta"] = "append",
+    delete_missing: bool = False,
+    progress: Optional[ProgressCallback] = None,
+    start_row: int = 0,
+    metrics: Optional[ImportMetrics] = None,
+    link: bool = True,
+    engine: Optional[str] = None,
 ) -> Tuple:
     """Generic utility function to take a CSV source (file path or Azure BlobClient),
     a FinancialYear object and an IBMS model, and import that data (update existing or create new records).
     Data validation is carried out during the import.
+    GLPivDownload imports may also use mode="reload", which replaces all records for the financial year, or
+    mode="delta", which only writes new and changed records (and deletes missing records if delete_missing=True).
+    The optional `progress` callable is called with (phase, rows processed, rows committed) after each batch.
+    A non-zero `start_row` skips that number of (already committed) data rows, to resume an interrupted import.
+    If an ImportMetrics object is passed in, the time and queries of each phase of the import are recorded on it.
+    Pass link=False to skip setting the links between records (e.g. where several files are imported in turn and
+    relink_financial_year is called once afterwards).
+    GL pivot download files are parsed into typed record batches by the CSV parser `engine` (see get_csv_parser_engine).
+    The data version of the financial year is bumped once the records are written (see bumps_data_version).
     """
-    ctx = blobload_context(source) if isinstance(source, BlobClient) else csvload_context(source)
+    if mode != "append" and model != GLPivDownload:
+        raise ValueError(f"Import mode {mode} is not supported for {model._meta.verbose_name} uploads")
+    if start_row and mode != "append":
+        raise ValueError(f"Import mode {mode} cannot be resumed part-way through a file")
+
     return_str = None
-    record_count = 0
-    with ctx as reader:
-        if model == GLPivDownload:
-            for row in reader:
-                _ = validate_column_count(row, 34)
-                record_count += 1
-                # NOTE: this branch differs from the others, in that it assumes a superuser will first clear existing
-                # GLPivDownload records for a given financial year.
-                # We can't use bulk_create here because it doesn't set the object FK links.
-                try:
-                    download_period = datetime.strptime(row[0], "%d/%m/%Y")
-                except ValueError:
-                    raise IBMSValidationError(f"Unable to parse downloadPeriod value {row[0]} as a date")
-                return_str = "GL Pivot Download"
-                _ = GLPivDownload.objects.create(
-                    fy=fy,
-                    download_period=download_period,
-                    downloadPeriod=row[0],
-                    costCentre=row[1],
-                    account=row[2],
-                    service=row[3],
-                    activity=row[4],
-                    resource=row[5],
-                    project=row[6],
-                    job=row[7],
-                    shortCode=row[8],
-                    shortCodeName=row[9],
-                    gLCode=row[10],
-                    ptdActual=row[11],
-                    ptdBudget=row[12],
-                    ytdActual=row[13],
-                    ytdBudget=row[14],
-                    fybudget=row[15],
-                    ytdVariance=row[16],
-                    ccName=row[17],
-                    serviceName=row[18],
-                    activityName=row[19],
-                    resourceName=row[20],
-                    projectName=row[21],
-                    jobName=row[22],
-                    codeID=row[23],
-                    resNameNo=row[24],
-                    actNameNo=row[25],
-                    projNameNo=row[26],
-                    regionBranch=row[27],
-                    division=row[28],
-                    resourceCategory=row[29],
-                    wildfire=row[30],
-                    expenseRevenue=row[31],
-                    fireActivities=row[32],
-                    mPRACategory=row[33],
-                )
+    record_count = start_row
+    if model == GLPivDownload:
+        # GL pivot download records are parsed in typed batches, and the reader yields RecordBatch objects.
+        ctx = record_batch_context(source, CSV_UPLOAD_COLUMNS[GLPivDownload], engine, start_row, metrics)
+    else:
+        ctx = csv_source_context(source, metrics)
+    with bumps_data_version(fy), metrics_phase(metrics, "insert"), ctx as reader:
+        if start_row and model != GLPivDownload:
+            reader = itertools.islice(reader, start_row, None)
+        if progress and model == DepartmentProgram:
+            # This import saves each record individually, so every row read has been committed.
+            reader = checkpoint_rows(reader, progress, start_row)
+
+        if model == GLPivDownload and mode == "reload":
+            return_str = "GL Pivot Download"
+            record_count = reload_glpivdownload(reader, fy, progress)
+        elif model == GLPivDownload and mode == "delta":
+            return_str = "GL Pivot Download"
+            record_count, inserted, updated, deleted = delta_glpivdownload(reader, fy, delete_missing, progress)
+            LOGGER.info(
+                f"GL pivot download delta import for {fy}: {record_count} rows read, {inserted} inserted, {updated} updated, {deleted} deleted"
+            )
+        elif model == GLPivDownload:
+            # NOTE: this branch differs from the others, in that it assumes a superuser will first clear existing
+            # GLPivDownload records for a given financial year (or use the reload mode above).
+            # Records are inserted in batches using bulk_create (which bypasses the model save() method), and the
+            # IBMData / DepartmentProgram FK links are set afterwards for the whole financial year.
+            # Each batch is committed together with its progress checkpoint, so that a resumed import never inserts
+            # a committed batch again. A resumed import also skips records which already exist (e.g. those committed
+            # by an earlier release, which checkpointed progress separately).
+            return_str = "GL Pivot Download"
+            attnames = [f.attname for f in GLPIVDOWNLOAD_FIELDS]
+            for batch in reader:
+                with transaction.atomic():
+                    GLPivDownload.objects.bulk_create(
+                        [GLPivDownload(**dict(zip(attnames, values))) for values in glpivdownload_values(batch, fy)],
+                        ignore_conflicts=bool(start_row),
+                    )
+                    record_count += batch.row_count
+                    if progress:
+                        progress("importing", record_count, record_count)
+            if link:
+                if progress:
+                    progress("linking", record_count, record_count)
+                with metrics_phase(metrics, "link"):
+                    link_glpivdownload(fy)
         elif model == IBMData:
-            for row in reader:
-                _ = validate_column_count(row, 17)
-                record_count += 1
-                return_str = "IBM Data"
-                with create_revision():
-                    if IBMData.objects.filter(fy=fy, ibmIdentifier=str(row[0]).upper()).exists():
-                        ibmdata = IBMData.objects.get(fy=fy, ibmIdentifier=str(row[0]).upper())
-                        ibmdata.costCentre = row[1]
-                        ibmdata.account = row[2]
-                        ibmdata.service = row[3]
-                        ibmdata.activity = row[4]
-                        ibmdata.project = row[5]
-                        ibmdata.job = row[6]
-                        ibmdata.budgetArea = row[7]
-                        ibmdata.projectSponsor = row[8]
-                        ibmdata.regionalSpecificInfo = row[9]
-                        ibmdata.servicePriorityID = row[10]
-                        ibmdata.annualWPInfo = row[11]
-                        ibmdata.priorityActionNo = row[12]
-                        ibmdata.priorityLevel = row[13]
-                        ibmdata.marineKPI = row[14]
-                        ibmdata.regionProject = row[15]
-                        ibmdata.regionDescription = row[16]
-                        set_comment(f"{ibmdata} amended via upload")
-                        if user:
-                            set_user(user)
-                            ibmdata.modifier = user
-                    else:
-                        data = {
-                            "fy": fy,
-                            "ibmIdentifier": validate_char_field("ibmIdentifier", 50, row[0].upper()),
-                            "costCentre": validate_char_field("costCentre", 4, row[1]),
-                            "account": validate_integer_field("account", row[2]),
-                            "service": validate_integer_field("service", row[3]),
-                            "activity": validate_char_field("activity", 4, row[4]),
-                            "project": validate_char_field("project", 6, row[5]),
-                            "job": validate_char_field("job", 6, row[6]),
-                            "budgetArea": validate_char_field("budgetArea", 50, row[7]),
-                            "projectSponsor": validate_char_field("projectSponsor", 50, str(row[8])),
-                            "regionalSpecificInfo": str(row[9]),
-                            "servicePriorityID": validate_char_field("servicePriorityID", 100, row[10]),
-                            "annualWPInfo": str(row[11]),
-                            "priorityActionNo": str(row[12]),
-                            "priorityLevel": str(row[13]),
-                            "marineKPI": str(row[14]),
-                            "regionProject": str(row[15]),
-                            "regionDescription": str(row[16]),
-                        }
-                        ibmdata = IBMData(**data)
-                        set_comment(f"{ibmdata} created via upload")
-                        if user:
-                            set_user(user)
-                            ibmdata.modifier = user
-                    ibmdata.save()
-
-                    # Repeat the save, in order to try setting the service priority on the object.
-                    # We can't set this before having a PK on the object, hence the conditional second save.
-                    if not ibmdata.service_priority:
-                        ibmdata.save()
-
-                # Update any existing GLPivDownload objects that should now link to this object.
-                for glpiv in GLPivDownload.objects.filter(fy=fy, codeID=ibmdata.ibmIdentifier, ibmdata__isnull=True):
-                    glpiv.save()
+            return_str = "IBM Data"
+            # Read all the existing IBMData records for the financial year in one query, keyed by ibmIdentifier.
+            existing = {ibmdata.ibmIdentifier: ibmdata for ibmdata in IBMData.objects.filter(fy=fy).select_related("fy")}
+            batch = {}
+            # A single revision is recorded for the whole upload. The revision is not atomic, so that each batch of
+            # records is committed as it is written (allowing progress to be checkpointed). The versions are saved
+            # as the revision block exits, which is recorded as the "revision" phase.
+            with metrics_phase(metrics, "revision"), create_revision(atomic=False), metrics_phase(metrics, "insert"):
+                for row in reader:
+                    _ = validate_column_count(row, 17)
+                    record_count += 1
+                    data = ibmdata_values_from_row(row)
+                    ibmdata = existing.get(data["ibmIdentifier"])
+                    if not ibmdata:
+                        ibmdata = IBMData(fy=fy)
+                        existing[data["ibmIdentifier"]] = ibmdata
+                    for field, value in data.items():
+                        setattr(ibmdata, field, value)
+                    if user:
+                        ibmdata.modifier = user
+                    batch[data["ibmIdentifier"]] = ibmdata
+                    if len(batch) >= settings.CSV_IMPORT_BATCH_SIZE:
+                        upsert_ibmdata(batch.values())
+                        batch = {}
+                        if progress:
+                            progress("importing", record_count, record_count)
+                if batch:
+                    upsert_ibmdata(batch.values())
+                set_comment(f"{record_count - start_row} IBM data records created or amended via upload")
+                if user:
+                    set_user(user)
+
+            # Set the service priority links and any GLPivDownload links for the financial year in one pass each.
+            if link:
+                if progress:
+                    progress("linking", record_count, record_count)
+                with metrics_phase(metrics, "link"):
+                    link_ibmdata_service_priority(fy)
+                    link_glpivdownload(fy)
         elif model == CorporateStrategy:
-            for row in reader:
-                _ = validate_column_count(row, 3)
-                record_count += 1
-                return_str = "IBMS Corporate Strategy"
-                data = {
-                    "fy": fy,
-                    "corporateStrategyNo": validate_char_field("corporateStrategyNo", 10, row[0]),
-                    "description1": str(row[1]),
-                    "description2": str(row[2]),
-                }
-                query = {"fy": fy, "corporateStrategyNo": str(row[0])}
-                _, _ = CorporateStrategy.objects.update_or_create(defaults=data, **query)
+            return_str = "IBMS Corporate Strategy"
+            record_count = bulk_upsert_from_rows(
+                reader, fy, CorporateStrategy, corporatestrategy_values_from_row, 3, ["corporateStrategyNo"], progress, record_count
+            )
         elif model == NCStrategicPlan:
-            for row in reader:
-                _ = validate_column_count(row, 8)
-                record_count += 1
-                return_str = "Nature Conservation"
-                data = {
-                    "fy": fy,
-                    "strategicPlanNo": validate_char_field("strategicPlanNo", 20, row[0]),
-                    "directionNo": validate_char_field("directionNo", 20, row[1]),
-                    "direction": str(row[2]),
-                    "aimNo": validate_char_field("directionNo", 20, row[3]),
-                    "aim1": str(row[4]),
-                    "aim2": str(row[5]),
-                    "actionNo": validate_char_field("directionNo", 20, row[6]),
-                    "action": str(row[7]),
-                }
-                query = {"fy": fy, "strategicPlanNo": str(row[0])}
-                _, _ = NCStrategicPlan.objects.update_or_create(defaults=data, **query)
+            return_str = "Nature Conservation"
+            record_count = bulk_upsert_from_rows(
+                reader, fy, NCStrategicPlan, ncstrategicplan_values_from_row, 8, ["strategicPlanNo"], progress, record_count
+            )
         elif model == DepartmentProgram:
             for row in reader:
                 _ = validate_column_count(row, 4)
@@ -294,111 +1482,57 @@ def ibms_import_from_csv(
                 }
                 query = {"fy": fy, "ibmIdentifier": str(row[0])}
                 department_program, _ = DepartmentProgram.objects.update_or_create(defaults=data, **query)
+                if not link:
+                    continue
                 # Update any GLPivDownload objects that should be linked to this object.
                 for gl in GLPivDownload.objects.filter(fy=fy, codeID=department_program.ibmIdentifier, department_program__isnull=True):
                     gl.save()  # Sets the FK link on save.
         elif model == GeneralServicePriority:
-            for row in reader:
-                _ = validate_column_count(row, 6)
-                record_count += 1
-                data = {
-                    "fy": fy,
-                    "categoryID": validate_char_field("categoryID", 30, row[0]),
-                    "servicePriorityNo": validate_char_field("servicePriorityNo", 20, row[1]),
-                    "strategicPlanNo": validate_char_field("strategicPlanNo", 20, row[2]),
-                    "corporateStrategyNo": row[3],
-                    "description": str(row[4]),
-                    "description2": str(row[5]),
-                }
-                query = {"fy": fy, "servicePriorityNo": str(row[1])}
-                _, _ = GeneralServicePriority.objects.update_or_create(defaults=data, **query)
+            record_count = bulk_upsert_from_rows(
+                reader, fy, GeneralServicePriority, generalservicepriority_values_from_row, 6, ["servicePriorityNo"], progress, record_count
+            )
         elif model == NCServicePriority:
-            for row in reader:
-                _ = validate_column_count(row, 12)
-                record_count += 1
-                return_str = "Nature Conservation Service Priority"
-                data = {
-                    "fy": fy,
-                    "categoryID": validate_char_field("categoryID", 30, row[0]),
-                    "servicePriorityNo": validate_char_field("servicePriorityNo", 100, row[1]),
-                    "strategicPlanNo": validate_char_field("strategicPlanNo", 100, row[2]),
-                    "corporateStrategyNo": validate_char_field("corporateStrategyNo", 100, row[3]),
-                    "assetNo": validate_char_field("AssetNo", 5, row[4]),
-                    "asset": str(row[5]),
-                    "targetNo": validate_char_field("Asset", 30, row[6]),
-                    "target": str(row[7]),
-                    "actionNo": str(row[8]),
-                    "action": str(row[9]),
-                    "mileNo": validate_char_field("MileNo", 30, row[10]),
-                    "milestone": str(row[11]),
-                }
-                query = {"fy": fy, "servicePriorityNo": str(row[1])}
-                _, _ = NCServicePriority.objects.update_or_create(defaults=data, **query)
+            return_str = "Nature Conservation Service Priority"
+            record_count = bulk_upsert_from_rows(
+                reader, fy, NCServicePriority, ncservicepriority_values_from_row, 12, ["servicePriorityNo"], progress, record_count
+            )
         elif model == PVSServicePriority:
-            for row in reader:
-                _ = validate_column_count(row, 8)
-                record_count += 1
-                return_str = "Parks & Visitor Services Service Priority"
-                data = {
-                    "fy": fy,
-                    "categoryID": validate_char_field("categoryID", 30, row[0]),
-                    "servicePriorityNo": validate_char_field("servicePriorityNo", 100, row[1]),
-                    "strategicPlanNo": validate_char_field("strategicPlanNo", 100, row[2]),
-                    "corporateStrategyNo": row[3],
-                    "servicePriority1": str(row[4]),
-                    "description": str(row[5]),
-                    "pvsExampleAnnWP": str(row[6]),
-                    "pvsExampleActNo": str(row[7]),
-                }
-                query = {"fy": fy, "servicePriorityNo": str(row[1])}
-                _, _ = PVSServicePriority.objects.update_or_create(defaults=data, **query)
+            return_str = "Parks & Visitor Services Service Priority"
+            record_count = bulk_upsert_from_rows(
+                reader, fy, PVSServicePriority, pvsservicepriority_values_from_row, 8, ["servicePriorityNo"], progress, record_count
+            )
         elif model == SFMServicePriority:
-            for row in reader:
-                _ = validate_column_count(row, 7)
-                record_count += 1
-                return_str = "Forest Management Service Priority"
-                data = {
-                    "fy": fy,
-                    "categoryID": validate_char_field("categoryID", 30, row[0]),
-                    "regionBranch": validate_char_field("regionBranch", 20, row[1]),
-                    "servicePriorityNo": validate_char_field("servicePriorityNo", 20, row[2]),
-                    "strategicPlanNo": validate_char_field("strategicPlanNo", 20, row[3]),
-                    "corporateStrategyNo": row[4],
-                    "description": str(row[5]),
-                    "description2": str(row[6]),
-                }
-                query = {"fy": fy, "servicePriorityNo": validate_char_field("servicePriorityNo", 20, row[2])}
-                _, _ = SFMServicePriority.objects.update_or_create(defaults=data, **query)
+            return_str = "Forest Management Service Priority"
+            record_count = bulk_upsert_from_rows(
+                reader, fy, SFMServicePriority, sfmservicepriority_values_from_row, 7, ["servicePriorityNo"], progress, record_count
+            )
         elif model == ERServicePriority:
-            for row in reader:
-                _ = validate_column_count(row, 6)
-                record_count += 1
-                return_str = "Fire Services Service Priority"
-                data = {
-                    "fy": fy,
-                    "categoryID": validate_char_field("categoryID", 30, row[0]),
-                    "servicePriorityNo": validate_char_field("servicePriorityNo", 10, row[1]),
-                    "strategicPlanNo": validate_char_field("strategicPlanNo", 10, row[2]),
-                    "corporateStrategyNo": row[3],
-                    "classification": str(row[4]),
-                    "description": str(row[5]),
-                }
-                query = {"fy": fy, "servicePriorityNo": str(row[1])}
-                _, _ = ERServicePriority.objects.update_or_create(defaults=data, **query)
+            return_str = "Fire Services Service Priority"
+            record_count = bulk_upsert_from_rows(
+                reader, fy, ERServicePriority, erservicepriority_values_from_row, 6, ["servicePriorityNo"], progress, record_count
+            )
         elif model == ServicePriorityMapping:
-            for row in reader:
-                _ = validate_column_count(row, 4)
-                record_count += 1
-                return_str = "Service Priority Mapping"
-                data = {
-                    "fy": fy,
-                    "costCentreNo": validate_char_field("costCentreNo", 4, row[0]),
-                    "wildlifeManagement": validate_char_field("wildlifeManagement", 100, row[1]),
-                    "parksManagement": validate_char_field("parksManagement", 100, row[2]),
-                    "forestManagement": validate_char_field("forestManagement", 100, row[3]),
-                }
-                _, _ = ServicePriorityMapping.objects.update_or_create(**data)
+            return_str = "Service Priority Mapping"
+            record_count = bulk_upsert_from_rows(
+                reader,
+                fy,
+                ServicePriorityMapping,
+                serviceprioritymapping_values_from_row,
+                4,
+                ["costCentreNo", "wildlifeManagement", "parksManagement", "forestManagement"],
+                progress,
+                record_count,
+            )
+
+    # Strategy and service priority uploads may change the links of records uploaded earlier, in any order.
+    if link and model in (CorporateStrategy, NCStrategicPlan, *SERVICE_PRIORITY_MODELS):
+        if progress:
+            progress("linking", record_count, record_count)
+        with metrics_phase(metrics, "link"):
+            relink_financial_year(fy)
 
+    if metrics:
+        metrics.rows = record_count - start_row
     if not return_str:
         return model._meta.verbose_name.capitalize(), record_count
     else:
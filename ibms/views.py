@@ -1,6 +1,8 @@
 import json
 import logging
 import os
+import re
+import uuid
 
 from azure.storage.blob import BlobServiceClient
 from django.conf import settings
@@ -8,33 +10,82 @@ from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.exceptions import FieldDoesNotExist
 from django.db import connection
-from django.http import HttpResponse, HttpResponseBadRequest, QueryDict, StreamingHttpResponse
-from django.shortcuts import redirect
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, QueryDict, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
 from django.utils.http import urlencode
-from django.views.generic import CreateView, ListView, TemplateView, UpdateView
+from django.views.generic import CreateView, ListView, TemplateView, UpdateView, View
 from django.views.generic.detail import BaseDetailView
 from django.views.generic.edit import FormMixin, FormView
 from reversion import create_revision, set_comment, set_user
 from reversion.views import RevisionMixin
-from xlrd import open_workbook
-from xlutils.copy import copy as copy_xl
 
+from ibms.downloads import (
+    cache_download_artifact,
+    download_artifact_chunks,
+    download_artifact_name,
+    download_artifact_properties,
+    gunzip_chunks,
+    parse_byte_range,
+)
+from ibms.excel import get_excel_template
 from ibms.forms import (
+    BatchUploadForm,
     ClearGLPivotForm,
+    CodeUpdateBatchForm,
     CodeUpdateCreateForm,
+    DataAmendmentForm,
     DownloadForm,
     IbmDataFilterForm,
     IbmDataForm,
     ManagerCodeUpdateForm,
+    ReloadReportForm,
+    ServicePriorityReportForm,
     UploadForm,
 )
-from ibms.models import FinancialYear, GLPivDownload, IBMData, NCServicePriority, PVSServicePriority, SFMServicePriority
-from ibms.reports import code_update_report, download_report
-from ibms.tasks import process_uploaded_csv
-from ibms.utils import get_download_period
+from ibms.models import (
+    FinancialYear,
+    GLPivDownload,
+    IBMData,
+    ImportBatch,
+    ImportJob,
+    NCServicePriority,
+    PVSServicePriority,
+    ReportJob,
+    SFMServicePriority,
+)
+from ibms.reports import (
+    CODE_UPDATE_TEMPLATE,
+    DATA_AMEND_TEMPLATE,
+    DOWNLOAD,
+    DOWNLOAD_DEPT_PROGRAMS,
+    DOWNLOAD_ENHANCED,
+    DOWNLOAD_VARIANTS,
+    RELOAD_TEMPLATE,
+    SERVICE_PRIORITY_TEMPLATE,
+    WorkbookRowLimitError,
+    code_update_exceptions,
+    code_update_report,
+    data_amend_report,
+    download_report,
+    gzip_report,
+    reload_report,
+    service_priority_report,
+)
+from ibms.tasks import (
+    find_duplicate_import,
+    generate_code_update_batch,
+    generate_download,
+    process_import_batch,
+    process_uploaded_csv,
+    upload_blob_client,
+)
+from ibms.utils import HashingReader, get_download_period
 
 LOGGER = logging.getLogger("ibms")
+ACCEPTS_GZIP = re.compile(r"\bgzip\b")  # Matches an Accept-Encoding request header which accepts gzip.
 
 
 class SiteHomeView(LoginRequiredMixin, TemplateView):
@@ -98,6 +149,7 @@ class ClearGLPivotView(IbmsFormView):
         count = GLPivDownload.objects.filter(fy=fy).count()
         with connection.cursor() as cursor:
             cursor.execute("DELETE FROM ibms_glpivdownload WHERE fy_id = %s", [fy.financialYear])
+        fy.bump_data_version()
 
         messages.success(self.request, f"Deleted {count} GL Pivot entries for {fy}")
 
@@ -111,12 +163,15 @@ class UploadView(IbmsFormView):
     defined in settings.
     """
 
+    template_name = "ibms/upload.html"
     form_class = UploadForm
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["page_title"] = f"{settings.SITE_ACRONYM} | Upload"
         context["title"] = "UPLOAD"
+        context["import_jobs"] = ImportJob.objects.select_related("fy", "user")[0:10]
+        context["import_jobs_active"] = any(job.status in ImportJob.ACTIVE_STATUSES for job in context["import_jobs"])
         return context
 
     def get_success_url(self):
@@ -137,59 +192,289 @@ class UploadView(IbmsFormView):
             messages.error(self.request, "Azure Storage is not configured. Please contact an administrator.")
             return self.form_invalid(form)
 
-        blob_name = upload_file.name
+        # Each upload has its own blob (retained until its import is complete), even if the file name is reused.
+        file_name = os.path.basename(upload_file.name)
+        blob_name = f"upload-{uuid.uuid4().hex}/{file_name}"
 
         try:
             blob_service = BlobServiceClient.from_connection_string(connection_string)
             container_name = settings.AZURE_STORAGE_CONTAINER_NAME
             blob_client = blob_service.get_blob_client(container=container_name, blob=blob_name)
             # Stream the uploaded file directly to blob storage chunk by chunk to avoid
-            # loading the entire file into memory.
-            blob_client.upload_blob(upload_file, overwrite=True)
+            # loading the entire file into memory, hashing the content as it is read.
+            reader = HashingReader(upload_file)
+            blob_client.upload_blob(reader, length=upload_file.size, overwrite=True)
         except Exception as e:
             LOGGER.exception(f"Failed to upload blob {blob_name}: {e}")
-            messages.error(self.request, f"Upload failed: {blob_name}")
+            messages.error(self.request, f"Upload failed: {file_name}")
             return self.form_invalid(form)
 
-        messages.success(self.request, f"File uploaded successfully ({blob_name}). Notification will be sent when processing is complete.")
+        job_fields = {
+            "user": self.request.user,
+            "fy": fy,
+            "blob_name": blob_name,
+            "file_type": file_type,
+            "import_mode": form.cleaned_data["import_mode"],
+            "delete_missing": form.cleaned_data["delete_missing"],
+            "content_hash": reader.hexdigest(),
+        }
+
+        # Skip the import if identical content has already been imported, unless reprocessing is forced.
+        duplicate = None
+        if not form.cleaned_data["force_reprocess"]:
+            duplicate = find_duplicate_import(
+                fy, file_type, job_fields["content_hash"], job_fields["import_mode"], job_fields["delete_missing"]
+            )
+        if duplicate:
+            ImportJob.objects.create(status="skipped", completed=timezone.now(), **job_fields)
+            blob_client.delete_blob()
+            LOGGER.info(f"Skipped {file_type} upload {blob_name}: identical to {duplicate}")
+            messages.info(
+                self.request,
+                f"{file_name} is identical to {os.path.basename(duplicate.blob_name)}, uploaded {duplicate.created:%d/%m/%Y %H:%M}, so it has not "
+                "been imported again. Select 'Force reprocess' to import it anyway.",
+            )
+            return super(UploadView, self).form_valid(form)
+
+        import_job = ImportJob.objects.create(**job_fields)
+        messages.success(self.request, f"File uploaded successfully ({file_name}). Notification will be sent when processing is complete.")
         # User email notifications (success/failure) take place in the task.
-        process_uploaded_csv.enqueue(blob_name, fy.financialYear, file_type, self.request.user.username)
+        process_uploaded_csv.enqueue(import_job.pk)
         return super(UploadView, self).form_valid(form)
 
 
+class BatchUploadView(IbmsFormView):
+    """Superuser-only view to upload a set of CSV files (and/or zip files of CSV files) for one financial year.
+    Each file is streamed to Azure Blob Storage, then the files are imported in dependency order by a single
+    background task, followed by one pass to set the links between records (see process_import_batch).
+    """
+
+    form_class = BatchUploadForm
+
+    def dispatch(self, request, *args, **kwargs):
+        if not request.user.is_superuser:
+            messages.error(self.request, "You do not have permission to use this function.")
+            return redirect("site_home")
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["page_title"] = f"{settings.SITE_ACRONYM} | Batch upload"
+        context["title"] = "BATCH UPLOAD"
+        return context
+
+    def get_success_url(self):
+        return reverse("ibms:upload")
+
+    def form_valid(self, form):
+        fy = form.cleaned_data["financial_year"]
+        connection_string = os.environ.get("AZURE_STORAGE_CONNECTION_STRING")
+        if not connection_string:
+            messages.error(self.request, "Azure Storage is not configured. Please contact an administrator.")
+            return self.form_invalid(form)
+
+        batch = ImportBatch.objects.create(user=self.request.user, fy=fy)
+        uploaded = []
+        try:
+            blob_service = BlobServiceClient.from_connection_string(connection_string)
+            for csv_file in form.cleaned_data["csv_files"]:
+                blob_name = f"batch-{batch.pk}/{os.path.basename(csv_file.name)}"
+                blob_client = blob_service.get_blob_client(container=settings.AZURE_STORAGE_CONTAINER_NAME, blob=blob_name)
+                # Stream each file to blob storage, hashing the content as it is read.
+                reader = HashingReader(csv_file.open())
+                blob_client.upload_blob(reader, length=csv_file.size, overwrite=True)
+                uploaded.append((csv_file, blob_client, reader.hexdigest()))
+        except Exception as e:
+            LOGGER.exception(f"Failed to upload batch {batch.pk}: {e}")
+            for _, blob_client, _ in uploaded:
+                blob_client.delete_blob()
+            batch.delete()
+            messages.error(self.request, "Upload failed")
+            return self.form_invalid(form)
+
+        skipped = []
+        for csv_file, blob_client, content_hash in uploaded:
+            import_mode = form.cleaned_data["import_mode"] if csv_file.file_type == "gl_pivot_download" else "append"
+            job_fields = {
+                "user": self.request.user,
+                "fy": fy,
+                "batch": batch,
+                "blob_name": blob_client.blob_name,
+                "file_type": csv_file.file_type,
+                "import_mode": import_mode,
+                "content_hash": content_hash,
+            }
+            # Skip any file whose content has already been imported, unless reprocessing is forced.
+            if not form.cleaned_data["force_reprocess"] and find_duplicate_import(fy, csv_file.file_type, content_hash, import_mode):
+                ImportJob.objects.create(status="skipped", completed=timezone.now(), **job_fields)
+                blob_client.delete_blob()
+                skipped.append(csv_file.name)
+            else:
+                ImportJob.objects.create(**job_fields)
+
+        message = f"{len(uploaded)} file(s) uploaded successfully. Notification will be sent when processing is complete."
+        if skipped:
+            message += f" Identical content has already been imported, so these files will not be imported again: {', '.join(skipped)}"
+        messages.success(self.request, message)
+        # The files are imported in dependency order, and the user is notified, by the task.
+        process_import_batch.enqueue(batch.pk)
+        return super(BatchUploadView, self).form_valid(form)
+
+
 class DownloadView(IbmsFormView):
     template_name = "ibms/download.html"
     form_class = DownloadForm
 
+    def get(self, request, *args, **kwargs):
+        # The download form is submitted with GET (see DownloadForm).
+        if "financial_year" in request.GET:
+            return self.post(request, *args, **kwargs)
+        return super().get(request, *args, **kwargs)
+
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
         kwargs.update({"request": self.request})
+        if self.request.method == "GET" and "financial_year" in self.request.GET:
+            kwargs["data"] = self.request.GET
         return kwargs
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["page_title"] = f"{settings.SITE_ACRONYM} | Download"
         context["title"] = "DOWNLOAD"
+        # Downloads generated in the background for the user (see background_response).
+        context["report_jobs"] = ReportJob.objects.filter(report="download", user=self.request.user).select_related("fy")[0:10]
+        context["report_jobs_active"] = any(job.status in ReportJob.ACTIVE_STATUSES for job in context["report_jobs"])
         return context
 
     def get_success_url(self):
         return reverse("ibms:download")
 
-    def form_valid(self, form):
+    def get_filters(self, form):
+        """Return the GLPivDownload field filters of the download (one of cost centre, region or division, if any)."""
         d = form.cleaned_data
-        glpiv_qs = GLPivDownload.objects.filter(fy=d["financial_year"])
-
         if d.get("cost_centre", None):
-            glpiv_qs = glpiv_qs.filter(costCentre=d["cost_centre"])
+            return {"costCentre": d["cost_centre"]}
         elif d.get("region", None):
-            glpiv_qs = glpiv_qs.filter(regionBranch=d["region"])
+            return {"regionBranch": d["region"]}
         elif d.get("division", None):
-            glpiv_qs = glpiv_qs.filter(division=d["division"])
+            return {"division": d["division"]}
+        return {}
+
+    def get_queryset(self, form):
+        """Return the GLPivDownload queryset to download, filtered by the form."""
+        return GLPivDownload.objects.filter(fy=form.cleaned_data["financial_year"], **self.get_filters(form))
+
+    def download_response(self, form, variant, file_name):
+        """Return a streaming response of a download report variant. The CSV is gzip-compressed if the user requested
+        a .csv.gz file, or else if the client accepts gzip-encoded content.
+        If blob storage is configured, the compressed CSV is also stored as a download artifact for the current data
+        version of the financial year, and later downloads are served from the artifact (see artifact_response).
+        Downloads of at least DOWNLOAD_BACKGROUND_ROWS rows are generated in the background instead (see
+        background_response).
+        """
+        fy = form.cleaned_data["financial_year"]
+        compressed = form.cleaned_data.get("compressed")
+        gzipped = compressed or bool(ACCEPTS_GZIP.search(self.request.META.get("HTTP_ACCEPT_ENCODING", "")))
+        blob_client = upload_blob_client(download_artifact_name(variant, fy, self.get_filters(form)))
+        if blob_client:
+            properties = download_artifact_properties(blob_client, fy.data_version)
+            if properties:
+                return self.artifact_response(blob_client, properties, file_name, compressed, gzipped)
+
+        glpiv_qs = self.get_queryset(form)
+        if blob_client and settings.DOWNLOAD_BACKGROUND_ROWS:
+            rows = glpiv_qs.count()
+            if rows >= settings.DOWNLOAD_BACKGROUND_ROWS:
+                return self.background_response(form, variant, file_name, rows)
+
+        content = download_report(glpiv_qs, **DOWNLOAD_VARIANTS[variant])
+        if blob_client:
+            # The artifact is always stored compressed, and is decompressed as it is streamed if required.
+            content = cache_download_artifact(gzip_report(content), blob_client, fy.data_version)
+            if not gzipped:
+                content = gunzip_chunks(content)
+        elif gzipped:
+            content = gzip_report(content)
+        return self.set_download_headers(StreamingHttpResponse(content), file_name, compressed, gzipped)
+
+    def background_response(self, form, variant, file_name, rows):
+        """Queue a task to generate a large download report as a download artifact (see generate_download), rather
+        than holding the web worker while it is generated, and redirect to the download page. The user is notified
+        when the download is ready, and it is linked from the download page.
+        """
+        fy = form.cleaned_data["financial_year"]
+        parameters = {"variant": variant, "filters": self.get_filters(form)}
+        jobs = ReportJob.objects.filter(user=self.request.user, fy=fy, report="download", parameters=parameters)
+        if jobs.filter(status__in=ReportJob.ACTIVE_STATUSES).exists():
+            messages.info(self.request, f"{file_name} is already being generated. Notification will be sent when the download is ready.")
+        else:
+            job = ReportJob.objects.create(
+                user=self.request.user, fy=fy, report="download", parameters=parameters, file_name=f"{file_name}.gz"
+            )
+            # The download is generated, and the user is notified, by the task.
+            generate_download.enqueue(job.pk)
+            messages.success(
+                self.request,
+                f"{file_name} has {rows} rows, so it is being generated in the background. Notification will be sent when the "
+                "download is ready.",
+            )
+        return redirect(self.get_success_url())
+
+    def set_download_headers(self, response, file_name, compressed, gzipped):
+        """Set the content type, encoding and file name headers of a download response, and return it."""
+        if compressed:
+            response["Content-Type"] = "application/gzip"
+            file_name = f"{file_name}.gz"
+        else:
+            response["Content-Type"] = "text/csv"
+            if gzipped:
+                response["Content-Encoding"] = "gzip"
+        patch_vary_headers(response, ("Accept-Encoding",))
+        response["Content-Disposition"] = f"attachment; filename={file_name}"
+        return response
 
-        response = StreamingHttpResponse(download_report(glpiv_qs), content_type="text/csv")
-        response["Content-Disposition"] = "attachment; filename=ibms_data_download.csv"
+    def artifact_response(self, blob_client, properties, file_name, compressed, gzipped):
+        """Return a response which streams a cached download artifact, with the artifact ETag so that clients may
+        make conditional requests. If the artifact is served as stored (i.e. gzip-compressed), a Range request for a
+        single byte range is also supported, e.g. to resume an interrupted download.
+        """
+        etag = properties.etag if properties.etag.startswith('"') else f'"{properties.etag}"'
+        if not gzipped:
+            # Decompressed content is equivalent to the artifact, but not byte-for-byte (so ranges are unsupported).
+            etag = f"W/{etag}"
+        response = self.set_download_headers(StreamingHttpResponse(), file_name, compressed, gzipped)
+        response["ETag"] = etag
+        # A 304 (Not Modified) or 412 (Precondition Failed) response is returned if a precondition applies.
+        conditional_response = get_conditional_response(self.request, etag=etag, response=response)
+        if conditional_response is not response:
+            return conditional_response
+
+        if not gzipped:
+            response.streaming_content = gunzip_chunks(download_artifact_chunks(blob_client, properties))
+            return response
+
+        offset, length = 0, properties.size
+        response["Accept-Ranges"] = "bytes"
+        if "Range" in self.request.headers and self.request.headers.get("If-Range", etag) == etag:
+            try:
+                byte_range = parse_byte_range(self.request.headers["Range"], properties.size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response["Content-Range"] = f"bytes */{properties.size}"
+                return response
+            if byte_range:
+                first, last = byte_range
+                offset, length = first, last - first + 1
+                response.status_code = 206
+                response["Content-Range"] = f"bytes {first}-{last}/{properties.size}"
+        response["Content-Length"] = length
+        response.streaming_content = download_artifact_chunks(blob_client, properties, offset, length)
         return response
 
+    def form_valid(self, form):
+        return self.download_response(form, DOWNLOAD, "ibms_data_download.csv")
+
 
 class DownloadEnhancedView(DownloadView):
     def get_context_data(self, **kwargs):
@@ -202,18 +487,7 @@ class DownloadEnhancedView(DownloadView):
         return reverse("ibms:download_enhanced")
 
     def form_valid(self, form):
-        d = form.cleaned_data
-        glpiv_qs = GLPivDownload.objects.filter(fy=d["financial_year"])
-        if d.get("cost_centre", None):
-            glpiv_qs = glpiv_qs.filter(costCentre=d["cost_centre"])
-        elif d.get("region", None):
-            glpiv_qs = glpiv_qs.filter(regionBranch=d["region"])
-        elif d.get("division", None):
-            glpiv_qs = glpiv_qs.filter(division=d["division"])
-
-        response = StreamingHttpResponse(download_report(glpiv_qs, enhanced=True), content_type="text/csv")
-        response["Content-Disposition"] = "attachment; filename=ibms_data_enhanced_download.csv"
-        return response
+        return self.download_response(form, DOWNLOAD_ENHANCED, "ibms_data_enhanced_download.csv")
 
 
 class DownloadDeptProgramView(DownloadView):
@@ -235,19 +509,7 @@ class DownloadDeptProgramView(DownloadView):
         return reverse("ibms:download_dept_program")
 
     def form_valid(self, form):
-        d = form.cleaned_data
-        glpiv_qs = GLPivDownload.objects.filter(fy=d["financial_year"])
-
-        if d.get("cost_centre", None):
-            glpiv_qs = glpiv_qs.filter(costCentre=d["cost_centre"])
-        elif d.get("region", None):
-            glpiv_qs = glpiv_qs.filter(regionBranch=d["region"])
-        elif d.get("division", None):
-            glpiv_qs = glpiv_qs.filter(division=d["division"])
-
-        response = StreamingHttpResponse(download_report(glpiv_qs, enhanced=True, dept_programs=True), content_type="text/csv")
-        response["Content-Disposition"] = "attachment; filename=ibms_department_program_download.csv"
-        return response
+        return self.download_response(form, DOWNLOAD_DEPT_PROGRAMS, "ibms_department_program_download.csv")
 
 
 class CodeUpdateView(LoginRequiredMixin, TemplateView):
@@ -297,38 +559,11 @@ class CodeUpdateAdminView(IbmsFormView):
             gl = gl.filter(costCentre=cc)
             ibm = ibm.filter(costCentre=cc)
 
-        # Filter GLPivot to resource < 4000
-        gl = gl.filter(resource__lt=4000)
-
-        # Exclude service 11 from GLPivDownload queryset.
-        gl = gl.exclude(service=11)
-
         # Superuser must specify DJ0 or non-DJ0 activities only.
-        # Business rule: for normal users, include any line items that are
-        # activity 'DJ0', EXCEPT where service is 42, 43 or 75.
-        # For superusers, do the opposite (include activity DJ0 items ONLY if
-        # service is 42, 43 or 75).
+        report_type = None
         if self.request.user.is_superuser and "report_type" in form.cleaned_data:
-            if form.cleaned_data["report_type"] == "dj0":
-                gl = gl.filter(activity="DJ0")
-                gl = gl.filter(service__in=[42, 43, 75])
-                gl = gl.filter(account__in=[1, 2, 4, 42])
-            else:  # Non-DJ0.
-                gl = gl.exclude(activity="DJ0")
-                gl = gl.filter(account__in=[1, 2, 42])
-        else:
-            # Business rule: for CC 531 only, include accounts 1, 2, 6 & 42.
-            if cc and cc == "531":
-                gl = gl.filter(account__in=[1, 2, 6, 42])
-            else:
-                gl = gl.filter(account__in=[1, 2, 42])
-            gl = gl.exclude(activity="DJ0", service__in=[42, 43, 75])
-
-        # Filter by codeID: EXCLUDE objects with a codeID that matches any
-        # IBMData object's ibmIdentifier for the same FY.
-        code_ids = set(ibm.values_list("ibmIdentifier", flat=True))
-        gl = gl.exclude(codeID__in=code_ids).order_by("codeID")
-        gl_codeids = sorted(set(gl.values_list("codeID", flat=True)))
+            report_type = form.cleaned_data["report_type"]
+        gl = code_update_exceptions(gl, ibm, report_type, cc)
 
         # Service priority checkboxes.
         nc_sp = NCServicePriority.objects.filter(fy=fy, categoryID__in=form.cleaned_data["ncChoice"]).order_by("servicePriorityNo")
@@ -336,10 +571,9 @@ class CodeUpdateAdminView(IbmsFormView):
         fm_sp = SFMServicePriority.objects.filter(fy=fy, categoryID__in=form.cleaned_data["fmChoice"]).order_by("servicePriorityNo")
 
         # Style & populate the workbook.
-        fpath = os.path.join(settings.STATIC_ROOT, "excel", "ibms_codeupdate_base.xls")
-        excel_template = open_workbook(fpath, formatting_info=True, on_demand=True)
-        workbook = copy_xl(excel_template)
-        code_update_report(excel_template, workbook, gl, gl_codeids, nc_sp, pvs_sp, fm_sp, ibm)
+        excel_template = get_excel_template(CODE_UPDATE_TEMPLATE)
+        workbook = excel_template.workbook()
+        code_update_report(excel_template, workbook, gl, nc_sp, pvs_sp, fm_sp, ibm)
 
         response = HttpResponse(content_type="application/vnd.ms-excel")
         response["Content-Disposition"] = "attachment; filename=ibms_exceptions.xls"
@@ -347,6 +581,193 @@ class CodeUpdateAdminView(IbmsFormView):
         return response
 
 
+class CodeUpdateBatchView(IbmsFormView):
+    """Superuser-only view to generate the code update workbook of every cost centre of a financial year (or of one
+    region/branch) in a background task, which produces a zip file of the workbooks for download.
+    """
+
+    template_name = "ibms/code_update_batch.html"
+    form_class = CodeUpdateBatchForm
+
+    def dispatch(self, request, *args, **kwargs):
+        if not request.user.is_superuser:
+            messages.error(self.request, "You do not have permission to use this function.")
+            return redirect("site_home")
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["page_title"] = f"{settings.SITE_ACRONYM} | Code update (batch)"
+        context["title"] = "CODE UPDATE (BATCH)"
+        context["report_jobs"] = ReportJob.objects.filter(report="code_update_batch").select_related("fy", "user")[0:10]
+        context["report_jobs_active"] = any(job.status in ReportJob.ACTIVE_STATUSES for job in context["report_jobs"])
+        return context
+
+    def get_success_url(self):
+        return reverse("ibms:code_update_batch")
+
+    def form_valid(self, form):
+        if not os.environ.get("AZURE_STORAGE_CONNECTION_STRING"):
+            messages.error(self.request, "Azure Storage is not configured. Please contact an administrator.")
+            return self.form_invalid(form)
+
+        parameters = {key: form.cleaned_data[key] for key in ("report_type", "region", "ncChoice", "pvsChoice", "fmChoice")}
+        job = ReportJob.objects.create(
+            user=self.request.user, fy=form.cleaned_data["financial_year"], report="code_update_batch", parameters=parameters
+        )
+        # The workbooks are generated, and the user is notified, by the task.
+        generate_code_update_batch.enqueue(job.pk)
+        messages.success(self.request, "Generating code update workbooks. Notification will be sent when the download is ready.")
+        return super().form_valid(form)
+
+
+class ReportJobDownloadView(LoginRequiredMixin, View):
+    """View to download a generated report (see ReportJob), streamed from blob storage. Available to the user who
+    requested the report, and to superusers.
+    """
+
+    def get(self, request, *args, **kwargs):
+        job = get_object_or_404(ReportJob, pk=kwargs["pk"])
+        if job.user != request.user and not request.user.is_superuser:
+            return HttpResponseForbidden("You do not have permission to use this function.")
+        if job.status != "complete" or not job.blob_name:
+            return HttpResponseBadRequest("The report is not available for download.")
+        blob_client = upload_blob_client(job.blob_name)
+        if not blob_client:
+            return HttpResponseBadRequest("Azure Storage is not configured.")
+
+        # Code update batches are zip files, and background downloads are gzip-compressed CSV files.
+        content_type = "application/gzip" if job.file_name.endswith(".gz") else "application/zip"
+        response = StreamingHttpResponse(blob_client.download_blob().chunks(), content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="{job.file_name}"'
+        return response
+
+
+class DataAmendmentReportView(IbmsFormView):
+    """Download the data amendment workbook of a cost centre or region/branch: one row per IBMData code having GL
+    pivot download records, with its total YTD actual and FY budget.
+    """
+
+    template_name = "ibms/data_amendment_report.html"
+    form_class = DataAmendmentForm
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs.update({"request": self.request})
+        return kwargs
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["page_title"] = f"{settings.SITE_ACRONYM} | Data amendment report"
+        context["title"] = "DATA AMENDMENT REPORT"
+        return context
+
+    def get_success_url(self):
+        return reverse("ibms:data_amendment_report")
+
+    def get_querysets(self, form):
+        """Return the GLPivDownload and IBMData querysets of the form filters, and the IBMData queryset of the
+        selected cost centre(s) (for the lookup values).
+        """
+        d = form.cleaned_data
+        fy = d["financial_year"]
+        gl = GLPivDownload.objects.filter(fy=fy)
+        ibm = IBMData.objects.filter(fy=fy)
+        ibm_filtered = ibm
+
+        if d["cost_centre"]:
+            gl = gl.filter(costCentre=d["cost_centre"])
+            ibm_filtered = ibm.filter(costCentre=d["cost_centre"])
+        elif d["region"]:
+            gl = gl.filter(regionBranch=d["region"])
+            # As regionBranch is a field on GLPivDownload, obtain the set of CC values for the region first.
+            ibm_filtered = ibm.filter(costCentre__in=set(gl.values_list("costCentre", flat=True)))
+
+        if d["service"]:
+            gl = gl.filter(service=d["service"])
+        if d["budget_area"]:
+            ibm = ibm.filter(budgetArea=d["budget_area"])
+        if d["project_sponsor"]:
+            ibm = ibm.filter(projectSponsor=d["project_sponsor"])
+        return gl, ibm, ibm_filtered
+
+    def get_service_priorities(self, form):
+        """Return lists of the selected service priorities, which are fetched once."""
+        fy = form.cleaned_data["financial_year"]
+        nc_sp = NCServicePriority.objects.filter(fy=fy, categoryID__in=form.cleaned_data["ncChoice"]).order_by("servicePriorityNo")
+        pvs_sp = PVSServicePriority.objects.filter(fy=fy, categoryID__in=form.cleaned_data["pvsChoice"]).order_by("servicePriorityNo")
+        fm_sp = SFMServicePriority.objects.filter(fy=fy, categoryID__in=form.cleaned_data["fmChoice"]).order_by("servicePriorityNo")
+        return list(nc_sp), list(pvs_sp), list(fm_sp)
+
+    def form_valid(self, form):
+        gl, ibm, ibm_filtered = self.get_querysets(form)
+        workbook = get_excel_template(DATA_AMEND_TEMPLATE).workbook()
+        data_amend_report(workbook, gl, ibm, *self.get_service_priorities(form), ibm_filtered)
+
+        response = HttpResponse(content_type="application/vnd.ms-excel")
+        response["Content-Disposition"] = "attachment; filename=ibms_data_amendment.xls"
+        workbook.save(response)  # Save the Excel workbook contents to the response.
+        return response
+
+
+class ServicePriorityReportView(DataAmendmentReportView):
+    """Download the service priority workbook of a cost centre or region/branch."""
+
+    form_class = ServicePriorityReportForm
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["page_title"] = f"{settings.SITE_ACRONYM} | Service priority report"
+        context["title"] = "SERVICE PRIORITY REPORT"
+        return context
+
+    def get_success_url(self):
+        return reverse("ibms:service_priority_report")
+
+    def form_valid(self, form):
+        gl, ibm, _ = self.get_querysets(form)
+        workbook = get_excel_template(SERVICE_PRIORITY_TEMPLATE).workbook()
+        service_priority_report(workbook, gl, ibm, *self.get_service_priorities(form))
+
+        response = HttpResponse(content_type="application/vnd.ms-excel")
+        response["Content-Disposition"] = "attachment; filename=ibms_service_priority.xls"
+        workbook.save(response)  # Save the Excel workbook contents to the response.
+        return response
+
+
+class ReloadReportView(DataAmendmentReportView):
+    """Download the IBM data reload workbook of a cost centre or region/branch (or, for superusers, of the whole
+    financial year).
+    """
+
+    form_class = ReloadReportForm
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["page_title"] = f"{settings.SITE_ACRONYM} | Reload report"
+        context["title"] = "RELOAD REPORT"
+        return context
+
+    def get_success_url(self):
+        return reverse("ibms:reload_report")
+
+    def form_valid(self, form):
+        gl, ibm, ibm_filtered = self.get_querysets(form)
+        # The IBMData rows of the selected cost centre(s), limited by the budget area and project sponsor filters.
+        ibm = (ibm & ibm_filtered).order_by("ibmIdentifier")
+        workbook = get_excel_template(RELOAD_TEMPLATE).workbook()
+        try:
+            reload_report(workbook, ibm, *self.get_service_priorities(form), gl)
+        except WorkbookRowLimitError as e:
+            form.add_error(None, f"{e}. Please select a cost centre or region/branch.")
+            return self.form_invalid(form)
+
+        response = HttpResponse(content_type="application/vnd.ms-excel")
+        response["Content-Disposition"] = "attachment; filename=ibms_reload.xls"
+        workbook.save(response)  # Save the Excel workbook contents to the response.
+        return response
+
+
 class JSONResponseMixin(object):
     """View mixin to return a JSON response to requests."""
 
@@ -369,6 +790,37 @@ class JSONResponseMixin(object):
         return json.dumps(context)
 
 
+class ImportJobJSON(LoginRequiredMixin, JSONResponseMixin, View):
+    """Superuser-only view to return the status and progress of recent CSV upload import jobs.
+    Polled by the upload page while any import is in progress.
+    """
+
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_superuser:
+            return HttpResponseForbidden("You do not have permission to use this function.")
+        jobs = []
+        for job in ImportJob.objects.select_related("fy", "user")[0:10]:
+            jobs.append(
+                {
+                    "id": job.pk,
+                    "blob_name": job.blob_name,
+                    "file_type": job.file_type,
+                    "fy": str(job.fy),
+                    "user": job.user.get_full_name() or job.user.username,
+                    "status": job.status,
+                    "status_display": job.get_status_display(),
+                    "active": job.status in ImportJob.ACTIVE_STATUSES,
+                    "rows_processed": job.rows_processed,
+                    "rows_committed": job.rows_committed,
+                    "rows_per_second": job.rows_per_second,
+                    "error": job.error,
+                    "metrics": job.metrics,
+                    "created": job.created.isoformat(),
+                }
+            )
+        return self.render_to_response({"jobs": jobs})
+
+
 class ServicePriorityMappingJSON(LoginRequiredMixin, JSONResponseMixin, BaseDetailView):
     """View to return a filtered list of mappings.
     Cannot use below as we require multiple fields without PKs
@@ -666,7 +1118,9 @@ class DataAmendmentUpdate(RevisionMixin, UpdateView):
         # Find any matching GLPivDownload records and set the FK link.
         for glpiv in GLPivDownload.objects.filter(fy=obj.fy, codeID=obj.ibmIdentifier, ibmdata__isnull=True):
             glpiv.save()
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        obj.fy.bump_data_version()
+        return response
 
 
 class CodeUpdateCreateView(LoginRequiredMixin, CreateView):
@@ -739,5 +1193,6 @@ class CodeUpdateCreateView(LoginRequiredMixin, CreateView):
         # Find any matching GLPivDownload records and set the FK link.
         for glpiv in GLPivDownload.objects.filter(fy=new_ibmdata.fy, codeID=new_ibmdata.ibmIdentifier, ibmdata__isnull=True):
             glpiv.save()
+        new_ibmdata.fy.bump_data_version()
 
         return redirect(self.object.get_absolute_url())
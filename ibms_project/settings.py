@@ -113,6 +113,15 @@ IBM_RELOAD_URI = env("IBM_RELOAD_URI", "")
 IBM_DATA_AMEND_URI = env("IBM_DATA_AMEND_URI", "")
 DATA_UPLOAD_MAX_NUMBER_FIELDS = None  # Required to allow end-of-month GLPivot bulk deletes.
 CSV_FILE_LIMIT = env("CSV_FILE_LIMIT", 100000000)  # 100MB
+CSV_IMPORT_BATCH_SIZE = env("CSV_IMPORT_BATCH_SIZE", 2000)  # Rows per bulk insert/update batch during CSV imports.
+CSV_READ_CHUNK_SIZE = env("CSV_READ_CHUNK_SIZE", 4194304)  # 4MB; bytes per read when streaming uploaded CSVs.
+DOWNLOAD_CHUNK_SIZE = env("DOWNLOAD_CHUNK_SIZE", 65536)  # 64KB; characters per chunk of CSV download responses.
+DOWNLOAD_GZIP_LEVEL = env("DOWNLOAD_GZIP_LEVEL", 6)  # Compression level (1-9) of gzip-compressed CSV download responses.
+DOWNLOAD_BACKGROUND_ROWS = env("DOWNLOAD_BACKGROUND_ROWS", 50000)  # CSV downloads of at least this many rows are generated by a task; 0 disables.
+# Parser engine for GL pivot download imports: "csv" (Python csv module) or "arrow" (requires the optional pyarrow package).
+CSV_PARSER_ENGINE = env("CSV_PARSER_ENGINE", "csv")
+IMPORT_JOB_STALE_MINUTES = env("IMPORT_JOB_STALE_MINUTES", 15)  # Minutes without progress before an import is considered interrupted.
+REPORT_WORKER_PROCESSES = env("REPORT_WORKER_PROCESSES", 4)  # Processes which render batch report workbooks; 1 renders in the task process.
 SHAREPOINT_IBMS = env("SHAREPOINT_IBMS", "")
 MAX_UPLOAD_SIZE = env("MAX_UPLOAD_SIZE", 100000000)  # 100MB
 AZURE_STORAGE_CONTAINER_NAME = env("AZURE_STORAGE_CONTAINER_NAME", "ibms")
@@ -15,3 +15,16 @@ if os.path.exists(dot_env):
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ibms_project.settings")
 application = get_wsgi_application()
+
+
+def load_report_templates():
+    """Parse the Excel report templates once at startup: with gunicorn's preload_app setting, this happens before the
+    worker processes are forked, so every worker shares the parsed templates.
+    """
+    # Imported once the application (and so the ibms app) has been loaded.
+    from ibms.excel import load_excel_templates
+
+    load_excel_templates()
+
+
+load_report_templates()
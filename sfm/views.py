@@ -1,5 +1,4 @@
 import json
-import os
 import tempfile
 from datetime import datetime
 
@@ -14,12 +13,12 @@ from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic.detail import BaseDetailView
 from django.views.generic.edit import FormView
-from openpyxl import load_workbook
 from sfm.forms import FMOutputReportForm, OutputEntryForm, OutputUploadForm
 from sfm.models import MeasurementType, MeasurementValue, Quarter, SFMMetric
 from sfm.report import outputs_report
 from sfm.utils import process_upload_file, validate_file
 
+from ibms.excel import get_excel_template
 from ibms.utils import get_download_period
 from ibms.views import JSONResponseMixin
 
@@ -129,8 +128,7 @@ class OutputReport(LoginRequiredMixin, FormView):
         spn = sorted(set(sfm.values_list("servicePriorityNo", flat=True)))
         # Current download period.
         dp = datetime.strftime(get_download_period(), "%d/%m/%Y")
-        fpath = os.path.join(settings.STATIC_ROOT, "excel", "fm_outputs.xlsx")
-        book = load_workbook(fpath)
+        book = get_excel_template("fm_outputs.xlsx").workbook()
 
         # Style & populate the worksheet.
         outputs_report(book, sfm, spn, dp, fy, qtr, cc)